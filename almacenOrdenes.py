@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""
+Este módulo almacena los PDF de las órdenes médicas generadas en la web, para su descarga.
+
+Cada orden se identifica con el id de su trabajo (el id de la consulta) y se guarda según
+ORDENES_ALMACEN:
+  - disco (por defecto): `<ORDENES_DIRECTORIO>/<ab>/<cd>/<id>.pdf`, en subdirectorios
+    repartidos por hash del id para que ningún directorio crezca sin límite. Cada archivo se
+    escribe en un temporal del mismo directorio y se renombra (escritura atómica: nunca se
+    descarga un PDF a medio escribir). Periódicamente se eliminan las órdenes más antiguas
+    que ORDENES_MAX_EDAD y, si el total supera ORDENES_MAX_BYTES, las más antiguas primero.
+  - memoria: los bytes en memoria del proceso, con los mismos límites de edad y tamaño.
+  - redis: los bytes en Redis con expiración ORDENES_MAX_EDAD, compartidos entre workers
+    (el tamaño lo acota la política de memoria de Redis). Si Redis no está disponible se
+    usa la memoria del proceso.
+En los modos memoria y redis, `/download` envía los bytes directamente, sin tocar el disco.
+
+Variables de entorno opcionales:
+  - ORDENES_ALMACEN: disco, memoria o redis.
+  - ORDENES_DIRECTORIO: directorio raíz de las órdenes en modo disco.
+  - ORDENES_MAX_BYTES: tamaño total máximo de las órdenes almacenadas.
+  - ORDENES_MAX_EDAD: segundos que se conserva una orden.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from redis.exceptions import RedisError
+
+import conexionRedis
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+ORDENES_ALMACEN = os.environ.get("ORDENES_ALMACEN", "disco").lower()
+"""Dónde se guardan las órdenes: 'disco', 'memoria' o 'redis'"""
+
+ALMACENES = ("disco", "memoria", "redis")
+
+ORDENES_DIRECTORIO = os.environ.get(
+    "ORDENES_DIRECTORIO", os.path.join(tempfile.gettempdir(), "ordenesMedicas")
+)
+"""Directorio raíz de las órdenes en modo disco"""
+
+ORDENES_MAX_BYTES = int(os.environ.get("ORDENES_MAX_BYTES", str(512 * 1024 * 1024)))
+"""Tamaño total máximo (bytes) de las órdenes en disco o en memoria"""
+
+ORDENES_MAX_EDAD = int(os.environ.get("ORDENES_MAX_EDAD", "86400"))
+"""Segundos que se conserva una orden"""
+
+INTERVALO_LIMPIEZA = 60
+"""Segundos mínimos entre dos limpiezas del directorio de órdenes"""
+
+EDAD_TEMPORALES = 3600
+"""Segundos tras los cuales se elimina un temporal huérfano (escritura interrumpida)"""
+
+PREFIJO_REDIS = "orden_pdf:"
+EXTENSION = ".pdf"
+EXTENSION_TEMPORAL = ".tmp"
+
+PATRON_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+"""Formato de los ids de orden (se usan como nombre de archivo)"""
+
+OrdenAlmacenada = namedtuple("OrdenAlmacenada", ["ruta", "contenido", "creada"])
+"""Orden almacenada: `ruta` del archivo (modo disco) o `contenido` en bytes, y fecha de creación"""
+
+logger = logging.getLogger(__name__)
+
+
+def _validar_id(orden_id):
+    if not orden_id or not PATRON_ID.match(orden_id):
+        raise ValueError(f"Id de orden no válido: '{orden_id}'.")
+
+
+# ----------------------------
+# Almacenamiento en disco
+# ----------------------------
+class AlmacenOrdenesDisco:
+    """Órdenes en archivos, en subdirectorios por hash del id, con limpieza por edad y tamaño."""
+
+    def __init__(self, raiz=ORDENES_DIRECTORIO, max_bytes=ORDENES_MAX_BYTES, max_edad=ORDENES_MAX_EDAD):
+        self.raiz = os.path.abspath(raiz)
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self._ultima_limpieza = 0.0
+        self._limpieza_lock = threading.Lock()
+
+    def ruta(self, orden_id):
+        """Ruta absoluta del PDF de la orden: `<raiz>/<ab>/<cd>/<id>.pdf`."""
+        _validar_id(orden_id)
+        resumen = hashlib.sha256(orden_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.raiz, resumen[:2], resumen[2:4], orden_id + EXTENSION)
+
+    def guardar(self, orden_id, contenido):
+        ruta = self.ruta(orden_id)
+        directorio = os.path.dirname(ruta)
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix=EXTENSION_TEMPORAL)
+        try:
+            with os.fdopen(descriptor, "wb") as archivo:
+                archivo.write(contenido)
+            os.replace(temporal, ruta)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except OSError:
+                pass
+            raise
+        self.limpiar_si_corresponde()
+
+    def directorio_temporal(self):
+        """Directorio de los temporales, en el mismo sistema de archivos que las órdenes."""
+        directorio = os.path.join(self.raiz, "tmp")
+        os.makedirs(directorio, exist_ok=True)
+        return directorio
+
+    def guardar_archivo(self, orden_id, temporal):
+        """Mueve a su lugar el PDF ya escrito en `temporal` (renombre atómico, sin copiar los bytes)."""
+        ruta = self.ruta(orden_id)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        os.replace(temporal, ruta)
+        self.limpiar_si_corresponde()
+
+    def obtener(self, orden_id):
+        ruta = self.ruta(orden_id)
+        try:
+            creada = os.stat(ruta).st_mtime
+        except OSError:
+            return None
+        if time.time() - creada > self.max_edad:
+            return None
+        return OrdenAlmacenada(ruta=ruta, contenido=None, creada=creada)
+
+    def limpiar_si_corresponde(self):
+        """Limpia el directorio si pasó INTERVALO_LIMPIEZA desde la última vez (un hilo a la vez)."""
+        if time.monotonic() - self._ultima_limpieza < INTERVALO_LIMPIEZA:
+            return
+        if not self._limpieza_lock.acquire(blocking=False):
+            return
+        try:
+            self._ultima_limpieza = time.monotonic()
+            self.limpiar()
+        finally:
+            self._limpieza_lock.release()
+
+    def limpiar(self):
+        """
+        Elimina las órdenes más antiguas que `max_edad`, los temporales huérfanos y, si el total
+        supera `max_bytes`, las órdenes más antiguas hasta quedar bajo el límite.
+        Retorna la cantidad de archivos eliminados.
+        """
+        ahora = time.time()
+        archivos = []
+        eliminados = 0
+        for directorio, _, nombres in os.walk(self.raiz):
+            for nombre in nombres:
+                ruta = os.path.join(directorio, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                edad = ahora - estado.st_mtime
+                vencido = (
+                    nombre.endswith(EXTENSION) and edad > self.max_edad
+                    or nombre.endswith(EXTENSION_TEMPORAL) and edad > EDAD_TEMPORALES
+                )
+                if vencido:
+                    eliminados += self._eliminar(ruta)
+                elif nombre.endswith(EXTENSION):
+                    archivos.append((estado.st_mtime, estado.st_size, ruta))
+
+        total = sum(tamano for _, tamano, _ in archivos)
+        if total > self.max_bytes:
+            archivos.sort()
+            for _, tamano, ruta in archivos:
+                if total <= self.max_bytes:
+                    break
+                eliminados += self._eliminar(ruta)
+                total -= tamano
+        if eliminados:
+            logger.info(f"Órdenes eliminadas del disco: {eliminados} (quedan {total} bytes).")
+        return eliminados
+
+    @staticmethod
+    def _eliminar(ruta):
+        try:
+            os.unlink(ruta)
+            return 1
+        except OSError:
+            return 0
+
+
+# ----------------------------
+# Almacenamiento en memoria y en Redis
+# ----------------------------
+class _AlmacenBytes:
+    """Base de los almacenamientos que guardan los bytes: el PDF se entrega en memoria con `guardar`."""
+
+    def directorio_temporal(self):
+        return None
+
+
+class AlmacenOrdenesMemoria(_AlmacenBytes):
+    """Órdenes en memoria del proceso; al superar `max_bytes` se descartan las más antiguas."""
+
+    def __init__(self, max_bytes=ORDENES_MAX_BYTES, max_edad=ORDENES_MAX_EDAD):
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.total_bytes = 0
+        self._ordenes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, orden_id, contenido, creada=None):
+        _validar_id(orden_id)
+        with self._lock:
+            anterior = self._ordenes.pop(orden_id, None)
+            if anterior is not None:
+                self.total_bytes -= len(anterior.contenido)
+            self._ordenes[orden_id] = OrdenAlmacenada(ruta=None, contenido=contenido, creada=creada or time.time())
+            self.total_bytes += len(contenido)
+            while self.total_bytes > self.max_bytes and len(self._ordenes) > 1:
+                _, descartada = self._ordenes.popitem(last=False)
+                self.total_bytes -= len(descartada.contenido)
+
+    def obtener(self, orden_id):
+        with self._lock:
+            orden = self._ordenes.get(orden_id)
+            if orden is None:
+                return None
+            if time.time() - orden.creada > self.max_edad:
+                del self._ordenes[orden_id]
+                self.total_bytes -= len(orden.contenido)
+                return None
+            return orden
+
+
+class AlmacenOrdenesRedis(_AlmacenBytes):
+    """
+    Órdenes en Redis (HASH `<PREFIJO_REDIS><id>` con el PDF y su fecha, con expiración),
+    compartidas entre workers. Mientras Redis no está disponible se usa la memoria del proceso.
+    """
+
+    def __init__(self, max_edad=ORDENES_MAX_EDAD):
+        self.max_edad = max_edad
+        self._respaldo = AlmacenOrdenesMemoria(max_edad=max_edad)
+
+    def guardar(self, orden_id, contenido):
+        _validar_id(orden_id)
+        creada = time.time()
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                clave = PREFIJO_REDIS + orden_id
+                pipe = redis_client.pipeline()
+                pipe.hset(clave, mapping={"pdf": contenido, "creada": creada})
+                pipe.expire(clave, self.max_edad)
+                pipe.execute()
+                conexionRedis.registrar_exito()
+                return
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+        self._respaldo.guardar(orden_id, contenido, creada)
+
+    def obtener(self, orden_id):
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                contenido, creada = redis_client.hmget(PREFIJO_REDIS + orden_id, ["pdf", "creada"])
+                conexionRedis.registrar_exito()
+                if contenido is not None:
+                    return OrdenAlmacenada(ruta=None, contenido=contenido, creada=float(creada or time.time()))
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+        return self._respaldo.obtener(orden_id)
+
+
+# ----------------------------
+# Almacenamiento del proceso
+# ----------------------------
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def crear_almacen(tipo=ORDENES_ALMACEN):
+    """Crea el almacenamiento de órdenes del tipo indicado ('disco', 'memoria' o 'redis')."""
+    if tipo == "disco":
+        return AlmacenOrdenesDisco()
+    if tipo == "memoria":
+        return AlmacenOrdenesMemoria()
+    if tipo == "redis":
+        return AlmacenOrdenesRedis()
+    raise ValueError(f"Almacenamiento de órdenes desconocido: '{tipo}'. Opciones: {', '.join(ALMACENES)}.")
+
+
+def obtener_almacen():
+    """Retorna el almacenamiento de órdenes del proceso, creándolo en el primer uso."""
+    global _almacen
+    if _almacen is None:
+        with _almacen_lock:
+            if _almacen is None:
+                _almacen = crear_almacen()
+    return _almacen
+
+
+def guardar(orden_id, contenido):
+    """Guarda el PDF (bytes) de la orden `orden_id`."""
+    obtener_almacen().guardar(orden_id, contenido)
+
+
+def directorio_temporal():
+    """
+    Directorio donde escribir un PDF antes de entregarlo con `guardar_archivo`, o None si el
+    almacenamiento guarda los bytes (memoria o Redis): entonces el PDF se entrega con `guardar`.
+    """
+    return obtener_almacen().directorio_temporal()
+
+
+def guardar_archivo(orden_id, temporal):
+    """Guarda como orden `orden_id` el PDF escrito en el archivo `temporal` (que se consume)."""
+    obtener_almacen().guardar_archivo(orden_id, temporal)
+
+
+def obtener(orden_id):
+    """Retorna la orden almacenada (`OrdenAlmacenada`), o None si no existe, expiró o el id no es válido."""
+    if not orden_id or not PATRON_ID.match(orden_id):
+        return None
+    return obtener_almacen().obtener(orden_id)
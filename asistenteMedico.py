@@ -3,6 +3,9 @@
 """Documentación del archivo del Asistente Médico"""
 
 # Librerías a importar
+import gatewayLLM
+import presupuestoTokens
+from modelosRespuesta import RecomendacionMedica, SALIDA_ESTRUCTURADA, formato_respuesta
 
 
 # Plantilla del prompt con inclusión de la base de conocimiento
@@ -31,38 +34,27 @@ Instrucciones para la respuesta:
 Nota: La información proporcionada es solo para fines de orientación y no debe considerarse como consejo médico definitivo.
 """
 
-def realizar_recomendacion_medica(client, datos_paciente_json, respuestas_adicionales_json, sintomas, base_conocimiento):
-    """Genera una recomendación médica utilizando los datos y respuestas proporcionadas."""
-    
-    # Convertir los datos a diccionarios (si ya vienen en memoria, se asume que es un dict)
-    datos_paciente = datos_paciente_json
-    respuestas_adicionales = respuestas_adicionales_json
+RESPUESTA_DEGRADADA = """### Conclusión
+En este momento no es posible generar una recomendación médica. Por favor, acuda a un centro asistencial para una evaluación presencial o intente nuevamente en unos minutos."""
+"""Recomendación entregada cuando el LLM no está disponible (modo degradado del gateway)"""
 
-    # Asegurarse de que `sintomas` contenga solo cadenas de texto
-    sintomas = [str(sintoma) for sintoma in sintomas]
 
-    # Procesar respuestas adicionales si es una lista de diccionarios
-    if isinstance(respuestas_adicionales, list) and respuestas_adicionales:
-        lista_respuestas = [
-            f"{r.get('pregunta', 'Sin pregunta')}: {r.get('respuesta', 'Sin respuesta')}"
-            for r in respuestas_adicionales if isinstance(r, dict)
-        ]
-        respuestas_texto = '; '.join(lista_respuestas)
-    else:
-        respuestas_texto = ''
+def parametros_salida():
+    """
+    Parámetros adicionales de la llamada: con salida estructurada, la respuesta se restringe
+    al esquema de `modelosRespuesta.RecomendacionMedica` (JSON en lugar de secciones markdown).
+    """
+    if SALIDA_ESTRUCTURADA:
+        return {"response_format": formato_respuesta(RecomendacionMedica)}
+    return {}
 
-    # Asegurarse de que base_conocimiento sea una cadena
-    base_conocimiento_texto = str(base_conocimiento) if base_conocimiento is not None else ''
 
+def realizar_recomendacion_medica(client, datos_paciente_json, respuestas_adicionales_json, sintomas, base_conocimiento):
+    """Genera una recomendación médica utilizando los datos y respuestas proporcionadas."""
+    
     # Crear el prompt utilizando los datos del paciente, respuestas adicionales y base de conocimiento
-    prompt = prompt_recomendacion_medica.format(
-        nombre=datos_paciente.get('nombre', 'Desconocido'),
-        edad=datos_paciente.get('edad', 'No especificado'),
-        sexo=datos_paciente.get('sexo', 'No especificado'),
-        peso=datos_paciente.get('peso', 'No especificado'),
-        sintomas=', '.join(sintomas),
-        respuestas=respuestas_texto,
-        base_conocimiento=base_conocimiento_texto
+    prompt = construir_prompt_recomendacion_web(
+        datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento
     )
 
     #print("Prompt generado:")
@@ -71,7 +63,9 @@ def realizar_recomendacion_medica(client, datos_paciente_json, respuestas_adicio
     # Preparar los mensajes para enviar al modelo
     messages = [{"role": "system", "content": prompt}]
 
-    response = client.chat.completions.create(
+    response = gatewayLLM.chat(
+        client,
+        degradada=RESPUESTA_DEGRADADA,
         model="gpt-4o-mini",
         messages=messages,
         temperature=0,
@@ -79,7 +73,8 @@ def realizar_recomendacion_medica(client, datos_paciente_json, respuestas_adicio
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-        stop=None
+        stop=None,
+        **parametros_salida()
     )
 
     reply = response.choices[0].message.content
@@ -94,12 +89,11 @@ def realizar_recomendacion_medica(client, datos_paciente_json, respuestas_adicio
 
 
 
-def realizar_recomendacion_medica_web(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento):
+def construir_prompt_recomendacion_web(datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento):
     """
-    Genera una recomendación médica utilizando los datos del paciente, las respuestas adicionales,
-    los síntomas y la base de conocimiento. Devuelve la respuesta generada que se mostrará como conclusión.
+    Construye el prompt de recomendación médica para el entorno web, ajustado al presupuesto
+    de tokens del asistente (se recorta primero la base de conocimiento y luego las respuestas).
     """
-    # Se reutiliza la lógica original, adaptando el prompt para el entorno web.
     # Asegurarse de que 'sintomas' sea una lista de strings.
     sintomas = [str(s) for s in sintomas]
 
@@ -114,14 +108,34 @@ def realizar_recomendacion_medica_web(client, datos_paciente_json, sintomas, res
 
     base_conocimiento_texto = str(base_conocimiento) if base_conocimiento is not None else ''
 
-    prompt = prompt_recomendacion_medica.format(
-        nombre=datos_paciente_json.get('nombre', 'Desconocido'),
-        edad=datos_paciente_json.get('edad', 'No especificado'),
-        sexo=datos_paciente_json.get('sexo', 'No especificado'),
-        peso=datos_paciente_json.get('peso', 'No especificado'),
-        sintomas=', '.join(sintomas),
-        respuestas=respuestas_texto,
-        base_conocimiento=base_conocimiento_texto
+    paciente = {
+        "nombre": datos_paciente_json.get('nombre', 'Desconocido'),
+        "edad": datos_paciente_json.get('edad', 'No especificado'),
+        "sexo": datos_paciente_json.get('sexo', 'No especificado'),
+        "peso": datos_paciente_json.get('peso', 'No especificado'),
+    }
+    secciones = presupuestoTokens.ajustar_secciones(
+        "asistente",
+        prompt_recomendacion_medica.format(**paciente, sintomas="", respuestas="", base_conocimiento=""),
+        {
+            "sintomas": ', '.join(sintomas),
+            "respuestas": respuestas_texto,
+            "base_conocimiento": base_conocimiento_texto,
+        },
+        ("base_conocimiento", "respuestas"),
+        presupuestoTokens.PRESUPUESTO_PROMPT_ASISTENTE,
+    )
+    return prompt_recomendacion_medica.format(**paciente, **secciones)
+
+
+def realizar_recomendacion_medica_web(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento):
+    """
+    Genera una recomendación médica utilizando los datos del paciente, las respuestas adicionales,
+    los síntomas y la base de conocimiento. Devuelve la respuesta generada que se mostrará como conclusión.
+    """
+    # Se reutiliza la lógica original, adaptando el prompt para el entorno web.
+    prompt = construir_prompt_recomendacion_web(
+        datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento
     )
 
     # Para depuración, se puede imprimir o loguear el prompt.
@@ -130,7 +144,9 @@ def realizar_recomendacion_medica_web(client, datos_paciente_json, sintomas, res
     #print(prompt)
     
     messages = [{"role": "system", "content": prompt}]
-    response = client.chat.completions.create(
+    response = gatewayLLM.chat(
+        client,
+        degradada=RESPUESTA_DEGRADADA,
         model="gpt-4o-mini",
         messages=messages,
         temperature=0,
@@ -138,7 +154,63 @@ def realizar_recomendacion_medica_web(client, datos_paciente_json, sintomas, res
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-        stop=None
+        stop=None,
+        **parametros_salida()
+    )
+    reply = response.choices[0].message.content
+    return reply
+
+
+async def realizar_recomendacion_medica_web_async(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento):
+    """
+    Versión asíncrona de `realizar_recomendacion_medica_web`, para usar con `openai.AsyncOpenAI`.
+    """
+    prompt = construir_prompt_recomendacion_web(
+        datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento
+    )
+
+    messages = [{"role": "system", "content": prompt}]
+    response = await gatewayLLM.chat_async(
+        client,
+        degradada=RESPUESTA_DEGRADADA,
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0,
+        max_tokens=1000,
+        top_p=0.95,
+        frequency_penalty=0,
+        presence_penalty=0,
+        stop=None,
+        **parametros_salida()
     )
     reply = response.choices[0].message.content
-    return reply
\ No newline at end of file
+    return reply
+
+
+def realizar_recomendacion_medica_web_stream(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento):
+    """
+    Versión en streaming de `realizar_recomendacion_medica_web`: es un generador que entrega
+    los fragmentos de texto de la recomendación a medida que el modelo los genera.
+    Los fragmentos se muestran al paciente a medida que llegan, por lo que esta versión usa
+    siempre el formato markdown (sin salida estructurada).
+    """
+    prompt = construir_prompt_recomendacion_web(
+        datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento
+    )
+
+    messages = [{"role": "system", "content": prompt}]
+    stream = gatewayLLM.chat_stream(
+        client,
+        degradada=RESPUESTA_DEGRADADA,
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0,
+        max_tokens=1000,
+        top_p=0.95,
+        frequency_penalty=0,
+        presence_penalty=0,
+        stop=None
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+Prueba de rendimiento local de la carga de la base de conocimiento (`data/PreparacionBaseDatos.py`)
+contra un servicio de embeddings simulado y un Redis en memoria (sin llamadas reales), para
+comparar el throughput (documentos/s y fragmentos/s) según el tamaño de lote y la concurrencia
+de las llamadas de embeddings, y el fragmentado secuencial frente al pool de procesos.
+
+El servicio simulado tiene una latencia fija por llamada más un costo por fragmento, y
+responde con error 429 (límite de tasa, con `Retry-After`) con la probabilidad indicada.
+
+Uso:
+    python benchmarks/ingestaBaseConocimiento.py [--documentos 500] [--latencia 0.1]
+        [--configuraciones 8x1 64x1 256x1 256x4 256x8]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "data"))
+
+import PreparacionBaseDatos  # noqa: E402
+
+
+class ErrorLimiteTasa(Exception):
+    """Imita el error 429 de la API de OpenAI, con encabezado `Retry-After`."""
+
+    status_code = 429
+
+    def __init__(self, espera):
+        super().__init__("Rate limit simulado")
+        self.response = SimpleNamespace(headers={"retry-after": str(espera)})
+
+
+class EmbeddingsSimulado:
+    """Cliente que imita `openai.OpenAI().embeddings` con latencia y límites de tasa simulados."""
+
+    def __init__(self, latencia, latencia_por_fragmento, tasa_limite, dimension=1536):
+        self.latencia = latencia
+        self.latencia_por_fragmento = latencia_por_fragmento
+        self.tasa_limite = tasa_limite
+        self.vector = [0.01] * dimension
+        self.llamadas = 0
+        self.limites = 0
+        self._lock = threading.Lock()
+        self.embeddings = SimpleNamespace(create=self._crear)
+
+    def _crear(self, input, model):
+        time.sleep(self.latencia + self.latencia_por_fragmento * len(input))
+        with self._lock:
+            self.llamadas += 1
+            if random.random() < self.tasa_limite:
+                self.limites += 1
+                raise ErrorLimiteTasa(self.latencia)
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=self.vector, index=i) for i in range(len(input))]
+        )
+
+
+class RedisSimulado:
+    """Redis en memoria con la interfaz mínima de pipeline que usa la carga."""
+
+    def __init__(self):
+        self.datos = {}
+
+    def pipeline(self, transaction=False):
+        return _PipelineSimulado(self)
+
+
+class _PipelineSimulado:
+    def __init__(self, redis_simulado):
+        self.redis = redis_simulado
+        self.comandos = []
+
+    def delete(self, clave):
+        self.comandos.append(("delete", clave, None))
+
+    def hset(self, clave, mapping):
+        self.comandos.append(("hset", clave, mapping))
+
+    def execute(self):
+        for comando, clave, mapping in self.comandos:
+            if comando == "delete":
+                self.redis.datos.pop(clave, None)
+            else:
+                self.redis.datos[clave] = mapping
+        self.comandos = []
+
+
+def generar_corpus(directorio, documentos, parrafos=12):
+    """Genera documentos sintéticos de ~3 fragmentos cada uno."""
+    palabras = ["fiebre", "tos", "dolor", "cabeza", "garganta", "reposo", "control", "examen"]
+    for i in range(documentos):
+        texto = "\n\n".join(
+            " ".join(random.choice(palabras) for _ in range(30)) for _ in range(parrafos)
+        )
+        with open(os.path.join(directorio, f"guia_{i:05d}.txt"), "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+
+
+def medir_fragmentado(directorio, procesos):
+    corpus = {nombre: None for nombre in PreparacionBaseDatos.listar_textos(directorio)}
+    inicio = time.perf_counter()
+    fragmentos = PreparacionBaseDatos.fragmentar_corpus(directorio, corpus, "doc:bench:", procesos)
+    return fragmentos, time.perf_counter() - inicio
+
+
+def medir_carga(fragmentos, lote, concurrencia, args):
+    cliente = EmbeddingsSimulado(args.latencia, args.latencia_por_fragmento, args.tasa_limite)
+    inicio = time.perf_counter()
+    PreparacionBaseDatos.aplicar_cambios(
+        RedisSimulado(), cliente, fragmentos, sorted(fragmentos), [],
+        lote=lote, concurrencia=concurrencia,
+    )
+    return time.perf_counter() - inicio, cliente
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de rendimiento de la carga de la base de conocimiento")
+    parser.add_argument("--documentos", type=int, default=500, help="Cantidad de documentos sintéticos")
+    parser.add_argument("--latencia", type=float, default=0.1, help="Latencia simulada por llamada (s)")
+    parser.add_argument("--latencia-por-fragmento", type=float, default=0.0002, help="Latencia adicional por fragmento (s)")
+    parser.add_argument("--tasa-limite", type=float, default=0.05, help="Probabilidad de respuesta 429 por llamada")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos para fragmentar")
+    parser.add_argument(
+        "--configuraciones", nargs="+", default=["8x1", "64x1", "256x1", "256x4", "256x8"],
+        help="Configuraciones LOTExCONCURRENCIA a medir",
+    )
+    args = parser.parse_args()
+
+    # Silenciar el progreso por consola del módulo durante la medición
+    PreparacionBaseDatos.print = lambda *a, **k: None
+
+    with tempfile.TemporaryDirectory() as directorio:
+        generar_corpus(directorio, args.documentos)
+
+        fragmentos, t_secuencial = medir_fragmentado(directorio, 1)
+        _, t_procesos = medir_fragmentado(directorio, args.procesos)
+        print(f"Corpus: {args.documentos} documentos, {len(fragmentos)} fragmentos")
+        print(f"Fragmentado secuencial: {len(fragmentos) / t_secuencial:,.0f} fragmentos/s")
+        print(f"Fragmentado con {args.procesos} procesos: {len(fragmentos) / t_procesos:,.0f} fragmentos/s")
+        print(f"Latencia simulada: {args.latencia}s por llamada, tasa de 429: {args.tasa_limite:.0%}")
+        print(f"{'lote x concurrencia':>20} | {'llamadas':>8} | {'429':>4} | {'documentos/s':>12} | {'fragmentos/s':>12}")
+        for configuracion in args.configuraciones:
+            lote, concurrencia = (int(valor) for valor in configuracion.lower().split("x"))
+            duracion, cliente = medir_carga(fragmentos, lote, concurrencia, args)
+            print(
+                f"{configuracion:>20} | {cliente.llamadas:>8} | {cliente.limites:>4} | "
+                f"{args.documentos / duracion:>12.1f} | {len(fragmentos) / duracion:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+Prueba de carga de `/resultado` contra servidores en ejecución, para comparar cómo escala la
+cantidad de consultas simultáneas en el modo síncrono (`python main.py --runserver`: flujo en
+hilos) y en el modo asíncrono (`python main.py --runserver --async`: flujo en el event loop
+del worker). Se mide el camino real de cada servidor: sesión, bloqueo por consulta, flujo
+de etapas, clientes compartidos y plantilla de resultado.
+
+Cada usuario virtual completa primero el formulario (registro, síntomas y preguntas) con su
+propia sesión y datos distintos, de modo que cada uno es una consulta nueva; luego todos piden
+`/resultado` a la vez y se mide el throughput y la latencia de esas solicitudes.
+
+Sin llamadas reales a OpenAI, el mismo script sirve una API compatible simulada con latencia
+fija (chat con salida estructurada, moderación y embeddings), a la que se apuntan los
+servidores con OPENAI_BASE_URL:
+
+    python benchmarks/pruebaCargaAsync.py --llm-simulado 9000 --latencia 0.5
+    OPENAI_BASE_URL=http://localhost:9000/v1 python main.py --runserver --port 8000
+    OPENAI_BASE_URL=http://localhost:9000/v1 python main.py --runserver --async --port 8001
+    python benchmarks/pruebaCargaAsync.py --urls http://localhost:8000 http://localhost:8001 --concurrencias 1 10 100
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+
+import httpx
+
+SINTOMAS = "fiebre, tos, dolor de garganta"
+
+PATRON_PREGUNTA = re.compile(r'name="(pregunta_\d+)"')
+
+# ----------------------------
+# API de OpenAI simulada
+# ----------------------------
+RESPUESTAS_ESTRUCTURADAS = {
+    "EvaluacionCoherencia": {"coherencia": 90, "razones": ["Síntomas consistentes"], "confianza": 0.9},
+    "PreguntasSeguimiento": {
+        "preguntas": ["¿Desde cuándo tiene fiebre?", "¿La tos es seca o con flema?", "¿Tiene dificultad para tragar?"]
+    },
+    "RecomendacionMedica": {
+        "analisis": "Cuadro respiratorio alto de pocos días de evolución.",
+        "diagnosticos": "Faringitis aguda.",
+        "recomendaciones": "Reposo, hidratación y paracetamol si hay fiebre.",
+        "examenes": [{"nombre": "Hemograma Completo"}],
+        "conclusion": "Control si los síntomas persisten más de 5 días.",
+    },
+    "EvaluacionSupervisor": {
+        "nivel_de_certeza": 80,
+        "sintesis_antecedentes": "Paciente adulto con fiebre y odinofagia.",
+        "diagnostico_o_recomendacion": "Faringitis aguda.",
+        "recomendaciones_adicionales": "",
+    },
+}
+
+
+def _contenido_chat(solicitud):
+    """Contenido según el esquema pedido (salida estructurada) o un texto breve."""
+    formato = solicitud.get("response_format") or {}
+    nombre = formato.get("json_schema", {}).get("name")
+    if nombre in RESPUESTAS_ESTRUCTURADAS:
+        return json.dumps(RESPUESTAS_ESTRUCTURADAS[nombre], ensure_ascii=False)
+    # Texto libre: código de prestación, coherencia o certeza sin esquema
+    return "90"
+
+
+def _respuesta_simulada(ruta, solicitud):
+    modelo = solicitud.get("model", "simulado")
+    if ruta.endswith("/chat/completions"):
+        return {
+            "id": "chatcmpl-simulado",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": modelo,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": _contenido_chat(solicitud)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 100, "total_tokens": 200},
+        }
+    if ruta.endswith("/moderations"):
+        return {
+            "id": "modr-simulado",
+            "model": modelo,
+            "results": [{"flagged": False, "categories": {"violence": False}, "category_scores": {"violence": 0.0}}],
+        }
+    if ruta.endswith("/embeddings"):
+        entradas = solicitud.get("input")
+        entradas = entradas if isinstance(entradas, list) else [entradas]
+        # Vectores aleatorios: consultas distintas no coinciden en la caché semántica
+        return {
+            "object": "list",
+            "model": modelo,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": [random.gauss(0, 1) for _ in range(1536)]}
+                for i in range(len(entradas))
+            ],
+            "usage": {"prompt_tokens": 10, "total_tokens": 10},
+        }
+    return None
+
+
+def crear_llm_simulado(latencia):
+    """Aplicación ASGI que responde como la API de OpenAI tras `latencia` segundos."""
+
+    async def aplicacion(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        cuerpo = b""
+        while True:
+            message = await receive()
+            cuerpo += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await asyncio.sleep(latencia)
+        respuesta = _respuesta_simulada(scope["path"], json.loads(cuerpo or b"{}"))
+        estado = 200 if respuesta is not None else 404
+        contenido = json.dumps(respuesta or {"error": {"message": "Ruta no simulada"}}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": estado,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": contenido})
+
+    return aplicacion
+
+
+def servir_llm_simulado(puerto, latencia):
+    import uvicorn
+
+    print(f"API de OpenAI simulada en http://localhost:{puerto}/v1 (latencia {latencia}s)")
+    uvicorn.run(crear_llm_simulado(latencia), host="127.0.0.1", port=puerto, log_level="warning")
+
+
+# ----------------------------
+# Usuarios virtuales
+# ----------------------------
+async def preparar_sesion(url, indice, timeout):
+    """Completa el formulario con datos propios y retorna el cliente HTTP con su sesión."""
+    cliente = httpx.AsyncClient(base_url=url, timeout=timeout)
+    datos = {
+        "nombre": "Paciente De Prueba",
+        "rut": f"{10000000 + indice}-{indice % 10}",
+        "sexo": "M",
+        "edad": str(20 + indice % 60),
+        "peso": "70",
+    }
+    await cliente.post("/", data=datos)
+    await cliente.post("/sintomas", data={"sintomas": SINTOMAS})
+    pagina = await cliente.get("/preguntas")
+    respuestas = {nombre: f"Hace {indice % 7 + 1} días" for nombre in PATRON_PREGUNTA.findall(pagina.text)}
+    await cliente.post("/preguntas", data=respuestas)
+    return cliente
+
+
+async def pedir_resultado(cliente):
+    """Pide `/resultado` y retorna (latencia, código HTTP)."""
+    inicio = time.perf_counter()
+    respuesta = await cliente.get("/resultado")
+    return time.perf_counter() - inicio, respuesta.status_code
+
+
+async def medir(url, concurrencia, desde, timeout):
+    """Prepara `concurrencia` sesiones y mide `/resultado` con todas las solicitudes a la vez."""
+    clientes = await asyncio.gather(
+        *[preparar_sesion(url, desde + i, timeout) for i in range(concurrencia)]
+    )
+    try:
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*[pedir_resultado(cliente) for cliente in clientes])
+        total = time.perf_counter() - inicio
+    finally:
+        await asyncio.gather(*[cliente.aclose() for cliente in clientes])
+    latencias = sorted(latencia for latencia, _ in resultados)
+    errores = sum(1 for _, codigo in resultados if codigo != 200)
+    p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+    return concurrencia / total, statistics.median(latencias), p95, errores
+
+
+async def prueba_carga(urls, concurrencias, timeout):
+    # Cada medición usa datos nuevos: ninguna consulta reutiliza un resultado guardado
+    desde = random.randrange(10**6)
+    print(f"{'servidor':>28} | {'concurrencia':>12} | {'consultas/s':>11} | {'p50 (s)':>8} | {'p95 (s)':>8} | {'errores':>7}")
+    for url in urls:
+        for concurrencia in concurrencias:
+            throughput, p50, p95, errores = await medir(url, concurrencia, desde, timeout)
+            desde += concurrencia
+            print(f"{url:>28} | {concurrencia:>12} | {throughput:>11.1f} | {p50:>8.2f} | {p95:>8.2f} | {errores:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de /resultado contra servidores en ejecución")
+    parser.add_argument("--urls", nargs="+", default=["http://localhost:8000"], help="Servidores a medir")
+    parser.add_argument("--concurrencias", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--timeout", type=float, default=300, help="Timeout por solicitud (s)")
+    parser.add_argument("--llm-simulado", type=int, metavar="PUERTO", help="Servir la API de OpenAI simulada en PUERTO")
+    parser.add_argument("--latencia", type=float, default=0.5, help="Latencia simulada por llamada (s)")
+    args = parser.parse_args()
+
+    if args.llm_simulado:
+        servir_llm_simulado(args.llm_simulado, args.latencia)
+    else:
+        asyncio.run(prueba_carga(args.urls, args.concurrencias, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmark de la diagramación de la orden médica en PDF (un núcleo, sin llamadas al LLM):
+compara las órdenes por segundo construyendo el documento completo en cada orden (logo
+decodificado de nuevo, como antes de la plantilla) y copiando el esqueleto cacheado (logo,
+título y etiquetas fijas de la primera página).
+Con --procesos N compara además N órdenes simultáneas en un pool de hilos (limitado por el
+GIL) y en el pool de procesos de `servicioRenderPdf` (PDF escrito en archivos temporales).
+
+Uso:
+    python benchmarks/renderOrdenPdf.py [--ordenes 10] [--procesos 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "clave-simulada")
+
+import generacionOrdenMedica  # noqa: E402
+import servicioRenderPdf  # noqa: E402
+
+DATOS = {"nombre": "Juan Pérez", "edad": "35", "peso": "80", "rut": "12.345.678-9"}
+SINTOMAS = ["Dolor abdominal", "fiebre"]
+RESPUESTAS = [
+    {"pregunta": "¿Ha presentado fiebre?", "respuesta": "Sí, moderada, desde hace dos días."},
+    {"pregunta": "¿Ha tenido tos?", "respuesta": "No."},
+    {"pregunta": "¿Sufre de alguna enfermedad crónica?", "respuesta": "No."},
+    {"pregunta": "¿Está tomando algún medicamento?", "respuesta": "Paracetamol cada 8 horas."},
+    {"pregunta": "¿Ha viajado recientemente?", "respuesta": "No."},
+]
+RECOMENDACION = {
+    "analisis": "Paciente de 35 años con dolor abdominal y fiebre moderada de dos días de evolución. " * 3,
+    "diagnosticos": "Gastroenteritis aguda; descartar apendicitis.",
+    "recomendaciones": "Reposo, hidratación oral y control de temperatura. Consultar si el dolor aumenta.",
+    "examenes": [{"nombre": "Hemograma Completo"}, {"nombre": "Proteína C Reactiva"}],
+    "conclusion": "Se recomienda seguimiento médico en caso de empeoramiento.",
+}
+
+
+def medir(ordenes):
+    """Órdenes por segundo: diagramación y bytes del PDF, como en la web."""
+    inicio = time.perf_counter()
+    for _ in range(ordenes):
+        pdf = generacionOrdenMedica.construir_orden_medica_pdf(DATOS, SINTOMAS, RESPUESTAS, RECOMENDACION)
+        generacionOrdenMedica.contenido_pdf(pdf)
+    return ordenes / (time.perf_counter() - inicio)
+
+
+def medir_concurrente(ordenes, procesos):
+    """Órdenes por segundo con `procesos` órdenes simultáneas, en hilos y en el pool de procesos."""
+    orden = generacionOrdenMedica.preparar_orden(DATOS, SINTOMAS, RESPUESTAS, RECOMENDACION)
+    with tempfile.TemporaryDirectory() as directorio, ThreadPoolExecutor(max_workers=procesos) as hilos:
+        def en_hilo(_):
+            ruta = servicioRenderPdf._renderizar(orden, directorio)
+            os.unlink(ruta)
+
+        def en_proceso(_):
+            os.unlink(servicioRenderPdf.renderizar(orden, directorio))
+
+        resultados = []
+        for tarea in (en_hilo, en_proceso):
+            inicio = time.perf_counter()
+            list(hilos.map(tarea, range(ordenes)))
+            resultados.append(ordenes / (time.perf_counter() - inicio))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de la orden médica en PDF")
+    parser.add_argument("--ordenes", type=int, default=10, help="Órdenes generadas por medición")
+    parser.add_argument("--procesos", type=int, default=0, help="Comparar hilos y procesos con N órdenes simultáneas")
+    args = parser.parse_args()
+
+    # Códigos de prestación fijos: sólo se mide la diagramación
+    generacionOrdenMedica.resolver_codigos_prestacion = lambda examenes: {
+        examen["nombre"]: "0301045" for examen in examenes
+    }
+
+    obtener_plantilla = generacionOrdenMedica.obtener_plantilla
+    generacionOrdenMedica.obtener_plantilla = generacionOrdenMedica.crear_plantilla
+    antes = medir(args.ordenes)
+    generacionOrdenMedica.obtener_plantilla = obtener_plantilla
+    obtener_plantilla()
+    despues = medir(args.ordenes)
+
+    print(f"{'modo':>22} | {'órdenes/s (1 núcleo)':>20}")
+    print(f"{'documento completo':>22} | {antes:>20.1f}")
+    print(f"{'plantilla cacheada':>22} | {despues:>20.1f}")
+    print(f"Mejora: {despues / antes:.0f}x")
+
+    if args.procesos > 0:
+        servicioRenderPdf.RENDER_PROCESOS = args.procesos
+        servicioRenderPdf.iniciar()
+        hilos, procesos = medir_concurrente(args.ordenes * args.procesos, args.procesos)
+        print(f"\n{'modo':>22} | {'órdenes/s':>20}  ({os.cpu_count()} núcleos)")
+        print(f"{f'{args.procesos} hilos':>22} | {hilos:>20.1f}")
+        print(f"{f'{args.procesos} procesos':>22} | {procesos:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Este módulo mantiene el event loop del proceso para el modo de servidor asíncrono.
+
+Flask es una aplicación WSGI: cada solicitud se atiende en un hilo. Ejecutar una corrutina
+desde ese hilo con `asyncio.run` o `app.ensure_sync` (asgiref `async_to_sync`) crea un event
+loop nuevo por solicitud y, con él, un cliente `AsyncOpenAI` y un pool `redis.asyncio` nuevos
+(ambos quedan ligados al loop donde se crean). En cambio, aquí se mantiene un único event loop
+de larga vida en un hilo propio: las solicitudes le envían su corrutina con `ejecutar` y
+esperan el resultado, de modo que la E/S de todas las consultas en curso del proceso se
+multiplexa en ese loop, con un solo cliente `AsyncOpenAI` y un solo pool `redis.asyncio`.
+
+El loop se crea en el primer uso (un proceso hijo creado con fork crea el suyo). Al detenerlo
+(`detener`, al apagar el servidor o al terminar el proceso) se cierran antes el cliente y el
+pool del loop (`cerrar_recursos`).
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+
+import conexionOpenAI
+import conexionRedis
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+ESPERA_CIERRE = 5
+"""Segundos máximos para cerrar los clientes y detener el loop"""
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_hilo = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def _ejecutar_loop(loop, listo):
+    asyncio.set_event_loop(loop)
+    loop.call_soon(listo.set)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def obtener_loop():
+    """Retorna el event loop del proceso, iniciando su hilo en el primer uso."""
+    global _loop, _hilo, _loop_pid
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                listo = threading.Event()
+                hilo = threading.Thread(
+                    target=_ejecutar_loop, args=(loop, listo), name="bucle-async", daemon=True
+                )
+                hilo.start()
+                listo.wait()
+                _loop, _hilo, _loop_pid = loop, hilo, os.getpid()
+                logger.info("Event loop del proceso iniciado.")
+    return _loop
+
+
+def ejecutar(corrutina):
+    """
+    Ejecuta la corrutina en el event loop del proceso y retorna su resultado, bloqueando
+    el hilo que llama (el hilo de la solicitud) hasta que termine.
+    """
+    loop = obtener_loop()
+    if threading.current_thread() is _hilo:
+        corrutina.close()
+        raise RuntimeError("`ejecutar` no puede llamarse desde el propio event loop; usar `await`.")
+    return asyncio.run_coroutine_threadsafe(corrutina, loop).result()
+
+
+async def cerrar_recursos():
+    """Cierra el cliente `AsyncOpenAI` y el pool `redis.asyncio` del event loop en curso."""
+    await conexionOpenAI.cerrar_cliente_async()
+    await conexionRedis.cerrar_pool_async()
+
+
+def detener():
+    """Cierra los clientes del event loop del proceso y lo detiene (si se inició en este proceso)."""
+    global _loop, _hilo, _loop_pid
+    with _loop_lock:
+        loop, hilo = _loop, _hilo
+        if loop is None or _loop_pid != os.getpid():
+            return
+        _loop = _hilo = _loop_pid = None
+    try:
+        asyncio.run_coroutine_threadsafe(cerrar_recursos(), loop).result(ESPERA_CIERRE)
+    except Exception as e:
+        logger.warning(f"No se pudieron cerrar los clientes del event loop: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    hilo.join(ESPERA_CIERRE)
+    logger.info("Event loop del proceso detenido.")
+
+
+atexit.register(detener)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+Este módulo mantiene la caché de embeddings de las consultas a la base de conocimiento.
+
+La clave es una forma canónica de los síntomas y de las respuestas adicionales (minúsculas,
+sin tildes ni puntuación, espacios colapsados, sin duplicados y en orden alfabético), de modo
+que casos repetidos o casi idénticos ("Fiebre, tos" y "tos,  fiebre") reutilizan el mismo
+embedding sin volver a llamar a la API de OpenAI.
+
+Los embeddings se guardan en una caché en memoria por proceso y, opcionalmente, en Redis
+(compartidos entre procesos y reinicios) como vectores float32.
+
+Variables de entorno opcionales:
+  - EMBEDDINGS_CACHE_MAX: cantidad máxima de embeddings en memoria.
+  - EMBEDDINGS_CACHE_POLITICA: política de descarte en memoria (lru, lfu o fifo).
+  - EMBEDDINGS_CACHE_TTL: segundos de vida de cada embedding.
+  - EMBEDDINGS_CACHE_REDIS: persistir también los embeddings en Redis (1) o no (0).
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from redis.exceptions import RedisError
+
+import conexionRedis
+from cacheMemoria import CacheMemoria
+from funcionesExtras import normalizar_texto
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+EMBEDDINGS_CACHE_MAX = int(os.environ.get("EMBEDDINGS_CACHE_MAX", "4096"))
+"""Cantidad máxima de embeddings en la caché en memoria (~6 KB cada uno)"""
+
+EMBEDDINGS_CACHE_POLITICA = os.environ.get("EMBEDDINGS_CACHE_POLITICA", "lru")
+"""Política de descarte de la caché en memoria"""
+
+EMBEDDINGS_CACHE_TTL = int(os.environ.get("EMBEDDINGS_CACHE_TTL", str(7 * 24 * 3600)))
+"""Segundos de vida de un embedding: 7 días"""
+
+EMBEDDINGS_CACHE_REDIS = os.environ.get("EMBEDDINGS_CACHE_REDIS", "0") == "1"
+"""Indica si los embeddings se persisten también en Redis"""
+
+PREFIJO = "cache_embeddings"
+"""Prefijo de las claves de la caché en Redis"""
+
+_memoria = CacheMemoria(
+    max_items=EMBEDDINGS_CACHE_MAX,
+    ttl=EMBEDDINGS_CACHE_TTL,
+    politica=EMBEDDINGS_CACHE_POLITICA,
+)
+
+# Aciertos y fallos del nivel Redis (sólo se consulta tras un fallo en memoria)
+aciertos_redis = 0
+fallos_redis = 0
+
+
+def clave_canonica(sintomas, respuestas_adicionales):
+    """
+    Retorna la clave de la consulta: hash de los síntomas y de los pares pregunta/respuesta
+    normalizados, sin duplicados y ordenados.
+    """
+    sintomas_normalizados = sorted({normalizar_texto(s) for s in sintomas if s})
+    respuestas_normalizadas = sorted(
+        {
+            f"{normalizar_texto(r.get('pregunta') or '')}={normalizar_texto(r.get('respuesta') or '')}"
+            for r in respuestas_adicionales or []
+            if isinstance(r, dict)
+        }
+    )
+    canonica = "|".join(sintomas_normalizados) + "||" + "|".join(respuestas_normalizadas)
+    return hashlib.sha256(canonica.encode("utf-8")).hexdigest()
+
+
+def _clave_redis(clave):
+    return f"{PREFIJO}:{clave}"
+
+
+def _desde_bytes(datos):
+    vector = np.frombuffer(datos, dtype=np.float32)
+    return vector if len(vector) else None
+
+
+def _como_vector(embedding):
+    vector = np.array(embedding, dtype=np.float32)
+    # Se comparte entre consultas: se protege contra modificaciones accidentales
+    vector.setflags(write=False)
+    return vector
+
+
+def _registrar_redis(acierto):
+    global aciertos_redis, fallos_redis
+    if acierto:
+        aciertos_redis += 1
+    else:
+        fallos_redis += 1
+
+
+def obtener(clave):
+    """Retorna el embedding almacenado (arreglo float32), o None si no está en la caché."""
+    vector = _memoria.obtener(clave)
+    if vector is not None or not EMBEDDINGS_CACHE_REDIS:
+        return vector
+
+    redis_client = conexionRedis.obtener_cliente()
+    if redis_client is None:
+        return None
+    try:
+        datos = redis_client.get(_clave_redis(clave))
+        conexionRedis.registrar_exito()
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+        return None
+
+    vector = _desde_bytes(datos) if datos else None
+    _registrar_redis(vector is not None)
+    if vector is not None:
+        _memoria.guardar(clave, vector)
+    return vector
+
+
+def guardar(clave, embedding):
+    """Almacena el embedding y lo retorna como arreglo float32 de sólo lectura."""
+    vector = _como_vector(embedding)
+    _memoria.guardar(clave, vector)
+    if EMBEDDINGS_CACHE_REDIS:
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                redis_client.set(_clave_redis(clave), vector.tobytes(), ex=EMBEDDINGS_CACHE_TTL)
+                conexionRedis.registrar_exito()
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+    return vector
+
+
+async def obtener_async(clave):
+    """Versión asíncrona de `obtener` (`redis.asyncio`)."""
+    vector = _memoria.obtener(clave)
+    if vector is not None or not EMBEDDINGS_CACHE_REDIS:
+        return vector
+
+    redis_client = conexionRedis.obtener_cliente_async()
+    if redis_client is None:
+        return None
+    try:
+        datos = await redis_client.get(_clave_redis(clave))
+        conexionRedis.registrar_exito()
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+        return None
+
+    vector = _desde_bytes(datos) if datos else None
+    _registrar_redis(vector is not None)
+    if vector is not None:
+        _memoria.guardar(clave, vector)
+    return vector
+
+
+async def guardar_async(clave, embedding):
+    """Versión asíncrona de `guardar` (`redis.asyncio`)."""
+    vector = _como_vector(embedding)
+    _memoria.guardar(clave, vector)
+    if EMBEDDINGS_CACHE_REDIS:
+        redis_client = conexionRedis.obtener_cliente_async()
+        if redis_client is not None:
+            try:
+                await redis_client.set(
+                    _clave_redis(clave), vector.tobytes(), ex=EMBEDDINGS_CACHE_TTL
+                )
+                conexionRedis.registrar_exito()
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+    return vector
+
+
+def estadisticas():
+    """
+    Retorna las métricas de la caché: las de la memoria del proceso, las del nivel Redis
+    y la tasa de aciertos combinada (consultas que no llamaron a la API de embeddings).
+    """
+    memoria = _memoria.estadisticas()
+    consultas = memoria["aciertos"] + memoria["fallos"]
+    aciertos_totales = memoria["aciertos"] + aciertos_redis
+    return {
+        "memoria": memoria,
+        "redis": {
+            "activa": EMBEDDINGS_CACHE_REDIS,
+            "aciertos": aciertos_redis,
+            "fallos": fallos_redis,
+        },
+        "tasa_aciertos": round(aciertos_totales / consultas, 4) if consultas else 0.0,
+    }
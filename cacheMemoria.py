@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene una caché en memoria, segura entre hilos, con expiración (TTL)
+y contadores de aciertos/fallos, para evitar repetir llamadas costosas dentro del proceso.
+
+Políticas de descarte disponibles al alcanzar el máximo de elementos:
+  - lru: se descarta el elemento usado hace más tiempo.
+  - lfu: se descarta el elemento menos usado (ante empate, el usado hace más tiempo).
+  - fifo: se descarta el elemento almacenado hace más tiempo.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+POLITICA_LRU = "lru"
+POLITICA_LFU = "lfu"
+POLITICA_FIFO = "fifo"
+POLITICAS = (POLITICA_LRU, POLITICA_LFU, POLITICA_FIFO)
+
+
+class CacheMemoria:
+    """
+    Caché en memoria con política de descarte configurable.
+
+    - max_items: cantidad máxima de elementos almacenados.
+    - ttl: segundos de vida de cada elemento (None = sin expiración).
+    - politica: 'lru', 'lfu' o 'fifo'.
+    """
+
+    def __init__(self, max_items=1024, ttl=None, politica=POLITICA_LRU):
+        politica = (politica or POLITICA_LRU).lower()
+        if politica not in POLITICAS:
+            raise ValueError(
+                f"Política de caché desconocida: '{politica}'. Opciones: {', '.join(POLITICAS)}."
+            )
+        self.max_items = max_items
+        self.ttl = ttl
+        self.politica = politica
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()
+        self._usos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, default=None):
+        """Retorna el valor almacenado para `clave`, o `default` si no existe o expiró."""
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is not None:
+                valor, expira = item
+                if expira is None or expira > time.monotonic():
+                    if self.politica != POLITICA_FIFO:
+                        self._datos.move_to_end(clave)
+                    self._usos[clave] += 1
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+                del self._usos[clave]
+            self.fallos += 1
+            return default
+
+    def guardar(self, clave, valor, ttl=None):
+        """Almacena `valor`; `ttl` permite sobrescribir la expiración por defecto."""
+        ttl = self.ttl if ttl is None else ttl
+        expira = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            nuevo = clave not in self._datos
+            if nuevo:
+                while len(self._datos) >= self.max_items:
+                    self._descartar()
+                self._usos[clave] = 0
+            self._datos[clave] = (valor, expira)
+            if nuevo or self.politica != POLITICA_FIFO:
+                self._datos.move_to_end(clave)
+
+    def _descartar(self):
+        """Descarta un elemento según la política (se llama con el lock tomado)."""
+        if self.politica == POLITICA_LFU:
+            # El primer mínimo en el orden de uso es, ante empate, el usado hace más tiempo
+            clave = min(self._datos, key=self._usos.__getitem__)
+            del self._datos[clave]
+        else:
+            clave, _ = self._datos.popitem(last=False)
+        del self._usos[clave]
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._usos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._usos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self):
+        """Retorna un diccionario con tamaño, aciertos, fallos y tasa de aciertos."""
+        total = self.aciertos + self.fallos
+        return {
+            "politica": self.politica,
+            "elementos": len(self._datos),
+            "max_elementos": self.max_items,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+        }
+
+
+class CacheLRU(CacheMemoria):
+    """Caché en memoria con política LRU (se descarta el elemento usado hace más tiempo)."""
+
+    def __init__(self, max_items=1024, ttl=None):
+        super().__init__(max_items=max_items, ttl=ttl, politica=POLITICA_LRU)
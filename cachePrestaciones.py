@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""
+Este módulo mantiene la caché de códigos de prestación de salud en Chile por examen.
+
+Los códigos se buscan por el nombre normalizado del examen (minúsculas, sin tildes ni
+espacios repetidos), primero en una caché LRU en memoria y luego en una base SQLite local
+persistente. Las respuestas obtenidas desde el LLM expiran según un TTL, mientras que los
+códigos conocidos cargados desde un CSV (por ejemplo, el arancel FONASA) no expiran.
+
+Variables de entorno opcionales:
+  - CACHE_PRESTACIONES_DB: ruta del archivo SQLite.
+  - CACHE_PRESTACIONES_TTL: segundos de vida de un código obtenido desde el LLM.
+  - CACHE_PRESTACIONES_CSV: CSV con columnas 'examen' y 'codigo' para poblar la caché al iniciar.
+
+Uso por consola para poblar la caché:
+    python cachePrestaciones.py codigos_fonasa.csv
+"""
+
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from cacheMemoria import CacheLRU
+from funcionesExtras import normalizar_texto
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+CACHE_PRESTACIONES_DB_DEFAULT = os.path.join("data", "cache_prestaciones.sqlite3")
+"""Ruta por defecto de la base SQLite de la caché"""
+
+CACHE_PRESTACIONES_TTL_DEFAULT = 30 * 24 * 3600
+"""TTL por defecto (segundos) de los códigos obtenidos desde el LLM: 30 días"""
+
+CACHE_PRESTACIONES_MAX_ITEMS = 2048
+"""Cantidad máxima de exámenes en la caché en memoria"""
+
+ORIGEN_LLM = "llm"
+ORIGEN_CSV = "csv"
+
+logger = logging.getLogger(__name__)
+
+
+class CachePrestaciones:
+    """Caché de dos niveles (memoria LRU + SQLite) de códigos de prestación por examen."""
+
+    def __init__(self, ruta_db, ttl=CACHE_PRESTACIONES_TTL_DEFAULT):
+        self.ttl = ttl
+        self.memoria = CacheLRU(max_items=CACHE_PRESTACIONES_MAX_ITEMS)
+        self._lock = threading.Lock()
+
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._db = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS prestaciones ("
+            " clave TEXT PRIMARY KEY,"
+            " nombre TEXT,"
+            " codigo TEXT NOT NULL,"
+            " origen TEXT NOT NULL,"
+            " expira REAL)"
+        )
+        self._db.commit()
+
+    def obtener(self, examen_nombre):
+        """Retorna el código almacenado para el examen, o None si no está o expiró."""
+        clave = normalizar_texto(examen_nombre)
+        codigo = self.memoria.obtener(clave)
+        if codigo is not None:
+            return codigo
+
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT codigo, expira FROM prestaciones WHERE clave = ?", (clave,)
+            ).fetchone()
+        if fila is None:
+            return None
+
+        codigo, expira = fila
+        if expira is not None and expira <= time.time():
+            return None
+        self.memoria.guardar(clave, codigo, ttl=self._ttl_restante(expira))
+        return codigo
+
+    def guardar(self, examen_nombre, codigo, origen=ORIGEN_LLM):
+        """Almacena el código del examen; sólo los códigos del LLM expiran."""
+        clave = normalizar_texto(examen_nombre)
+        expira = time.time() + self.ttl if origen == ORIGEN_LLM and self.ttl else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO prestaciones (clave, nombre, codigo, origen, expira)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (clave, examen_nombre, codigo, origen, expira),
+            )
+            self._db.commit()
+        self.memoria.guardar(clave, codigo, ttl=self._ttl_restante(expira))
+
+    def sembrar_desde_csv(self, ruta_csv):
+        """
+        Carga códigos conocidos desde un CSV con columnas 'examen' y 'codigo'.
+        Retorna la cantidad de exámenes cargados.
+        """
+        filas = []
+        with open(ruta_csv, newline="", encoding="utf-8-sig") as archivo:
+            for fila in csv.DictReader(archivo):
+                examen = (fila.get("examen") or "").strip()
+                codigo = (fila.get("codigo") or "").strip()
+                if examen and codigo:
+                    filas.append(
+                        (normalizar_texto(examen), examen, codigo, ORIGEN_CSV, None)
+                    )
+
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO prestaciones (clave, nombre, codigo, origen, expira)"
+                " VALUES (?, ?, ?, ?, ?)",
+                filas,
+            )
+            self._db.commit()
+        self.memoria.limpiar()
+        logger.info(f"Caché de prestaciones: {len(filas)} códigos cargados desde '{ruta_csv}'.")
+        return len(filas)
+
+    def _ttl_restante(self, expira):
+        if expira is None:
+            return None
+        return max(expira - time.time(), 1)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache():
+    """Retorna la caché compartida del proceso, creándola (y poblándola) en el primer uso."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = CachePrestaciones(
+                    os.environ.get("CACHE_PRESTACIONES_DB", CACHE_PRESTACIONES_DB_DEFAULT),
+                    ttl=int(
+                        os.environ.get(
+                            "CACHE_PRESTACIONES_TTL", CACHE_PRESTACIONES_TTL_DEFAULT
+                        )
+                    ),
+                )
+                ruta_csv = os.environ.get("CACHE_PRESTACIONES_CSV")
+                if ruta_csv and os.path.exists(ruta_csv):
+                    cache.sembrar_desde_csv(ruta_csv)
+                _cache = cache
+    return _cache
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python cachePrestaciones.py <archivo.csv con columnas examen,codigo>")
+        sys.exit(1)
+    cantidad = obtener_cache().sembrar_desde_csv(sys.argv[1])
+    print(f"{cantidad} códigos de prestación cargados en la caché.")
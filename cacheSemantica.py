@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene la caché semántica de respuestas del flujo de consulta.
+
+Antes de llamar al asistente y al supervisor médico, se busca en Redis una consulta ya
+respondida cuyo embedding (el mismo calculado para la búsqueda en la base de conocimiento)
+sea suficientemente similar al de la consulta actual. Las entradas se agrupan por tramo de
+edad, sexo y tramo de peso, de modo que sólo se comparan pacientes comparables; dentro del
+grupo se elige la de mayor similitud coseno, y sólo se usa si supera el umbral configurado.
+
+Estructura en Redis (prefijo `cache_semantica:`):
+  - `<prefijo>:<grupo>:entradas`: ZSET con los identificadores del grupo (score = fecha).
+  - `<prefijo>:<grupo>:<id>`: HASH con el vector y las respuestas, con expiración (TTL).
+  - `<prefijo>:metricas`: HASH con aciertos y fallos acumulados de todos los procesos.
+
+El nombre del paciente se reemplaza por un marcador al guardar (sólo como palabra completa,
+no dentro de otras palabras) y se restituye al leer, para no mostrar a un paciente el nombre
+de otro.
+
+Variables de entorno opcionales:
+  - CACHE_SEMANTICA: activa (1) o desactiva (0) la caché.
+  - CACHE_SEMANTICA_UMBRAL: similitud coseno mínima para considerar un acierto.
+  - CACHE_SEMANTICA_TTL: segundos de vida de cada entrada.
+  - CACHE_SEMANTICA_MAX_POR_GRUPO: cantidad máxima de entradas comparadas por grupo.
+"""
+
+import logging
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+from redis.exceptions import RedisError
+
+import conexionRedis
+import gatewayLLM
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+CACHE_SEMANTICA_ACTIVA = os.environ.get("CACHE_SEMANTICA", "1") == "1"
+"""Indica si se usa la caché semántica de respuestas"""
+
+CACHE_SEMANTICA_UMBRAL = float(os.environ.get("CACHE_SEMANTICA_UMBRAL", "0.97"))
+"""Similitud coseno mínima entre consultas para reutilizar una respuesta"""
+
+CACHE_SEMANTICA_TTL = int(os.environ.get("CACHE_SEMANTICA_TTL", str(24 * 3600)))
+"""Segundos de vida de una respuesta en la caché: 1 día"""
+
+CACHE_SEMANTICA_MAX_POR_GRUPO = int(os.environ.get("CACHE_SEMANTICA_MAX_POR_GRUPO", "200"))
+"""Cantidad máxima de respuestas almacenadas (y comparadas) por grupo de pacientes"""
+
+PREFIJO = "cache_semantica"
+"""Prefijo de las claves de la caché en Redis"""
+
+TRAMOS_EDAD = (2, 6, 12, 18, 30, 45, 60, 75)
+"""Límites (años) de los tramos de edad; los tramos pediátricos son más estrechos"""
+
+TRAMO_PESO = 10
+"""Ancho (kg) de los tramos de peso"""
+
+MARCADOR_NOMBRE = "{{nombre_paciente}}"
+"""Marcador que reemplaza el nombre del paciente en las respuestas almacenadas"""
+
+NOMBRE_LARGO_MINIMO = 3
+"""Largo mínimo del nombre para anonimizarlo; uno más corto coincidiría con palabras comunes"""
+
+logger = logging.getLogger(__name__)
+
+# Métricas del proceso; las globales se acumulan en Redis
+aciertos = 0
+fallos = 0
+
+
+def grupo_paciente(datos):
+    """
+    Retorna el identificador del grupo del paciente: tramo de edad, sexo y tramo de peso.
+    Ejemplo: edad 34, sexo 'M', peso 78 -> 'e30-s_m-p70'.
+    """
+    try:
+        edad = int(float(datos.get("edad", 0)))
+    except (TypeError, ValueError):
+        edad = -1
+    tramo_edad = max([0] + [limite for limite in TRAMOS_EDAD if edad >= limite])
+
+    try:
+        peso = float(datos.get("peso", 0))
+    except (TypeError, ValueError):
+        peso = -1
+    tramo_peso = int(peso // TRAMO_PESO * TRAMO_PESO) if peso >= 0 else -1
+
+    sexo = str(datos.get("sexo", "")).strip().lower() or "n"
+    return f"e{tramo_edad}-s_{sexo}-p{tramo_peso}"
+
+
+def _clave_entradas(grupo):
+    return f"{PREFIJO}:{grupo}:entradas"
+
+
+def _clave_entrada(grupo, entrada_id):
+    return f"{PREFIJO}:{grupo}:{entrada_id}"
+
+
+def _vector_normalizado(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else vector
+
+
+def _anonimizar(texto, nombre):
+    """Reemplaza el nombre por el marcador sólo donde aparece como palabra completa."""
+    nombre = nombre.strip() if isinstance(nombre, str) else ""
+    if len(nombre) >= NOMBRE_LARGO_MINIMO and isinstance(texto, str):
+        patron = rf"(?<!\w){re.escape(nombre)}(?!\w)"
+        return re.sub(patron, MARCADOR_NOMBRE, texto)
+    return texto
+
+
+def _personalizar(texto, nombre):
+    if isinstance(texto, str):
+        return texto.replace(MARCADOR_NOMBRE, nombre or "")
+    return texto
+
+
+def _mejor_coincidencia(identificadores, entradas, vector):
+    """
+    Retorna (similitud, entrada) de la entrada más similar al vector, y la lista de
+    identificadores cuyas entradas ya expiraron (para limpiarlos del grupo).
+    """
+    mejor, similitud_mejor, expirados = None, -1.0, []
+    for entrada_id, entrada in zip(identificadores, entradas):
+        if not entrada or b"vector" not in entrada:
+            expirados.append(entrada_id)
+            continue
+        similitud = float(np.dot(np.frombuffer(entrada[b"vector"], dtype=np.float32), vector))
+        if similitud > similitud_mejor:
+            mejor, similitud_mejor = entrada, similitud
+    return similitud_mejor, mejor, expirados
+
+
+def _resultado_acierto(entrada, datos):
+    nombre = datos.get("nombre", "")
+    return {
+        "respuesta_asistente_medico": _personalizar(
+            entrada[b"respuesta_asistente_medico"].decode("utf-8"), nombre
+        ),
+        "supervisor_response": _personalizar(
+            entrada[b"supervisor_response"].decode("utf-8"), nombre
+        ),
+    }
+
+
+def _registrar(acierto, similitud):
+    global aciertos, fallos
+    if acierto:
+        aciertos += 1
+        logger.debug(f"Caché semántica: acierto (similitud {similitud:.4f}).")
+    else:
+        fallos += 1
+    return "aciertos" if acierto else "fallos"
+
+
+def _campos_entrada(vector, datos, respuesta_asistente_medico, supervisor_response):
+    nombre = datos.get("nombre", "")
+    return {
+        "vector": vector.tobytes(),
+        "respuesta_asistente_medico": _anonimizar(respuesta_asistente_medico, nombre),
+        "supervisor_response": _anonimizar(supervisor_response, nombre),
+    }
+
+
+def _se_puede_usar(embedding):
+    return CACHE_SEMANTICA_ACTIVA and embedding is not None and len(embedding) > 0
+
+
+def buscar(datos, embedding):
+    """
+    Busca una respuesta almacenada para una consulta similar del mismo grupo de pacientes.
+    Retorna un diccionario con `respuesta_asistente_medico` y `supervisor_response`,
+    o None si no hay una coincidencia sobre el umbral (o Redis no está disponible).
+    """
+    if not _se_puede_usar(embedding):
+        return None
+    redis_client = conexionRedis.obtener_cliente()
+    if redis_client is None:
+        return None
+
+    grupo = grupo_paciente(datos)
+    vector = _vector_normalizado(embedding)
+    try:
+        identificadores = redis_client.zrange(_clave_entradas(grupo), 0, -1)
+        pipe = redis_client.pipeline(transaction=False)
+        for entrada_id in identificadores:
+            pipe.hgetall(_clave_entrada(grupo, entrada_id.decode("utf-8")))
+        entradas = pipe.execute() if identificadores else []
+
+        similitud, entrada, expirados = _mejor_coincidencia(identificadores, entradas, vector)
+        acierto = entrada is not None and similitud >= CACHE_SEMANTICA_UMBRAL
+
+        pipe = redis_client.pipeline(transaction=False)
+        if expirados:
+            pipe.zrem(_clave_entradas(grupo), *expirados)
+        pipe.hincrby(f"{PREFIJO}:metricas", _registrar(acierto, similitud), 1)
+        pipe.execute()
+        conexionRedis.registrar_exito()
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+        return None
+
+    return _resultado_acierto(entrada, datos) if acierto else None
+
+
+def guardar(datos, embedding, respuesta_asistente_medico, supervisor_response):
+    """
+    Almacena las respuestas del asistente y del supervisor para la consulta.
+    Las respuestas vacías o en modo degradado (LLM no disponible) no se almacenan.
+    Los errores de Redis se registran y se ignoran.
+    """
+    if not _se_puede_usar(embedding) or not respuesta_asistente_medico or not supervisor_response:
+        return
+    if gatewayLLM.es_degradada(respuesta_asistente_medico) or gatewayLLM.es_degradada(supervisor_response):
+        return
+    redis_client = conexionRedis.obtener_cliente()
+    if redis_client is None:
+        return
+
+    grupo = grupo_paciente(datos)
+    entrada_id = uuid.uuid4().hex
+    campos = _campos_entrada(
+        _vector_normalizado(embedding), datos, respuesta_asistente_medico, supervisor_response
+    )
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        _agregar_comandos_guardado(pipe, grupo, entrada_id, campos)
+        pipe.execute()
+        conexionRedis.registrar_exito()
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+
+
+def _agregar_comandos_guardado(pipe, grupo, entrada_id, campos):
+    """Agrega al pipeline el guardado de la entrada y la mantención del grupo."""
+    ahora = time.time()
+    clave_entradas = _clave_entradas(grupo)
+    pipe.hset(_clave_entrada(grupo, entrada_id), mapping=campos)
+    pipe.expire(_clave_entrada(grupo, entrada_id), CACHE_SEMANTICA_TTL)
+    pipe.zadd(clave_entradas, {entrada_id: ahora})
+    # Se descartan las entradas vencidas y las más antiguas sobre el máximo del grupo
+    pipe.zremrangebyscore(clave_entradas, 0, ahora - CACHE_SEMANTICA_TTL)
+    pipe.zremrangebyrank(clave_entradas, 0, -CACHE_SEMANTICA_MAX_POR_GRUPO - 1)
+    pipe.expire(clave_entradas, CACHE_SEMANTICA_TTL)
+
+
+async def buscar_async(datos, embedding):
+    """Versión asíncrona de `buscar` (`redis.asyncio`)."""
+    if not _se_puede_usar(embedding):
+        return None
+    redis_client = conexionRedis.obtener_cliente_async()
+    if redis_client is None:
+        return None
+
+    grupo = grupo_paciente(datos)
+    vector = _vector_normalizado(embedding)
+    try:
+        identificadores = await redis_client.zrange(_clave_entradas(grupo), 0, -1)
+        pipe = redis_client.pipeline(transaction=False)
+        for entrada_id in identificadores:
+            pipe.hgetall(_clave_entrada(grupo, entrada_id.decode("utf-8")))
+        entradas = await pipe.execute() if identificadores else []
+
+        similitud, entrada, expirados = _mejor_coincidencia(identificadores, entradas, vector)
+        acierto = entrada is not None and similitud >= CACHE_SEMANTICA_UMBRAL
+
+        pipe = redis_client.pipeline(transaction=False)
+        if expirados:
+            pipe.zrem(_clave_entradas(grupo), *expirados)
+        pipe.hincrby(f"{PREFIJO}:metricas", _registrar(acierto, similitud), 1)
+        await pipe.execute()
+        conexionRedis.registrar_exito()
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+        return None
+
+    return _resultado_acierto(entrada, datos) if acierto else None
+
+
+async def guardar_async(datos, embedding, respuesta_asistente_medico, supervisor_response):
+    """Versión asíncrona de `guardar` (`redis.asyncio`)."""
+    if not _se_puede_usar(embedding) or not respuesta_asistente_medico or not supervisor_response:
+        return
+    if gatewayLLM.es_degradada(respuesta_asistente_medico) or gatewayLLM.es_degradada(supervisor_response):
+        return
+    redis_client = conexionRedis.obtener_cliente_async()
+    if redis_client is None:
+        return
+
+    grupo = grupo_paciente(datos)
+    campos = _campos_entrada(
+        _vector_normalizado(embedding), datos, respuesta_asistente_medico, supervisor_response
+    )
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        _agregar_comandos_guardado(pipe, grupo, uuid.uuid4().hex, campos)
+        await pipe.execute()
+        conexionRedis.registrar_exito()
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+
+
+def estadisticas():
+    """
+    Retorna las métricas de la caché: aciertos y fallos de este proceso y, si Redis está
+    disponible, los acumulados de todos los procesos.
+    """
+    total = aciertos + fallos
+    resultado = {
+        "activa": CACHE_SEMANTICA_ACTIVA,
+        "umbral": CACHE_SEMANTICA_UMBRAL,
+        "aciertos": aciertos,
+        "fallos": fallos,
+        "tasa_aciertos": round(aciertos / total, 4) if total else 0.0,
+    }
+    redis_client = conexionRedis.obtener_cliente()
+    if redis_client is not None:
+        try:
+            metricas = redis_client.hgetall(f"{PREFIJO}:metricas")
+            aciertos_global = int(metricas.get(b"aciertos", 0))
+            fallos_global = int(metricas.get(b"fallos", 0))
+            total_global = aciertos_global + fallos_global
+            resultado["global"] = {
+                "aciertos": aciertos_global,
+                "fallos": fallos_global,
+                "tasa_aciertos": round(aciertos_global / total_global, 4)
+                if total_global
+                else 0.0,
+            }
+        except RedisError as e:
+            conexionRedis.registrar_fallo(e)
+    return resultado
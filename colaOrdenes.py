@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene la cola de trabajos para generar las órdenes médicas en PDF fuera de la
+solicitud web. `/resultado` encola la orden y responde de inmediato con un identificador de
+trabajo; `/download` espera (o consulta) su término.
+
+Los trabajos se ejecutan en un pool de hilos del propio proceso, dimensionado de forma
+independiente de los hilos web. El estado del trabajo sólo se conoce en el proceso que lo
+creó; el PDF terminado se guarda en `almacenOrdenes` con el mismo identificador.
+Cada hilo resuelve los códigos de prestación (E/S) y diagrama el PDF (CPU) en el propio hilo
+o, si se activa (RENDER_PROCESOS), en el pool de procesos de `servicioRenderPdf`, que lo
+escribe directamente en un archivo (en disco) o retorna sus bytes (en memoria o Redis).
+
+Variables de entorno opcionales:
+  - ORDENES_WORKERS: cantidad de órdenes generadas en paralelo.
+  - ORDENES_TTL: segundos que se recuerda un trabajo terminado.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import almacenOrdenes
+import generacionOrdenMedica
+import servicioRenderPdf
+from cacheMemoria import CacheLRU
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+ORDENES_WORKERS = int(os.environ.get("ORDENES_WORKERS", "4"))
+"""Cantidad de órdenes médicas generadas en paralelo"""
+
+ORDENES_TTL = int(os.environ.get("ORDENES_TTL", "3600"))
+"""Segundos que se recuerda un trabajo (para su descarga)"""
+
+ORDENES_MAX_TRABAJOS = 10000
+"""Cantidad máxima de trabajos recordados"""
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_LISTA = "lista"
+ESTADO_ERROR = "error"
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_trabajos = CacheLRU(max_items=ORDENES_MAX_TRABAJOS, ttl=ORDENES_TTL)
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=ORDENES_WORKERS, thread_name_prefix="ordenes"
+                )
+    return _pool
+
+
+def _generar_orden(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico, trabajo_id):
+    """Trabajo de la cola: prepara la orden en el hilo y la diagrama en el hilo o en el pool de procesos."""
+    if not servicioRenderPdf.activo():
+        return generacionOrdenMedica.generar_orden_medica_web(
+            openai_client,
+            datos_paciente,
+            sintomas,
+            respuestas_adicionales,
+            base_conocimiento,
+            respuesta_asistente_medico,
+            trabajo_id,
+        )
+    orden = generacionOrdenMedica.preparar_orden(
+        datos_paciente, sintomas, respuestas_adicionales, respuesta_asistente_medico
+    )
+    directorio = almacenOrdenes.directorio_temporal()
+    if directorio is None:
+        almacenOrdenes.guardar(trabajo_id, servicioRenderPdf.renderizar(orden))
+    else:
+        almacenOrdenes.guardar_archivo(trabajo_id, servicioRenderPdf.renderizar(orden, directorio))
+    return trabajo_id
+
+
+def encolar_orden(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico, trabajo_id=None):
+    """
+    Encola la generación de la orden médica y retorna el identificador del trabajo, que es
+    también el id de la orden en `almacenOrdenes`. Si no se indica `trabajo_id`, se genera uno nuevo.
+    """
+    trabajo_id = trabajo_id or uuid.uuid4().hex
+    futuro = _obtener_pool().submit(
+        _generar_orden,
+        openai_client,
+        datos_paciente,
+        sintomas,
+        respuestas_adicionales,
+        base_conocimiento,
+        respuesta_asistente_medico,
+        trabajo_id,
+    )
+    _trabajos.guardar(trabajo_id, futuro)
+    logger.debug(f"Orden médica encolada: {trabajo_id}")
+    return trabajo_id
+
+
+def estado_orden(trabajo_id):
+    """Retorna el estado del trabajo (pendiente, lista o error), o None si no existe."""
+    futuro = _trabajos.obtener(trabajo_id)
+    if futuro is None:
+        return None
+    if not futuro.done():
+        return ESTADO_PENDIENTE
+    return ESTADO_ERROR if futuro.exception() is not None else ESTADO_LISTA
+
+
+def esperar_orden(trabajo_id, timeout=None):
+    """
+    Espera a que termine el trabajo y retorna el id de la orden en `almacenOrdenes`.
+    Retorna None si el trabajo no existe o falló; lanza `TimeoutError` si no terminó a tiempo.
+    """
+    futuro = _trabajos.obtener(trabajo_id)
+    if futuro is None:
+        return None
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturesTimeoutError:
+        raise TimeoutError(f"La orden médica {trabajo_id} aún se está generando.")
+    except Exception as e:
+        logger.error(f"Error al generar la orden médica {trabajo_id}: {e}")
+        return None
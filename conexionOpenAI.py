@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+Este módulo entrega los clientes de OpenAI usados por los distintos módulos del flujo.
+
+Todas las etapas comparten un único cliente síncrono (`openai.OpenAI`) por proceso, creado
+de forma perezosa en el primer uso, con un pool de conexiones HTTP keep-alive de tamaño
+configurable: las llamadas reutilizan las conexiones abiertas (sin un nuevo handshake TLS
+por llamada) y el total de sockets hacia OpenAI queda acotado por proceso. Si el paquete
+`h2` está instalado, las conexiones usan HTTP/2 y varias llamadas comparten una conexión.
+
+Los clientes asíncronos (`openai.AsyncOpenAI`) mantienen conexiones ligadas al event loop
+donde se crean, por eso se reutiliza un cliente por cada event loop, con los mismos límites.
+En el servidor asíncrono hay un único loop por proceso (`bucleEventos`), que cierra su
+cliente con `cerrar_cliente_async` al detenerse.
+
+Variables de entorno opcionales:
+  - OPENAI_HTTP2: usar HTTP/2 si `h2` está instalado (1) o sólo HTTP/1.1 (0).
+  - OPENAI_POOL_MAX_CONEXIONES: conexiones máximas del pool (total de sockets hacia OpenAI).
+  - OPENAI_POOL_KEEPALIVE: conexiones inactivas que se mantienen abiertas.
+  - OPENAI_POOL_KEEPALIVE_EXPIRACION: segundos que se mantiene abierta una conexión inactiva.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+OPENAI_POOL_MAX_CONEXIONES_DEFAULT = 20
+"""Conexiones máximas por defecto del pool hacia OpenAI"""
+
+OPENAI_POOL_KEEPALIVE_DEFAULT = 10
+"""Conexiones inactivas que se mantienen abiertas por defecto"""
+
+OPENAI_POOL_KEEPALIVE_EXPIRACION_DEFAULT = 60.0
+"""Segundos por defecto que se mantiene abierta una conexión inactiva"""
+
+logger = logging.getLogger(__name__)
+
+_cliente = None
+_cliente_pid = None
+_cliente_lock = threading.Lock()
+
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+def usar_http2():
+    """Indica si se usa HTTP/2: activado por OPENAI_HTTP2 y con el paquete `h2` instalado."""
+    if os.environ.get("OPENAI_HTTP2", "1") != "1":
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def limites_pool():
+    """Límites del pool de conexiones HTTP (`httpx.Limits`) según el entorno."""
+    return httpx.Limits(
+        max_connections=int(os.environ.get("OPENAI_POOL_MAX_CONEXIONES", OPENAI_POOL_MAX_CONEXIONES_DEFAULT)),
+        max_keepalive_connections=int(os.environ.get("OPENAI_POOL_KEEPALIVE", OPENAI_POOL_KEEPALIVE_DEFAULT)),
+        keepalive_expiry=float(
+            os.environ.get("OPENAI_POOL_KEEPALIVE_EXPIRACION", OPENAI_POOL_KEEPALIVE_EXPIRACION_DEFAULT)
+        ),
+    )
+
+
+def _crear_cliente():
+    http2 = usar_http2()
+    limites = limites_pool()
+    logger.info(
+        f"Cliente OpenAI compartido: HTTP/{'2' if http2 else '1.1'}, "
+        f"máx. {limites.max_connections} conexiones ({limites.max_keepalive_connections} keep-alive)."
+    )
+    # Los clientes por defecto del SDK conservan sus timeouts y redirecciones
+    return OpenAI(http_client=DefaultHttpxClient(http2=http2, limits=limites))
+
+
+def obtener_cliente():
+    """
+    Retorna el cliente `OpenAI` compartido del proceso, creándolo en el primer uso.
+    Un proceso hijo (fork) crea su propio cliente, sin heredar las conexiones del padre.
+    """
+    global _cliente, _cliente_pid
+    if _cliente is None or _cliente_pid != os.getpid():
+        with _cliente_lock:
+            if _cliente is None or _cliente_pid != os.getpid():
+                _cliente = _crear_cliente()
+                _cliente_pid = os.getpid()
+    return _cliente
+
+
+def obtener_cliente_async():
+    """Retorna el cliente `AsyncOpenAI` del event loop en curso, creándolo en el primer uso."""
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None:
+        cliente = _clientes_async[loop] = AsyncOpenAI(
+            http_client=DefaultAsyncHttpxClient(http2=usar_http2(), limits=limites_pool())
+        )
+    return cliente
+
+
+async def cerrar_cliente_async():
+    """Cierra el cliente `AsyncOpenAI` del event loop en curso (y sus conexiones), si existe."""
+    cliente = _clientes_async.pop(asyncio.get_running_loop(), None)
+    if cliente is not None:
+        await cliente.close()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""
+Este módulo mantiene un único pool de conexiones a Redis, compartido por todo el proceso.
+
+El pool se crea de forma perezosa en el primer uso, es seguro entre hilos, verifica la salud
+de las conexiones y reintenta con backoff exponencial. Si Redis no está disponible, se aplica
+una espera creciente antes de volver a intentar, para no bloquear cada consulta del paciente.
+Sólo los errores de conexión o de timeout cuentan como caída; los errores de un comando
+(por ejemplo un índice inexistente o una consulta mal formada) no cambian la disponibilidad.
+Para el modo asíncrono existe además un pool `redis.asyncio` por cada event loop, que se
+cierra con `cerrar_pool_async` al terminar el loop.
+
+Variables de entorno opcionales:
+  - REDIS_MAX_CONNECTIONS: tamaño máximo del pool.
+  - REDIS_SOCKET_TIMEOUT / REDIS_CONNECT_TIMEOUT: timeouts en segundos.
+  - REDIS_HEALTH_CHECK_INTERVAL: segundos entre verificaciones de salud de una conexión.
+  - REDIS_RETRIES: reintentos por comando ante errores de conexión.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+import redis.asyncio
+import redis.asyncio.retry
+from dotenv import find_dotenv, load_dotenv
+from redis import ConnectionPool, Redis
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, RedisError, TimeoutError
+from redis.retry import Retry
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+REDIS_MAX_CONNECTIONS_DEFAULT = 20
+"""Tamaño máximo por defecto del pool de conexiones"""
+
+REDIS_SOCKET_TIMEOUT_DEFAULT = 5.0
+"""Timeout por defecto (segundos) para lectura/escritura en Redis"""
+
+REDIS_CONNECT_TIMEOUT_DEFAULT = 3.0
+"""Timeout por defecto (segundos) para establecer la conexión"""
+
+REDIS_HEALTH_CHECK_INTERVAL_DEFAULT = 30
+"""Intervalo por defecto (segundos) de verificación de salud de cada conexión"""
+
+REDIS_RETRIES_DEFAULT = 3
+"""Reintentos por defecto de un comando ante errores de conexión"""
+
+ESPERA_MAXIMA_RECONEXION = 60
+"""Espera máxima (segundos) antes de reintentar tras una caída de Redis"""
+
+ERRORES_CAIDA = (ConnectionError, TimeoutError)
+"""Errores de Redis que indican una caída (y no un error del comando)"""
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_entorno_cargado = False
+
+# Los pools asíncronos quedan ligados a un event loop, por eso hay uno por loop
+_pools_async = weakref.WeakKeyDictionary()
+
+# Estado de disponibilidad, para aplicar backoff entre caídas (compartido entre hilos)
+_fallos_consecutivos = 0
+_no_disponible_hasta = 0.0
+_estado_lock = threading.Lock()
+
+
+def _cargar_entorno():
+    """Carga el archivo '.env' una sola vez por proceso."""
+    global _entorno_cargado
+    if not _entorno_cargado:
+        if load_dotenv(find_dotenv(usecwd=True)):
+            logger.debug("Archivo '.env' cargado exitosamente.")
+        _entorno_cargado = True
+
+
+def _parametros_pool():
+    """URL y parámetros del pool, comunes a los clientes síncrono y asíncrono."""
+    _cargar_entorno()
+
+    redis_host = os.environ.get("REDIS_HOST")
+    redis_port = os.environ.get("REDIS_PORT")
+    redis_db = os.environ.get("REDIS_DB")
+    redis_password = os.environ.get("REDIS_PASSWORD")
+    redis_username = os.environ.get("REDIS_USERNAME")
+
+    redis_url = f"redis://{redis_username}:{redis_password}@{redis_host}:{redis_port}/{redis_db}"
+
+    parametros = {
+        "max_connections": int(
+            os.environ.get("REDIS_MAX_CONNECTIONS", REDIS_MAX_CONNECTIONS_DEFAULT)
+        ),
+        "socket_timeout": float(
+            os.environ.get("REDIS_SOCKET_TIMEOUT", REDIS_SOCKET_TIMEOUT_DEFAULT)
+        ),
+        "socket_connect_timeout": float(
+            os.environ.get("REDIS_CONNECT_TIMEOUT", REDIS_CONNECT_TIMEOUT_DEFAULT)
+        ),
+        "health_check_interval": int(
+            os.environ.get(
+                "REDIS_HEALTH_CHECK_INTERVAL", REDIS_HEALTH_CHECK_INTERVAL_DEFAULT
+            )
+        ),
+        "retry_on_error": [ConnectionError, TimeoutError],
+    }
+    return redis_url, parametros
+
+
+def _reintentos():
+    return int(os.environ.get("REDIS_RETRIES", REDIS_RETRIES_DEFAULT))
+
+
+def _crear_pool():
+    redis_url, parametros = _parametros_pool()
+    return ConnectionPool.from_url(
+        redis_url,
+        retry=Retry(ExponentialBackoff(cap=2, base=0.05), _reintentos()),
+        **parametros,
+    )
+
+
+def _crear_pool_async():
+    redis_url, parametros = _parametros_pool()
+    return redis.asyncio.ConnectionPool.from_url(
+        redis_url,
+        retry=redis.asyncio.retry.Retry(
+            ExponentialBackoff(cap=2, base=0.05), _reintentos()
+        ),
+        **parametros,
+    )
+
+
+def obtener_pool():
+    """Retorna el pool compartido, creándolo en el primer uso."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _crear_pool()
+    return _pool
+
+
+def obtener_cliente():
+    """
+    Retorna un cliente Redis que usa el pool compartido, o None si Redis está
+    marcado como no disponible (dentro de la ventana de backoff tras una caída).
+    Crear el cliente no abre conexiones: éstas se toman del pool al ejecutar comandos.
+    """
+    if time.monotonic() < _no_disponible_hasta:
+        return None
+    try:
+        return Redis(connection_pool=obtener_pool())
+    except Exception as e:
+        # Configuración inválida o incompleta: se trata igual que una caída
+        registrar_fallo(e)
+        return None
+
+
+def obtener_cliente_async():
+    """
+    Versión asíncrona de `obtener_cliente`: retorna un cliente `redis.asyncio.Redis`
+    que usa el pool del event loop en curso, o None si Redis no está disponible.
+    """
+    if time.monotonic() < _no_disponible_hasta:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+        pool = _pools_async.get(loop)
+        if pool is None:
+            pool = _pools_async[loop] = _crear_pool_async()
+        return redis.asyncio.Redis(connection_pool=pool)
+    except Exception as e:
+        registrar_fallo(e)
+        return None
+
+
+async def cerrar_pool_async():
+    """Cierra el pool `redis.asyncio` del event loop en curso (y sus conexiones), si existe."""
+    pool = _pools_async.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.aclose()
+
+
+def obtener_indice():
+    """Nombre del índice de búsqueda vectorial configurado en el entorno."""
+    _cargar_entorno()
+    return os.environ.get("REDIS_INDEX")
+
+
+def es_caida(error):
+    """
+    Indica si el error corresponde a una caída de Redis: errores de conexión o timeout, o
+    errores ajenos a Redis (configuración inválida). Los demás `RedisError` son del comando.
+    """
+    return isinstance(error, ERRORES_CAIDA) or not isinstance(error, RedisError)
+
+
+def registrar_exito():
+    """Reinicia el contador de caídas tras un comando exitoso."""
+    global _fallos_consecutivos, _no_disponible_hasta
+    if not _fallos_consecutivos:
+        return
+    with _estado_lock:
+        if _fallos_consecutivos:
+            logger.info("Conexión a Redis restablecida.")
+        _fallos_consecutivos = 0
+        _no_disponible_hasta = 0.0
+
+
+def registrar_fallo(error):
+    """
+    Registra un error de Redis. Si es una caída (`es_caida`), calcula la siguiente ventana de
+    espera (backoff exponencial, acotado por ESPERA_MAXIMA_RECONEXION); un error del comando
+    sólo se registra en el log, sin marcar Redis como no disponible.
+    """
+    global _fallos_consecutivos, _no_disponible_hasta
+    if not es_caida(error):
+        logger.error(f"Error en un comando de Redis (la conexión sigue disponible): {error}")
+        return
+    with _estado_lock:
+        _fallos_consecutivos += 1
+        fallos = _fallos_consecutivos
+        espera = min(ESPERA_MAXIMA_RECONEXION, 2 ** (fallos - 1))
+        _no_disponible_hasta = time.monotonic() + espera
+    logger.error(
+        f"Error en la conexión a Redis ({fallos} fallos seguidos), "
+        f"se reintentará en {espera}s: {error}"
+    )
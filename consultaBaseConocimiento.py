@@ -2,103 +2,456 @@
 
 """
 Este módulo contiene las funciones y componentes necesarios para conexión con Redis y obtener información de la base de conocimiento.
+
+El backend de búsqueda se selecciona con la variable de entorno RAG_BACKEND:
+  - redis (por defecto): búsqueda KNN en RediSearch.
+  - local: índice vectorial en memoria (`indiceVectorialLocal`), sin Redis.
+
+La búsqueda es híbrida: primero se buscan léxicamente los síntomas en la tabla estructurada
+(`indiceSintomas`); si el resultado es concluyente se omiten el embedding de la consulta (salvo
+que ya esté en `cacheEmbeddings` o RAG_EMBEDDING_CONCLUYENTE=1) y la búsqueda KNN. Si no, se
+obtienen RAG_TOP_K candidatos en una sola consulta KNN y se fusionan ambos rankings con Reciprocal Rank Fusion (RRF).
+Los mejores documentos se empaquetan en el contexto hasta RAG_PRESUPUESTO_TOKENS tokens.
 """
 
 import os
 
 import numpy as np
-from dotenv import find_dotenv, load_dotenv
-from redis import Redis
 from redis.commands.search.query import Query
+from redis.exceptions import RedisError
 from rich import print, traceback
 
+import cacheEmbeddings
+import conexionRedis
+import gatewayLLM
+import indiceSintomas
+import indiceVectorialLocal
+import presupuestoTokens
+
 # Activa traceback para mejorar la depuración de excepciones
 traceback.install()
 
 # Constantes de Redis
 VECTOR_FIELD_NAME = "content_vector"
 
+MENSAJE_SIN_COINCIDENCIAS = "No se encontraron coincidencias en la base de datos."
+"""Contenido retornado cuando la búsqueda no encuentra documentos"""
+
+MENSAJE_BASE_NO_DISPONIBLE = "La base de conocimiento no está disponible en este momento."
+"""Contenido retornado (respuesta degradada) cuando Redis no está disponible"""
+
+RAG_BACKEND_REDIS = "redis"
+RAG_BACKEND_LOCAL = "local"
+
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "3"))
+"""Cantidad de documentos candidatos obtenidos en la búsqueda KNN"""
+
+RAG_PRESUPUESTO_TOKENS = int(os.environ.get("RAG_PRESUPUESTO_TOKENS", "800"))
+"""Cantidad máxima de tokens de la base de conocimiento incluida en los prompts"""
+
+RAG_PESO_VECTORIAL = float(os.environ.get("RAG_PESO_VECTORIAL", "0.5"))
+"""Peso del ranking vectorial frente al léxico en la fusión (0 a 1)"""
+
+RAG_HIBRIDO = os.environ.get("RAG_HIBRIDO", "1") == "1"
+"""Indica si se usa la búsqueda léxica (y se omite la búsqueda KNN cuando es concluyente)"""
+
+RAG_EMBEDDING_CONCLUYENTE = os.environ.get("RAG_EMBEDDING_CONCLUYENTE", "0") == "1"
+"""Indica si se calcula el embedding aunque la búsqueda léxica sea concluyente (sólo para la caché semántica)"""
+
+RAG_RRF_K = 60
+"""Constante de Reciprocal Rank Fusion: atenúa la diferencia entre las primeras posiciones"""
+
+SEPARADOR_DOCUMENTOS = "\n\n---\n\n"
+"""Separador entre documentos del contexto empaquetado"""
+
+
+def backend_rag():
+    """Backend de búsqueda configurado en el entorno (RAG_BACKEND)."""
+    return os.environ.get("RAG_BACKEND", RAG_BACKEND_REDIS).strip().lower()
+
 
 def conexion():
-    if load_dotenv(find_dotenv(usecwd=True)):
-        print("[bold green]Archivo '.env' cargado exitosamente.[/bold green]")
-
-    # Configuración de OpenAI y Redis usando variables de entorno
-    redis_host = os.environ.get("REDIS_HOST")
-    redis_port = os.environ.get("REDIS_PORT")
-    redis_db = os.environ.get("REDIS_DB")
-    redis_password = os.environ.get("REDIS_PASSWORD")
-    redis_username = os.environ.get("REDIS_USERNAME")
-    redis_index = os.environ.get("REDIS_INDEX")
-
-    # Conexión única a Redis
-    redis_url = f"redis://{redis_username}:{redis_password}@{redis_host}:{redis_port}/{redis_db}"
-    redis_client = Redis.from_url(redis_url)
-
-    # Verificación de conexión a Redis
-    try:
-        redis_client.ping()
-        print("✅ Conexión a Redis exitosa.")
-    except Exception as e:
-        print("❌ Error en la conexión a Redis:", str(e))
-        exit(1)
+    """
+    Retorna el cliente Redis del pool compartido y el nombre del índice.
+    El cliente es None si Redis está temporalmente no disponible.
+    """
+    return conexionRedis.obtener_cliente(), conexionRedis.obtener_indice()
 
-    return redis_client, redis_index
 
+def construir_consulta_knn(embedding_vector, top_k=1):
+    """Construye la consulta KNN de Redis y sus parámetros a partir del embedding."""
+    embedded_query = np.array(embedding_vector, dtype=np.float32).tobytes()
 
-def find_vector_in_redis(query, client, redis_client, redis_index):
-    try:
-        top_k = 1
+    q = (
+        Query(f"*=>[KNN {top_k} @{VECTOR_FIELD_NAME} $vec_param AS vector_score]")
+        .sort_by("vector_score")
+        .paging(0, top_k)
+        .return_fields("filename", "text_chunk", "text_chunk_index", "content")
+        .dialect(2)
+    )
+    params_dict = {"vec_param": embedded_query}
+    return q, params_dict
 
+
+def crear_embedding(client, query):
+    """Retorna el embedding de la consulta, o None si no se pudo calcular."""
+    try:
         # Crear el embedding con la API actualizada
-        response = client.embeddings.create(
+        response = gatewayLLM.embeddings(
+            client,
             input=[query],  # OpenAI espera una lista
             model="text-embedding-ada-002"
         )
+        return response.data[0].embedding
+    except Exception as e:
+        print("❌ Error al calcular el embedding:", str(e))
+        return None
 
-        # Obtener el embedding vectorizado
-        embedding_vector = response.data[0].embedding
-        embedded_query = np.array(embedding_vector, dtype=np.float32).tobytes()
-
-        # Construcción de la consulta KNN en Redis
-        q = (
-            Query(f"*=>[KNN {top_k} @{VECTOR_FIELD_NAME} $vec_param AS vector_score]")
-            .sort_by("vector_score")
-            .paging(0, top_k)
-            .return_fields("filename", "text_chunk", "text_chunk_index", "content")
-            .dialect(2)
+
+async def crear_embedding_async(client_async, query):
+    """Versión asíncrona de `crear_embedding` (`openai.AsyncOpenAI`)."""
+    try:
+        response = await gatewayLLM.embeddings_async(
+            client_async,
+            input=[query],
+            model="text-embedding-ada-002"
         )
-        params_dict = {"vec_param": embedded_query}
+        return response.data[0].embedding
+    except Exception as e:
+        print("❌ Error al calcular el embedding:", str(e))
+        return None
+
+
+def crear_embedding_consulta(client, sintomas, respuestas_adicionales, query):
+    """
+    Retorna el embedding de la consulta, reutilizando el de una consulta con los mismos
+    síntomas y respuestas normalizados (`cacheEmbeddings`). Retorna None si no se pudo calcular.
+    """
+    clave = cacheEmbeddings.clave_canonica(sintomas, respuestas_adicionales)
+    embedding = cacheEmbeddings.obtener(clave)
+    if embedding is None:
+        embedding = crear_embedding(client, query)
+        if embedding is not None:
+            embedding = cacheEmbeddings.guardar(clave, embedding)
+    return embedding
+
+
+async def crear_embedding_consulta_async(client_async, sintomas, respuestas_adicionales, query):
+    """Versión asíncrona de `crear_embedding_consulta`."""
+    clave = cacheEmbeddings.clave_canonica(sintomas, respuestas_adicionales)
+    embedding = await cacheEmbeddings.obtener_async(clave)
+    if embedding is None:
+        embedding = await crear_embedding_async(client_async, query)
+        if embedding is not None:
+            embedding = await cacheEmbeddings.guardar_async(clave, embedding)
+    return embedding
+
+
+def embedding_concluyente(client, sintomas, respuestas_adicionales, query):
+    """
+    Embedding de una consulta cuyo resultado léxico es concluyente: no hace falta para la
+    búsqueda, así que sólo se reutiliza el de `cacheEmbeddings` (se calcula únicamente con
+    RAG_EMBEDDING_CONCLUYENTE=1). Retorna None si no está disponible.
+    """
+    if RAG_EMBEDDING_CONCLUYENTE:
+        return crear_embedding_consulta(client, sintomas, respuestas_adicionales, query)
+    return cacheEmbeddings.obtener(cacheEmbeddings.clave_canonica(sintomas, respuestas_adicionales))
+
+
+async def embedding_concluyente_async(client_async, sintomas, respuestas_adicionales, query):
+    """Versión asíncrona de `embedding_concluyente`."""
+    if RAG_EMBEDDING_CONCLUYENTE:
+        return await crear_embedding_consulta_async(client_async, sintomas, respuestas_adicionales, query)
+    return await cacheEmbeddings.obtener_async(
+        cacheEmbeddings.clave_canonica(sintomas, respuestas_adicionales)
+    )
+
+
+def find_vector_in_redis(query, client, redis_client, redis_index, embedding=None, top_k=1):
+    """
+    Busca en Redis los `top_k` documentos más cercanos a la consulta.
+    Si se entrega `embedding`, se reutiliza en lugar de calcularlo nuevamente.
+    Retorna la lista de documentos encontrados, o None si Redis no respondió.
+    """
+    try:
+
+        # Crear el embedding con la API actualizada
+        if embedding is None:
+            response = gatewayLLM.embeddings(
+                client,
+                input=[query],  # OpenAI espera una lista
+                model="text-embedding-ada-002"
+            )
+            embedding = response.data[0].embedding
+
+        # Construcción de la consulta KNN en Redis con el embedding vectorizado
+        q, params_dict = construir_consulta_knn(embedding, top_k)
 
         # Ejecutar la consulta en Redis
         results = redis_client.ft(redis_index).search(q, query_params=params_dict)
+        conexionRedis.registrar_exito()
 
         return results.docs if results.total > 0 else []
 
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+        return None
+
     except Exception as e:
         print("❌ Error al buscar en Redis:", str(e))
         return []
 
 
-def busqueda_base_conocimiento(client, sintomas, respuestas_adicionales):
-    redis_client, redis_index = conexion()
+async def find_vector_in_redis_async(query, client_async, redis_client, redis_index, embedding=None, top_k=1):
+    """Versión asíncrona de `find_vector_in_redis` (`openai.AsyncOpenAI` y `redis.asyncio`)."""
+    try:
 
-    message = preparar_mensaje_vectorial(sintomas, respuestas_adicionales)
+        if embedding is None:
+            response = await gatewayLLM.embeddings_async(
+                client_async,
+                input=[query],
+                model="text-embedding-ada-002"
+            )
+            embedding = response.data[0].embedding
+        q, params_dict = construir_consulta_knn(embedding, top_k)
 
-    find_database_answer = find_vector_in_redis(
-        message, client, redis_client, redis_index
-    )
+        results = await redis_client.ft(redis_index).search(q, query_params=params_dict)
+        conexionRedis.registrar_exito()
+
+        return results.docs if results.total > 0 else []
+
+    except RedisError as e:
+        conexionRedis.registrar_fallo(e)
+        return None
+
+    except Exception as e:
+        print("❌ Error al buscar en Redis:", str(e))
+        return []
+
+
+def find_vector_in_local(embedding, top_k=1):
+    """
+    Busca en el índice vectorial local los documentos más cercanos al embedding.
+    Retorna la lista de documentos encontrados, o None si el índice no está disponible.
+    """
+    try:
+        return indiceVectorialLocal.obtener_indice_local().buscar(embedding, top_k)
+    except (OSError, ValueError) as e:
+        print("❌ Índice vectorial local no disponible:", str(e))
+        return None
+
+
+def precargar_backend():
+    """Carga el índice vectorial local al iniciar, si es el backend configurado."""
+    if backend_rag() != RAG_BACKEND_LOCAL:
+        return
+    try:
+        indiceVectorialLocal.obtener_indice_local()
+    except (OSError, ValueError) as e:
+        print("❌ Índice vectorial local no disponible:", str(e))
+
+
+def _campo(documento, nombre, default=None):
+    """Lee un campo de un documento de Redis (`Document`) o del índice local (dict)."""
+    if isinstance(documento, dict):
+        return documento.get(nombre, default)
+    return getattr(documento, nombre, default)
+
+
+def _clave_documento(documento):
+    return _campo(documento, "filename", ""), str(_campo(documento, "text_chunk_index", "0"))
+
+
+def buscar_lexico(sintomas, respuestas_adicionales):
+    """Candidatos de la búsqueda léxica en la tabla de síntomas ([] si está desactivada)."""
+    if not RAG_HIBRIDO:
+        return []
+    return indiceSintomas.buscar_lexico(sintomas, respuestas_adicionales, RAG_TOP_K)
+
+
+def reordenar_documentos(documentos, sintomas, respuestas_adicionales, documentos_lexicos=None):
+    """
+    Fusiona con Reciprocal Rank Fusion el ranking vectorial (orden de la búsqueda KNN) y el
+    ranking léxico (puntaje de los síntomas de cada enfermedad) de la unión de los candidatos
+    KNN y los de la búsqueda léxica. Cada ranking aporta peso / (RAG_RRF_K + posición), con
+    RAG_PESO_VECTORIAL para el vectorial y su complemento para el léxico.
+    Retorna la lista de tuplas (puntaje, documento), de mayor a menor.
+    """
+    candidatos = {}
+    for documento in list(documentos) + list(documentos_lexicos or []):
+        candidatos.setdefault(_clave_documento(documento), documento)
+
+    puntajes = dict.fromkeys(candidatos, 0.0)
+    for posicion, documento in enumerate(documentos, start=1):
+        puntajes[_clave_documento(documento)] += RAG_PESO_VECTORIAL / (RAG_RRF_K + posicion)
+
+    consulta = indiceSintomas.texto_consulta(sintomas, respuestas_adicionales)
+    lexicos = []
+    for clave, documento in candidatos.items():
+        puntaje = _campo(documento, "puntaje_lexico")
+        if puntaje is None:
+            puntaje = indiceSintomas.puntaje_lexico(clave[0], sintomas, consulta=consulta)
+        if puntaje > 0:
+            lexicos.append((puntaje, clave))
+    lexicos.sort(key=lambda item: item[0], reverse=True)
+    for posicion, (_, clave) in enumerate(lexicos, start=1):
+        puntajes[clave] += (1 - RAG_PESO_VECTORIAL) / (RAG_RRF_K + posicion)
 
-    if find_database_answer:
+    puntuados = [(puntajes[clave], documento) for clave, documento in candidatos.items()]
+    puntuados.sort(key=lambda item: item[0], reverse=True)
+    return puntuados
+
+
+def empaquetar_contexto(contenidos, presupuesto_tokens=RAG_PRESUPUESTO_TOKENS):
+    """
+    Une los contenidos, en el orden entregado y sin repetir, mientras quepan en el
+    presupuesto de tokens. El primero siempre se incluye (recortado si excede el presupuesto).
+    """
+    seleccionados = []
+    usados = 0
+    for contenido in contenidos:
+        if contenido in seleccionados:
+            continue
+        tokens = presupuestoTokens.contar_tokens(contenido) + (
+            presupuestoTokens.contar_tokens(SEPARADOR_DOCUMENTOS) if seleccionados else 0
+        )
+        if usados + tokens > presupuesto_tokens:
+            if not seleccionados:
+                seleccionados.append(presupuestoTokens.recortar_tokens(contenido, presupuesto_tokens))
+            break
+        seleccionados.append(contenido)
+        usados += tokens
+    return SEPARADOR_DOCUMENTOS.join(seleccionados)
+
+
+def contenido_resultado(find_database_answer, sintomas=None, respuestas_adicionales=None, documentos_lexicos=None):
+    """
+    Selecciona el contenido a usar como base de conocimiento según el resultado de la búsqueda.
+    Si se entregan los síntomas, los documentos (junto a los de la búsqueda léxica) se
+    reordenan y se empaquetan en el presupuesto de tokens; si no, se usa el primer documento.
+    Sin respuesta de la búsqueda vectorial (None) se usan sólo los documentos léxicos.
+    """
+    if find_database_answer is None and not documentos_lexicos:
+        content_0 = MENSAJE_BASE_NO_DISPONIBLE
+    elif sintomas is not None and (find_database_answer or documentos_lexicos):
+        reordenados = reordenar_documentos(
+            find_database_answer or [], sintomas, respuestas_adicionales, documentos_lexicos
+        )
+        content_0 = empaquetar_contexto(
+            [str(_campo(documento, "content", "")) for _, documento in reordenados]
+        )
+    elif find_database_answer:
         contents = [str(content["content"]) for content in find_database_answer]
         content_0 = contents[0]
     else:
-        content_0 = "No se encontraron coincidencias en la base de datos."
+        content_0 = MENSAJE_SIN_COINCIDENCIAS
 
     print(f"content_0 = {content_0}")
     return content_0
 
 
+def busqueda_base_conocimiento(client, sintomas, respuestas_adicionales):
+    contenido, _ = busqueda_base_conocimiento_con_embedding(
+        client, sintomas, respuestas_adicionales
+    )
+    return contenido
+
+
+def busqueda_base_conocimiento_con_embedding(client, sintomas, respuestas_adicionales):
+    """
+    Igual que `busqueda_base_conocimiento`, pero retorna la tupla (contenido, embedding),
+    para reutilizar el embedding de la consulta (por ejemplo, en la caché semántica).
+    Si la búsqueda léxica es concluyente, el embedding es el de `embedding_concluyente`
+    (puede ser None); si no, es None sólo si no se pudo calcular.
+    """
+    lexicos = buscar_lexico(sintomas, respuestas_adicionales)
+    message = preparar_mensaje_vectorial(sintomas, respuestas_adicionales)
+
+    if indiceSintomas.es_concluyente(lexicos):
+        # El resultado léxico basta: no se pide el embedding a OpenAI ni se busca en el índice
+        embedding = embedding_concluyente(client, sintomas, respuestas_adicionales, message)
+        return contenido_resultado([], sintomas, respuestas_adicionales, lexicos), embedding
+
+    embedding = crear_embedding_consulta(client, sintomas, respuestas_adicionales, message)
+
+    if embedding is None:
+        return contenido_resultado([], sintomas, respuestas_adicionales, lexicos), None
+
+    if backend_rag() == RAG_BACKEND_LOCAL:
+        find_database_answer = find_vector_in_local(embedding, RAG_TOP_K)
+        return (
+            contenido_resultado(find_database_answer, sintomas, respuestas_adicionales, lexicos),
+            embedding,
+        )
+
+    redis_client, redis_index = conexion()
+    if redis_client is None:
+        print("❌ Redis no disponible, se continúa sin base de conocimiento.")
+        return contenido_resultado(None, sintomas, respuestas_adicionales, lexicos), embedding
+
+    find_database_answer = find_vector_in_redis(
+        message, client, redis_client, redis_index, embedding=embedding, top_k=RAG_TOP_K
+    )
+    return (
+        contenido_resultado(find_database_answer, sintomas, respuestas_adicionales, lexicos),
+        embedding,
+    )
+
+
+async def busqueda_base_conocimiento_async(client_async, sintomas, respuestas_adicionales):
+    """Versión asíncrona de `busqueda_base_conocimiento`."""
+    contenido, _ = await busqueda_base_conocimiento_con_embedding_async(
+        client_async, sintomas, respuestas_adicionales
+    )
+    return contenido
+
+
+async def busqueda_base_conocimiento_con_embedding_async(client_async, sintomas, respuestas_adicionales):
+    """Versión asíncrona de `busqueda_base_conocimiento_con_embedding`."""
+    # La búsqueda léxica es en memoria y sobre una tabla pequeña: no bloquea el event loop
+    lexicos = buscar_lexico(sintomas, respuestas_adicionales)
+    message = preparar_mensaje_vectorial(sintomas, respuestas_adicionales)
+
+    if indiceSintomas.es_concluyente(lexicos):
+        embedding = await embedding_concluyente_async(
+            client_async, sintomas, respuestas_adicionales, message
+        )
+        return contenido_resultado([], sintomas, respuestas_adicionales, lexicos), embedding
+
+    embedding = await crear_embedding_consulta_async(
+        client_async, sintomas, respuestas_adicionales, message
+    )
+
+    if embedding is None:
+        return contenido_resultado([], sintomas, respuestas_adicionales, lexicos), None
+
+    if backend_rag() == RAG_BACKEND_LOCAL:
+        # La búsqueda local es un producto matriz-vector: no bloquea el event loop
+        find_database_answer = find_vector_in_local(embedding, RAG_TOP_K)
+        return (
+            contenido_resultado(find_database_answer, sintomas, respuestas_adicionales, lexicos),
+            embedding,
+        )
+
+    redis_client = conexionRedis.obtener_cliente_async()
+    if redis_client is None:
+        print("❌ Redis no disponible, se continúa sin base de conocimiento.")
+        return contenido_resultado(None, sintomas, respuestas_adicionales, lexicos), embedding
+
+    find_database_answer = await find_vector_in_redis_async(
+        message,
+        client_async,
+        redis_client,
+        conexionRedis.obtener_indice(),
+        embedding=embedding,
+        top_k=RAG_TOP_K,
+    )
+    return (
+        contenido_resultado(find_database_answer, sintomas, respuestas_adicionales, lexicos),
+        embedding,
+    )
+
+
 def preparar_mensaje_vectorial(sintomas, respuestas_adicionales):
     message = "Síntomas: " + ", ".join(sintomas) + "\n\n"
 
@@ -1,15 +1,49 @@
 #!/usr/bin/env python
 
-"""Este modulo se ocupa de la preparación e importación de datos en un archivo .csv, hasta cargarlos en una base de datos en Redis, que se utiliza como contexto para las consultas del usuario."""
+"""Este modulo se ocupa de la preparación e importación de datos en un archivo .csv, hasta cargarlos en una base de datos en Redis, que se utiliza como contexto para las consultas del usuario.
 
+La carga es incremental: cada fragmento (chunk) se guarda en Redis bajo la clave
+`doc:{indice}:{archivo}:{n_fragmento}` junto al hash SHA-256 de su contenido. En cada ejecución
+sólo se calculan embeddings y se escriben los fragmentos nuevos o modificados.
+
+Se eliminan todas las claves bajo el prefijo `doc:{indice}:` que no corresponden a un fragmento
+actual: las de enfermedades o archivos que ya no existen y las de la carga anterior con
+LangChain (`Redis.from_documents`, claves `doc:{indice}:<uuid>` sin `content_hash`). Las claves
+fuera de ese prefijo no se revisan ni se eliminan.
+
+Antes de cargar se verifica el esquema del índice de RediSearch. Si el índice existe con otro
+esquema (por ejemplo el de LangChain, sin `filename` ni `content_hash`) o con otro prefijo, se
+elimina sólo su definición (`FT.DROPINDEX` sin `DD`, las claves se conservan) y se recrea con el
+esquema actual, que reindexa las claves del prefijo.
+
+Para corpus grandes la carga funciona como un pipeline:
+  - Los archivos se leen y fragmentan en un pool de procesos.
+  - Los embeddings se solicitan en lotes grandes, con concurrencia acotada y reintentos con
+    backoff exponencial (y `Retry-After`) ante límites de tasa o errores transitorios.
+  - Cada lote se escribe en Redis apenas llega, con un pipeline de `HSET`.
+
+Uso:
+    python data/PreparacionBaseDatos.py            # aplica los cambios
+    python data/PreparacionBaseDatos.py --dry-run  # sólo muestra las diferencias
+    python data/PreparacionBaseDatos.py --lote 512 --concurrencia 8 --procesos 4
+"""
+
+import argparse
+import hashlib
 import os
-from dotenv import find_dotenv, load_dotenv
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
+import numpy as np
+import openai
 import pandas as pd
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_community.vectorstores.redis import Redis
-from langchain_openai.embeddings import OpenAIEmbeddings
+import redis
+from dotenv import find_dotenv, load_dotenv
+from langchain_text_splitters import CharacterTextSplitter
+from openai import OpenAI
+from redis.commands.search.field import NumericField, TagField, TextField, VectorField
+from redis.commands.search.index_definition import IndexDefinition, IndexType
 from rich import (
     print,  # sobreescribe la función print, para utilizar formato con colores
     traceback
@@ -22,6 +56,46 @@ traceback.install()
 output_dir = ".//data"
 input_file = ".//data//claves.csv"
 
+# Constantes de la base vectorial (deben coincidir con `consultaBaseConocimiento`)
+VECTOR_FIELD_NAME = "content_vector"
+MODELO_EMBEDDING = "text-embedding-ada-002"
+DIMENSION_EMBEDDING = 1536
+TAMANO_FRAGMENTO = 1000
+
+ENCABEZADO_ENFERMEDAD = "Enfermedad: "
+"""Primera línea de los archivos .txt generados desde el CSV"""
+
+LOTE_EMBEDDINGS = 256
+"""Cantidad de fragmentos por llamada a la API de embeddings"""
+
+CONCURRENCIA_EMBEDDINGS = 4
+"""Cantidad máxima de llamadas simultáneas a la API de embeddings"""
+
+REINTENTOS_EMBEDDINGS = 6
+"""Reintentos de un lote ante límites de tasa o errores transitorios"""
+
+ESPERA_MAXIMA_REINTENTO = 60
+"""Espera máxima (segundos) entre reintentos de un lote"""
+
+UMBRAL_ARCHIVOS_PROCESOS = 64
+"""Cantidad mínima de archivos para fragmentar en un pool de procesos"""
+
+CODIGOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+"""Códigos HTTP de la API de OpenAI que justifican reintentar"""
+
+ESQUEMA_INDICE = {
+    "content": "TEXT",
+    "filename": "TAG",
+    "text_chunk_index": "NUMERIC",
+    "content_hash": "TAG",
+    VECTOR_FIELD_NAME: "VECTOR",
+}
+"""Campos (y tipos) del índice de RediSearch de la base de conocimiento"""
+
+ESTADO_INDICE_AUSENTE = "ausente"
+ESTADO_INDICE_ACTUAL = "actual"
+ESTADO_INDICE_DISTINTO = "distinto"
+
 
 def create_enfermedad_details_text(row) -> str:
     """Generar el texto a almacenar en el archivo .txt para cada enfermedad."""
@@ -39,8 +113,352 @@ def create_enfermedad_details_text(row) -> str:
     )
 
 
+def calcular_hash(texto) -> str:
+    """Hash SHA-256 del contenido de un fragmento."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def listar_textos(directorio):
+    """Lista los archivos .txt del directorio, en orden alfabético."""
+    return sorted(f for f in os.listdir(directorio) if f.endswith(".txt"))
+
+
+def textos_desde_csv(df):
+    """Genera el texto de cada enfermedad del CSV. Retorna un diccionario {archivo: texto}."""
+    textos = {}
+    for row in df.to_dict("records"):
+        # Asegurar nombres de archivo válidos
+        enfermedad_name = str(row["nombre"]).replace("/", "-")
+        textos[f"{enfermedad_name}.txt"] = create_enfermedad_details_text(row)
+    return textos
+
+
+def _leer_texto(ruta):
+    with open(ruta, encoding="utf-8") as archivo:
+        return archivo.read()
+
+
+def _es_archivo_generado(ruta):
+    """Indica si el .txt fue generado desde el CSV (comienza con el encabezado de enfermedad)."""
+    with open(ruta, encoding="utf-8") as archivo:
+        return archivo.read(len(ENCABEZADO_ENFERMEDAD)) == ENCABEZADO_ENFERMEDAD
+
+
+def sincronizar_archivos(directorio, textos_csv, dry_run):
+    """
+    Escribe sólo los .txt cuyo contenido cambió y elimina los .txt generados desde el CSV
+    (con encabezado de enfermedad) cuya enfermedad ya no está en el CSV.
+    Retorna el corpus {archivo: texto}; el texto es None para los archivos que no provienen
+    del CSV, que se leen luego al fragmentar.
+    """
+    corpus = {}
+    for filename in listar_textos(directorio):
+        ruta = os.path.join(directorio, filename)
+        if filename in textos_csv:
+            continue
+        if _es_archivo_generado(ruta):
+            if not dry_run:
+                os.remove(ruta)
+            print(f"[yellow]Archivo de enfermedad eliminada del CSV: '{filename}'.[/yellow]")
+        else:
+            corpus[filename] = None
+
+    for filename, texto in textos_csv.items():
+        ruta = os.path.join(directorio, filename)
+        if not dry_run and (not os.path.exists(ruta) or _leer_texto(ruta) != texto):
+            with open(ruta, "w", encoding="utf-8") as file:
+                file.write(texto)
+        corpus[filename] = texto
+    return corpus
+
+
+def _fragmentar_archivo(parametros):
+    """
+    Lee (si hace falta) y fragmenta un archivo, calculando el hash de cada fragmento.
+    Se ejecuta en los procesos del pool: recibe y retorna sólo datos serializables.
+    """
+    directorio, filename, texto = parametros
+    if texto is None:
+        texto = _leer_texto(os.path.join(directorio, filename))
+    text_splitter = CharacterTextSplitter(chunk_size=TAMANO_FRAGMENTO, chunk_overlap=0)
+    return [
+        {
+            "filename": filename,
+            "text_chunk_index": indice,
+            "content": contenido,
+            "content_hash": calcular_hash(contenido),
+        }
+        for indice, contenido in enumerate(text_splitter.split_text(texto))
+    ]
+
+
+def fragmentar_corpus(directorio, corpus, prefijo, procesos=None):
+    """
+    Divide cada texto en fragmentos, en un pool de procesos si el corpus es grande.
+    Retorna un diccionario {clave Redis: fragmento}, donde cada fragmento tiene
+    'filename', 'text_chunk_index', 'content' y 'content_hash'.
+    """
+    parametros = [(directorio, filename, texto) for filename, texto in corpus.items()]
+    procesos = procesos or os.cpu_count() or 1
+    if procesos > 1 and len(parametros) >= UMBRAL_ARCHIVOS_PROCESOS:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            resultados = pool.map(
+                _fragmentar_archivo,
+                parametros,
+                chunksize=max(1, len(parametros) // (procesos * 4)),
+            )
+            por_archivo = list(resultados)
+    else:
+        por_archivo = [_fragmentar_archivo(p) for p in parametros]
+
+    fragmentos = {}
+    for lista in por_archivo:
+        for fragmento in lista:
+            clave = f"{prefijo}{fragmento['filename']}:{fragmento['text_chunk_index']}"
+            fragmentos[clave] = fragmento
+    return fragmentos
+
+
+def leer_hashes_indice(redis_client, prefijo):
+    """Retorna {clave: hash de contenido} de los fragmentos almacenados bajo el prefijo."""
+    claves = list(redis_client.scan_iter(match=f"{prefijo}*", count=1000))
+    pipe = redis_client.pipeline(transaction=False)
+    for clave in claves:
+        pipe.hget(clave, "content_hash")
+    hashes = pipe.execute() if claves else []
+    return {
+        clave.decode("utf-8"): (valor.decode("utf-8") if valor else None)
+        for clave, valor in zip(claves, hashes)
+    }
+
+
+def calcular_diferencias(fragmentos, hashes_indice):
+    """
+    Clasifica las claves en nuevas, modificadas, eliminadas y sin cambios. Son eliminadas
+    todas las claves del prefijo que no son un fragmento actual, incluidas las de LangChain.
+    """
+    nuevas = sorted(clave for clave in fragmentos if clave not in hashes_indice)
+    modificadas = sorted(
+        clave
+        for clave, fragmento in fragmentos.items()
+        if clave in hashes_indice and hashes_indice[clave] != fragmento["content_hash"]
+    )
+    eliminadas = sorted(clave for clave in hashes_indice if clave not in fragmentos)
+    sin_cambios = len(fragmentos) - len(nuevas) - len(modificadas)
+    return nuevas, modificadas, eliminadas, sin_cambios
+
+
+def _texto(valor):
+    return valor.decode("utf-8") if isinstance(valor, bytes) else str(valor)
+
+
+def _pares(lista):
+    """Convierte una lista [clave, valor, ...] de FT.INFO en diccionario con claves en minúsculas."""
+    if isinstance(lista, dict):
+        return {_texto(clave).lower(): valor for clave, valor in lista.items()}
+    return {_texto(lista[i]).lower(): lista[i + 1] for i in range(0, len(lista) - 1, 2)}
+
+
+def leer_esquema_indice(redis_client, redis_index):
+    """
+    Retorna el esquema del índice según FT.INFO: {'prefijos': [...], 'campos': {nombre: atributos}},
+    con los atributos de cada campo en minúsculas ('type', 'dim', 'distance_metric', ...).
+    Retorna None si el índice no existe.
+    """
+    try:
+        info = _pares(redis_client.ft(redis_index).info())
+    except redis.exceptions.ResponseError:
+        return None
+    definicion = _pares(info.get("index_definition", []))
+    campos = {}
+    for atributo in info.get("attributes", []):
+        atributos = {clave: _texto(valor) for clave, valor in _pares(atributo).items()}
+        campos[atributos.get("attribute", atributos.get("identifier"))] = atributos
+    return {
+        "prefijos": [_texto(prefijo) for prefijo in definicion.get("prefixes", [])],
+        "campos": campos,
+    }
+
+
+def diferencias_esquema(esquema, prefijo):
+    """Lista las diferencias entre el esquema leído del índice y el esperado (vacía si coincide)."""
+    diferencias = []
+    prefijos = [p.rstrip(":") for p in esquema["prefijos"]]
+    if prefijos != [prefijo.rstrip(":")]:
+        diferencias.append(f"prefijos {esquema['prefijos']} en lugar de ['{prefijo}']")
+    for campo, tipo in ESQUEMA_INDICE.items():
+        atributos = esquema["campos"].get(campo)
+        if atributos is None:
+            diferencias.append(f"falta el campo '{campo}'")
+        elif atributos.get("type", "").upper() != tipo:
+            diferencias.append(f"el campo '{campo}' es {atributos.get('type')} en lugar de {tipo}")
+    vector = esquema["campos"].get(VECTOR_FIELD_NAME) or {}
+    if "dim" in vector and vector["dim"] != str(DIMENSION_EMBEDDING):
+        diferencias.append(f"dimensión del vector {vector['dim']} en lugar de {DIMENSION_EMBEDDING}")
+    if "distance_metric" in vector and vector["distance_metric"].upper() != "COSINE":
+        diferencias.append(f"métrica del vector {vector['distance_metric']} en lugar de COSINE")
+    return diferencias
+
+
+def verificar_indice(redis_client, redis_index, prefijo):
+    """Retorna el estado del índice (ausente, actual o distinto) y la lista de diferencias."""
+    esquema = leer_esquema_indice(redis_client, redis_index)
+    if esquema is None:
+        return ESTADO_INDICE_AUSENTE, []
+    diferencias = diferencias_esquema(esquema, prefijo)
+    return (ESTADO_INDICE_DISTINTO if diferencias else ESTADO_INDICE_ACTUAL), diferencias
+
+
+def asegurar_indice(redis_client, redis_index, prefijo, estado):
+    """
+    Deja el índice vectorial de RediSearch con el esquema actual: lo crea si no existe y, si
+    existe con otro esquema, elimina sólo su definición (sin `DD`: las claves se conservan)
+    y lo recrea, lo que reindexa las claves del prefijo.
+    """
+    if estado == ESTADO_INDICE_ACTUAL:
+        return
+    if estado == ESTADO_INDICE_DISTINTO:
+        redis_client.ft(redis_index).dropindex(delete_documents=False)
+        print(f"[yellow]Índice '{redis_index}' con otro esquema eliminado (se conservan las claves).[/yellow]")
+
+    redis_client.ft(redis_index).create_index(
+        (
+            TextField("content"),
+            TagField("filename"),
+            NumericField("text_chunk_index"),
+            TagField("content_hash"),
+            VectorField(
+                VECTOR_FIELD_NAME,
+                "FLAT",
+                {"TYPE": "FLOAT32", "DIM": DIMENSION_EMBEDDING, "DISTANCE_METRIC": "COSINE"},
+            ),
+        ),
+        definition=IndexDefinition(prefix=[prefijo], index_type=IndexType.HASH),
+    )
+    print(f"[bold]Índice '{redis_index}' creado en REDIS.[/bold]")
+
+
+def _es_reintentable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in CODIGOS_REINTENTABLES
+
+
+def _espera_reintento(error, intento):
+    """Segundos a esperar antes de reintentar: `Retry-After` si viene, o backoff con jitter."""
+    respuesta = getattr(error, "response", None)
+    retry_after = respuesta.headers.get("retry-after") if respuesta is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), ESPERA_MAXIMA_REINTENTO)
+    except ValueError:
+        pass
+    return min(ESPERA_MAXIMA_REINTENTO, 2 ** intento) * random.uniform(0.5, 1.5)
+
+
+def calcular_embeddings_lote(openai_client, textos, reintentos=REINTENTOS_EMBEDDINGS):
+    """Calcula los embeddings de un lote de textos, reintentando ante errores transitorios."""
+    for intento in range(reintentos + 1):
+        try:
+            response = openai_client.embeddings.create(input=textos, model=MODELO_EMBEDDING)
+            return [dato.embedding for dato in sorted(response.data, key=lambda d: d.index)]
+        except Exception as e:
+            if intento == reintentos or not _es_reintentable(e):
+                raise
+            espera = _espera_reintento(e, intento)
+            print(f"[yellow]Lote de {len(textos)} fragmentos: reintento en {espera:.1f}s ({e}).[/yellow]")
+            time.sleep(espera)
+
+
+def escribir_lote(redis_client, fragmentos, claves, embeddings):
+    """Escribe en Redis los fragmentos de un lote con sus vectores, en un solo pipeline."""
+    pipe = redis_client.pipeline(transaction=False)
+    for clave, embedding in zip(claves, embeddings):
+        # Se reemplaza la entrada completa, sin campos residuales de cargas anteriores
+        pipe.delete(clave)
+        pipe.hset(
+            clave,
+            mapping={
+                **fragmentos[clave],
+                VECTOR_FIELD_NAME: np.array(embedding, dtype=np.float32).tobytes(),
+            },
+        )
+    pipe.execute()
+
+
+def aplicar_cambios(
+    redis_client,
+    openai_client,
+    fragmentos,
+    claves_a_cargar,
+    claves_a_eliminar,
+    lote=LOTE_EMBEDDINGS,
+    concurrencia=CONCURRENCIA_EMBEDDINGS,
+):
+    """
+    Calcula los embeddings de los fragmentos a cargar en lotes, con hasta `concurrencia`
+    llamadas simultáneas, y escribe cada lote en Redis apenas termina. Luego elimina los
+    fragmentos obsoletos. Retorna la cantidad de fragmentos cargados.
+    """
+    lotes = [claves_a_cargar[i:i + lote] for i in range(0, len(claves_a_cargar), lote)]
+    cargados = 0
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        futuros = {
+            pool.submit(
+                calcular_embeddings_lote,
+                openai_client,
+                [fragmentos[clave]["content"] for clave in claves],
+            ): claves
+            for claves in lotes
+        }
+        for futuro in as_completed(futuros):
+            claves = futuros[futuro]
+            escribir_lote(redis_client, fragmentos, claves, futuro.result())
+            cargados += len(claves)
+            print(f"[bold]{cargados}/{len(claves_a_cargar)} fragmentos cargados en REDIS.[/bold]")
+
+    if claves_a_eliminar:
+        pipe = redis_client.pipeline(transaction=False)
+        for clave in claves_a_eliminar:
+            pipe.delete(clave)
+        pipe.execute()
+    return cargados
+
+
+def Lee_Parametros():
+    parser = argparse.ArgumentParser(
+        description="Carga incremental de la base de conocimiento en Redis"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Mostrar los fragmentos nuevos, modificados y eliminados sin aplicar cambios.",
+    )
+    parser.add_argument(
+        "--lote",
+        type=int,
+        default=LOTE_EMBEDDINGS,
+        help=f"Fragmentos por llamada a la API de embeddings, default: {LOTE_EMBEDDINGS}.",
+    )
+    parser.add_argument(
+        "--concurrencia",
+        type=int,
+        default=CONCURRENCIA_EMBEDDINGS,
+        help=f"Llamadas simultáneas a la API de embeddings, default: {CONCURRENCIA_EMBEDDINGS}.",
+    )
+    parser.add_argument(
+        "--procesos",
+        type=int,
+        default=None,
+        help="Procesos para leer y fragmentar los archivos, default: cantidad de CPUs.",
+    )
+    return parser.parse_args()
+
+
 def main():
     global output_dir, input_file
+    args = Lee_Parametros()
+
     # Buscar el archivo .env en los lugares posibles
     if load_dotenv(find_dotenv(usecwd=True)):
         print("[bold]Archivo '.env' cargado exitosamente.[/bold]")
@@ -54,24 +472,13 @@ def main():
     df = pd.read_csv(input_file)
     print(f"[bold]Archivo de entrada '{input_file}' cargado exitosamente.[/bold]")
 
-    # Iterar sobre el DataFrame y guardar cada enfermedad como un archivo .txt
-    for idx, row in df.iterrows():
-        enfermedad_name = row["nombre"].replace(
-            "/", "-"
-        )  # Asegurar nombres de archivo válidos
-        file_name = f"{enfermedad_name}.txt"
-        file_path = os.path.join(output_dir, file_name)
-
-        # Escribir los detalles en un archivo .txt
-        with open(file_path, "w", encoding="utf-8") as file:
-            file.write(create_enfermedad_details_text(row))
-
+    # Generar los .txt de cada enfermedad, escribiendo sólo los que cambiaron
+    input_dir = os.path.dirname(input_file)
+    corpus = sincronizar_archivos(input_dir, textos_desde_csv(df), args.dry_run)
     print(
-        f"[bold]Datos Procesados: {idx + 1} archivos generados en: '{os.path.normpath(os.path.abspath(output_dir))}'.[/bold]"
+        f"[bold]Datos Procesados: {len(df)} enfermedades en: '{os.path.normpath(os.path.abspath(output_dir))}'.[/bold]"
     )
 
-    input_dir = os.path.dirname(input_file)
-
     # Lectura de claves desde el entorno
     redis_host = os.environ.get("REDIS_HOST")
     redis_port = os.environ.get("REDIS_PORT")
@@ -79,40 +486,59 @@ def main():
     redis_password = os.environ.get("REDIS_PASSWORD")
     redis_username = os.environ.get("REDIS_USERNAME")
     redis_index = os.environ.get("REDIS_INDEX")
-    gpt_key = os.environ.get("OPENAI_API_KEY")
-
-    # Crear embeddings usando la API de OpenAI
-    embeddings = OpenAIEmbeddings(openai_api_key=gpt_key)
-
-    # Iterar sobre cada archivo en el directorio y cargarlo a REDIS
-    for filename in sorted(os.listdir(input_dir)):
-        if filename.endswith(".txt"):
-            file_path = os.path.normpath(os.path.join(input_dir, filename))
-
-            # Cargar el documento desde el archivo de texto
-            loader = TextLoader(file_path, encoding="utf-8")
-            documents = loader.load()
-
-            # Dividir el documento en fragmentos de tamaño adecuado para embeddings
-            text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-            docs = text_splitter.split_documents(documents)
-            number_chunks = len(docs)
-
-            # Cargar los documentos divididos a REDIS con embeddings
-            vectorstore = Redis.from_documents(
-                docs,
-                embeddings,
-                redis_url=f"redis://{redis_username}:{redis_password}@{redis_host}:{redis_port}/{redis_db}",
-                index_name=redis_index,
-            )
 
-            print(
-                f"[bold]Documentos del archivo '{filename}' fueron cargados exitosamente en REDIS, en[/bold]",
-                f"[bold]{ {number_chunks} + 'chunks' if number_chunks > 1 else 'un solo chunk' }.[/bold]"
-            )
+    redis_client = redis.Redis.from_url(
+        f"redis://{redis_username}:{redis_password}@{redis_host}:{redis_port}/{redis_db}"
+    )
+    prefijo = f"doc:{redis_index}:"
+
+    # Verificar el esquema del índice (p. ej. el creado por la carga anterior con LangChain)
+    estado_indice, diferencias = verificar_indice(redis_client, redis_index, prefijo)
+    if estado_indice == ESTADO_INDICE_DISTINTO:
+        print(
+            f"[yellow]El índice '{redis_index}' tiene otro esquema y se recreará: "
+            f"{'; '.join(diferencias)}.[/yellow]"
+        )
+    elif estado_indice == ESTADO_INDICE_AUSENTE:
+        print(f"[yellow]El índice '{redis_index}' no existe y se creará.[/yellow]")
+
+    # Comparar los fragmentos actuales con los almacenados en REDIS
+    fragmentos = fragmentar_corpus(input_dir, corpus, prefijo, args.procesos)
+    nuevas, modificadas, eliminadas, sin_cambios = calcular_diferencias(
+        fragmentos, leer_hashes_indice(redis_client, prefijo)
+    )
+
+    for clave in nuevas:
+        print(f"[green]+ {clave}[/green]")
+    for clave in modificadas:
+        print(f"[yellow]~ {clave}[/yellow]")
+    for clave in eliminadas:
+        print(f"[red]- {clave}[/red]")
+    print(
+        f"[bold]{len(nuevas)} nuevos, {len(modificadas)} modificados, "
+        f"{len(eliminadas)} eliminados, {sin_cambios} sin cambios.[/bold]"
+    )
+
+    if args.dry_run:
+        print("[bold]Modo --dry-run: no se aplicaron cambios.[/bold]")
+        return
+    if not (nuevas or modificadas or eliminadas) and estado_indice == ESTADO_INDICE_ACTUAL:
+        print("[bold green]La base de conocimiento en REDIS ya está actualizada.[/bold green]")
+        return
+
+    asegurar_indice(redis_client, redis_index, prefijo, estado_indice)
+    aplicar_cambios(
+        redis_client,
+        OpenAI(api_key=os.environ.get("OPENAI_API_KEY")),
+        fragmentos,
+        nuevas + modificadas,
+        eliminadas,
+        lote=args.lote,
+        concurrencia=args.concurrencia,
+    )
 
     print(
-        "[bold green]Todos los archivos han sido procesados y cargados en REDIS.[/bold green]"
+        "[bold green]Todos los cambios han sido procesados y cargados en REDIS.[/bold green]"
     )
 
 
@@ -12,12 +12,19 @@ Funciones para entornos web (con sufijo _web):
   - validar_datos_paciente_web()
   - parse_sintomas_web()
   - realizar_preguntas_relevantes_web()
+  - obtener_preguntas_relevantes_web()
 """
 
 import json
+import os
 import re
 import logging
 
+import gatewayLLM
+from cacheMemoria import CacheLRU
+from funcionesExtras import normalizar_texto
+from modelosRespuesta import PreguntasSeguimiento, SALIDA_ESTRUCTURADA, formato_respuesta, validar_respuesta
+
 # ----------------------------
 # Constantes para validación
 # ----------------------------
@@ -29,6 +36,20 @@ EDAD_MAXIMA = 125
 PESO_MINIMO = 0
 PESO_MAXIMO = 250
 
+# ----------------------------
+# Caché de preguntas relevantes
+# ----------------------------
+MAX_PREGUNTAS = 5
+"""Cantidad máxima de preguntas relevantes por consulta"""
+
+PREGUNTAS_CACHE_TTL = int(os.environ.get("PREGUNTAS_CACHE_TTL", "3600"))
+"""Segundos que se reutilizan las preguntas generadas para un mismo paciente y síntomas"""
+
+PREGUNTAS_CACHE_MAX_ITEMS = 1024
+"""Cantidad máxima de conjuntos de preguntas en la caché"""
+
+_cache_preguntas = CacheLRU(max_items=PREGUNTAS_CACHE_MAX_ITEMS, ttl=PREGUNTAS_CACHE_TTL)
+
 
 # ----------------------------
 # Funciones para Consola
@@ -107,8 +128,8 @@ def realizar_preguntas_relevantes(datos_basicos, sintomas, clientIA):
             {"role": "user", "content": prompt},
         ]
 
-        response = clientIA.chat.completions.create(
-            # response = clientIA.chat.ChatCompletion.create(
+        response = gatewayLLM.chat(
+            clientIA,
             model="gpt-4o-mini",
             messages=messages,
             temperature=0,
@@ -172,6 +193,7 @@ def realizar_preguntas_relevantes_web(datos_basicos, sintomas, clientIA):
     """
     Genera preguntas relevantes utilizando GPT-4o-mini y retorna una lista de preguntas
     para ser presentadas en la web (sin solicitar respuestas por consola).
+    Con salida estructurada, las preguntas se reciben como `modelosRespuesta.PreguntasSeguimiento`.
     Se deja una traza del prompt enviado y la respuesta recibida.
     """
     prompt = (
@@ -199,7 +221,11 @@ def realizar_preguntas_relevantes_web(datos_basicos, sintomas, clientIA):
             },
             {"role": "user", "content": prompt},
         ]
-        response = clientIA.chat.completions.create(
+        parametros = {}
+        if SALIDA_ESTRUCTURADA:
+            parametros["response_format"] = formato_respuesta(PreguntasSeguimiento)
+        response = gatewayLLM.chat(
+            clientIA,
             model="gpt-4o-mini",
             messages=messages,
             temperature=0,
@@ -207,6 +233,7 @@ def realizar_preguntas_relevantes_web(datos_basicos, sintomas, clientIA):
             top_p=0.95,
             frequency_penalty=0,
             presence_penalty=0,
+            **parametros,
         )
         content = response.choices[0].message.content
         logger.debug("------------------------------------------------")
@@ -214,8 +241,12 @@ def realizar_preguntas_relevantes_web(datos_basicos, sintomas, clientIA):
         logger.debug(content)
         logger.debug("------------------------------------------------")
 
-        preguntas = [line.strip() for line in content.split("\n") if line.strip()]
-        return preguntas
+        if SALIDA_ESTRUCTURADA:
+            seguimiento = validar_respuesta(PreguntasSeguimiento, content)
+            preguntas = seguimiento.preguntas if seguimiento else []
+        else:
+            preguntas = content.split("\n")
+        return [pregunta.strip() for pregunta in preguntas if pregunta.strip()][:MAX_PREGUNTAS]
     except Exception as e:
         from flask import current_app
 
@@ -226,6 +257,44 @@ def realizar_preguntas_relevantes_web(datos_basicos, sintomas, clientIA):
         return []
 
 
+def clave_preguntas(datos_basicos, sintomas):
+    """
+    Construye la clave de caché de las preguntas: edad, sexo y peso del paciente junto a
+    los síntomas normalizados (sin mayúsculas, tildes ni duplicados, en orden alfabético).
+    """
+    sintomas_normalizados = sorted({normalizar_texto(s) for s in sintomas if s})
+    return (
+        str(datos_basicos.get("edad", "")).strip(),
+        str(datos_basicos.get("sexo", "")).strip().upper(),
+        str(datos_basicos.get("peso", "")).strip(),
+        tuple(sintomas_normalizados),
+    )
+
+
+def obtener_preguntas_relevantes_web(datos_basicos, sintomas, clientIA, regenerar=False):
+    """
+    Retorna las preguntas relevantes para el paciente, reutilizando las ya generadas para
+    los mismos datos y síntomas. Con `regenerar=True` se ignora la caché (depuración).
+    Las listas vacías (error al generar) no se almacenan.
+    """
+    clave = clave_preguntas(datos_basicos, sintomas)
+    if not regenerar:
+        preguntas = _cache_preguntas.obtener(clave)
+        if preguntas is not None:
+            logging.debug("Preguntas relevantes obtenidas desde la caché.")
+            return list(preguntas)
+
+    preguntas = realizar_preguntas_relevantes_web(datos_basicos, sintomas, clientIA)
+    if preguntas:
+        _cache_preguntas.guardar(clave, tuple(preguntas))
+    return preguntas
+
+
+def estadisticas_cache_preguntas():
+    """Retorna las métricas de la caché de preguntas relevantes."""
+    return _cache_preguntas.estadisticas()
+
+
 # ----------------------------
 # Funciones de Validación (Originales)
 # ----------------------------
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+"""
+Este módulo orquesta las etapas del flujo de consulta web (`/resultado`) como un grafo
+de dependencias, ejecutando en paralelo las etapas que no dependen entre sí.
+
+Etapas del flujo:
+  - moderacion_generica y coherencia: las dos llamadas de moderación. La coherencia sólo se
+    evalúa si el moderador genérico no marcó la consulta (el contenido marcado no se envía a
+    un segundo modelo).
+  - rag: búsqueda en la base de conocimiento (embedding + KNN), se lanza junto a la moderación.
+  - moderacion: compuerta que combina ambos moderadores (misma regla que `moderacion_pasada_web`).
+  - cache_semantica: busca, con el embedding del RAG, una consulta similar ya respondida.
+  - asistente y supervisor: sólo se ejecutan si la moderación aprueba la consulta y no hubo
+    acierto en la caché semántica; sus respuestas se almacenan luego en la caché.
+
+`ejecutar_consulta_async` es la versión asíncrona del mismo grafo, para el modo de
+servidor asíncrono (clientes `openai.AsyncOpenAI` y `redis.asyncio`).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import asistenteMedico
+import cacheSemantica
+import conexionOpenAI
+import consultaBaseConocimiento
+import funcionesExtras
+import moderador
+import supervisorMedico
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+FLUJO_MAX_WORKERS = int(os.environ.get("FLUJO_MAX_WORKERS", "32"))
+"""Cantidad máxima de hilos compartidos para ejecutar etapas del flujo"""
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool():
+    """Crea (una sola vez) el pool de hilos compartido por todas las consultas."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=FLUJO_MAX_WORKERS, thread_name_prefix="flujo"
+                )
+    return _pool
+
+
+class _Fallo:
+    """Envoltorio para la excepción de una etapa que falló."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class ResultadosFlujo(dict):
+    """
+    Diccionario de resultados por etapa. Si una etapa falló, la excepción se relanza
+    recién al leer su resultado, de modo que un error en una etapa descartada
+    (por ejemplo, el RAG de una consulta rechazada) no interrumpe el flujo.
+    """
+
+    def __getitem__(self, nombre):
+        valor = super().__getitem__(nombre)
+        if isinstance(valor, _Fallo):
+            raise valor.error
+        return valor
+
+    def get(self, nombre, default=None):
+        return self[nombre] if nombre in self else default
+
+
+class EjecutorFlujo:
+    """
+    Ejecuta un conjunto de etapas respetando sus dependencias.
+
+    Cada etapa es una función que recibe los `ResultadosFlujo` acumulados. Una etapa se
+    lanza apenas terminan sus dependencias; si su `condicion` retorna False, o alguna de
+    sus dependencias fue omitida, la etapa se omite y su resultado queda en None.
+    """
+
+    def __init__(self):
+        self.etapas = {}
+
+    def agregar_etapa(self, nombre, funcion, dependencias=(), condicion=None):
+        self.etapas[nombre] = {
+            "funcion": funcion,
+            "dependencias": tuple(dependencias),
+            "condicion": condicion,
+        }
+
+    def ejecutar(self):
+        resultados = ResultadosFlujo()
+        omitidas = set()
+        pendientes = dict(self.etapas)
+        en_curso = {}
+        pool = _obtener_pool()
+
+        while pendientes or en_curso:
+            # Lanzar todas las etapas cuyas dependencias ya terminaron
+            for nombre, etapa in list(pendientes.items()):
+                if not all(dep in resultados for dep in etapa["dependencias"]):
+                    continue
+                del pendientes[nombre]
+
+                if any(dep in omitidas for dep in etapa["dependencias"]):
+                    omitidas.add(nombre)
+                    resultados[nombre] = None
+                    continue
+
+                if etapa["condicion"] is not None:
+                    try:
+                        ejecutar_etapa = etapa["condicion"](resultados)
+                    except Exception as e:
+                        resultados[nombre] = _Fallo(e)
+                        continue
+                    if not ejecutar_etapa:
+                        logger.debug(f"Etapa '{nombre}' omitida por condición.")
+                        omitidas.add(nombre)
+                        resultados[nombre] = None
+                        continue
+
+                en_curso[pool.submit(etapa["funcion"], resultados)] = nombre
+
+            if not en_curso:
+                if pendientes:
+                    raise ValueError(
+                        "Dependencias no resueltas en el flujo: " + ", ".join(pendientes)
+                    )
+                break
+
+            terminados, _ = wait(list(en_curso), return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre = en_curso.pop(futuro)
+                try:
+                    resultados[nombre] = futuro.result()
+                except BaseException as e:
+                    logger.error(f"Error en la etapa '{nombre}': {e}")
+                    resultados[nombre] = _Fallo(e)
+
+        return resultados
+
+
+def ejecutar_consulta_web(client, datos, sintomas, respuestas):
+    """
+    Ejecuta moderación, RAG, asistente y supervisor para una consulta web.
+
+    La búsqueda en la base de conocimiento se lanza en paralelo con los dos moderadores
+    y su resultado se descarta si la moderación rechaza la consulta. Si la caché semántica
+    tiene la respuesta de una consulta similar, se omiten el asistente y el supervisor.
+    Retorna un diccionario con las claves:
+      - moderacion_ok
+      - categorias
+      - base_conocimiento
+      - respuesta_asistente_medico
+      - supervisor_response
+    """
+    flujo = EjecutorFlujo()
+    _agregar_etapas_moderacion_y_rag(flujo, client, datos, sintomas, respuestas)
+    flujo.agregar_etapa(
+        "asistente",
+        lambda r: asistenteMedico.realizar_recomendacion_medica_web(
+            client, datos, sintomas, respuestas, r["rag"][0]
+        ),
+        dependencias=("moderacion", "cache_semantica"),
+        condicion=lambda r: r["moderacion"][0] and r["cache_semantica"] is None,
+    )
+    flujo.agregar_etapa(
+        "supervisor",
+        lambda r: supervisorMedico.revision_recomendacion_medica(
+            client, datos, sintomas, respuestas, r["rag"][0], r["asistente"]
+        ),
+        dependencias=("asistente",),
+    )
+
+    resultados = flujo.ejecutar()
+    moderacion_ok, categorias = resultados["moderacion"]
+
+    if not moderacion_ok:
+        return _resultado_rechazado(categorias)
+
+    base_conocimiento, embedding = resultados["rag"]
+    en_cache = resultados["cache_semantica"]
+    if en_cache is not None:
+        respuesta_asistente_medico = en_cache["respuesta_asistente_medico"]
+        supervisor_response = en_cache["supervisor_response"]
+    else:
+        respuesta_asistente_medico = resultados["asistente"]
+        supervisor_response = resultados["supervisor"]
+        cacheSemantica.guardar(datos, embedding, respuesta_asistente_medico, supervisor_response)
+
+    return {
+        "moderacion_ok": True,
+        "categorias": categorias,
+        "base_conocimiento": base_conocimiento,
+        "respuesta_asistente_medico": respuesta_asistente_medico,
+        "supervisor_response": supervisor_response,
+    }
+
+
+def ejecutar_consulta_stream(client, datos, sintomas, respuestas):
+    """
+    Versión por eventos de `ejecutar_consulta_web`, para transmitir la recomendación al
+    navegador a medida que se genera. Es un generador de tuplas (evento, datos):
+      - ("moderacion", {"moderacion_ok", "categorias"}): resultado de la compuerta.
+      - ("base_conocimiento", texto): contexto obtenido por el RAG.
+      - ("token", texto): fragmento de la recomendación del asistente.
+      - ("recomendacion", texto): recomendación completa.
+      - ("supervisor", texto): respuesta del supervisor médico.
+    Moderación y RAG se ejecutan en paralelo igual que en `ejecutar_consulta_web`. Ante un
+    acierto de la caché semántica, la recomendación se entrega en un único fragmento.
+    """
+    flujo = EjecutorFlujo()
+    _agregar_etapas_moderacion_y_rag(flujo, client, datos, sintomas, respuestas)
+    resultados = flujo.ejecutar()
+    moderacion_ok, categorias = resultados["moderacion"]
+    yield "moderacion", {"moderacion_ok": moderacion_ok, "categorias": categorias}
+    if not moderacion_ok:
+        return
+
+    base_conocimiento, embedding = resultados["rag"]
+    yield "base_conocimiento", base_conocimiento
+
+    en_cache = resultados["cache_semantica"]
+    if en_cache is not None:
+        # La recomendación en caché puede venir de la salida estructurada (JSON)
+        recomendacion = funcionesExtras.respuesta_asistente_medico_markdown(
+            en_cache["respuesta_asistente_medico"]
+        )
+        yield "token", recomendacion
+        yield "recomendacion", recomendacion
+        yield "supervisor", en_cache["supervisor_response"]
+        return
+
+    fragmentos = []
+    for fragmento in asistenteMedico.realizar_recomendacion_medica_web_stream(
+        client, datos, sintomas, respuestas, base_conocimiento
+    ):
+        fragmentos.append(fragmento)
+        yield "token", fragmento
+    respuesta_asistente_medico = "".join(fragmentos)
+    yield "recomendacion", respuesta_asistente_medico
+
+    supervisor_response = supervisorMedico.revision_recomendacion_medica(
+        client, datos, sintomas, respuestas, base_conocimiento, respuesta_asistente_medico
+    )
+    cacheSemantica.guardar(datos, embedding, respuesta_asistente_medico, supervisor_response)
+    yield "supervisor", supervisor_response
+
+
+def _resultado_rechazado(categorias):
+    return {
+        "moderacion_ok": False,
+        "categorias": categorias,
+        "base_conocimiento": "",
+        "respuesta_asistente_medico": "",
+        "supervisor_response": "",
+    }
+
+
+def _agregar_etapas_moderacion_y_rag(flujo, client, datos, sintomas, respuestas):
+    """
+    Agrega al flujo los dos moderadores, su compuerta, la búsqueda en paralelo (RAG), cuyo
+    resultado es la tupla (base de conocimiento, embedding), y la búsqueda en la caché semántica.
+    La coherencia espera al moderador genérico y no se evalúa (queda en None) si éste marcó la consulta.
+    """
+    flujo.agregar_etapa(
+        "moderacion_generica",
+        lambda r: moderador.analisis_moderador_generico(client, datos, sintomas, respuestas),
+    )
+    flujo.agregar_etapa(
+        "coherencia",
+        lambda r: None if r["moderacion_generica"] else moderador.evaluar_coherencia_medica(
+            datos, sintomas, respuestas
+        ),
+        dependencias=("moderacion_generica",),
+    )
+    flujo.agregar_etapa(
+        "rag",
+        lambda r: consultaBaseConocimiento.busqueda_base_conocimiento_con_embedding(
+            client, sintomas, respuestas
+        ),
+    )
+    flujo.agregar_etapa(
+        "cache_semantica",
+        lambda r: cacheSemantica.buscar(datos, r["rag"][1]),
+        dependencias=("moderacion", "rag"),
+        condicion=lambda r: r["moderacion"][0],
+    )
+    flujo.agregar_etapa(
+        "moderacion",
+        lambda r: moderador.decision_moderacion(
+            r["moderacion_generica"], lambda: r["coherencia"]
+        ),
+        dependencias=("moderacion_generica", "coherencia"),
+    )
+
+
+async def ejecutar_consulta_async(client_async, datos, sintomas, respuestas, uso_rag=True):
+    """
+    Versión asíncrona de `ejecutar_consulta_web`, con la misma compuerta de moderación.
+    Si `client_async` es None se usa el cliente `AsyncOpenAI` compartido del event loop.
+    Con `uso_rag=False` se omite la búsqueda en la base de conocimiento.
+    """
+    if client_async is None:
+        client_async = conexionOpenAI.obtener_cliente_async()
+
+    tarea_generica = asyncio.create_task(
+        moderador.analisis_moderador_generico_async(client_async, datos, sintomas, respuestas)
+    )
+    tarea_rag = None
+    if uso_rag:
+        tarea_rag = asyncio.create_task(
+            consultaBaseConocimiento.busqueda_base_conocimiento_con_embedding_async(
+                client_async, sintomas, respuestas
+            )
+        )
+
+    try:
+        categorias = await tarea_generica
+        # La coherencia sólo se evalúa si el moderador genérico no marcó la consulta
+        coherencia = None if categorias else await moderador.evaluar_coherencia_medica_async(
+            client_async, datos, sintomas, respuestas
+        )
+        moderacion_ok, categorias = moderador.decision_moderacion(
+            categorias, lambda: coherencia
+        )
+    except BaseException:
+        if tarea_rag is not None:
+            tarea_rag.cancel()
+        raise
+
+    if not moderacion_ok:
+        # Se descarta la búsqueda en la base de conocimiento
+        if tarea_rag is not None:
+            tarea_rag.cancel()
+        return _resultado_rechazado(categorias)
+
+    base_conocimiento, embedding = await tarea_rag if tarea_rag is not None else ("", None)
+    en_cache = await cacheSemantica.buscar_async(datos, embedding)
+    if en_cache is not None:
+        respuesta_asistente_medico = en_cache["respuesta_asistente_medico"]
+        supervisor_response = en_cache["supervisor_response"]
+    else:
+        respuesta_asistente_medico = await asistenteMedico.realizar_recomendacion_medica_web_async(
+            client_async, datos, sintomas, respuestas, base_conocimiento
+        )
+        supervisor_response = await supervisorMedico.revision_recomendacion_medica_async(
+            client_async, datos, sintomas, respuestas, base_conocimiento, respuesta_asistente_medico
+        )
+        await cacheSemantica.guardar_async(
+            datos, embedding, respuesta_asistente_medico, supervisor_response
+        )
+
+    return {
+        "moderacion_ok": True,
+        "categorias": categorias,
+        "base_conocimiento": base_conocimiento,
+        "respuesta_asistente_medico": respuesta_asistente_medico,
+        "supervisor_response": supervisor_response,
+    }
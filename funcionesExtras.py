@@ -1,4 +1,22 @@
 import re
+import unicodedata
+
+from modelosRespuesta import RecomendacionMedica, validar_respuesta
+
+# ----------------------------
+# Función para normalizar textos (claves de caché, comparaciones)
+# ----------------------------
+def normalizar_texto(texto: str) -> str:
+    """
+    Normaliza un texto para usarlo como clave: minúsculas, sin tildes ni signos
+    de puntuación y con los espacios colapsados.
+    Ejemplo: "  Radiografía de Tórax. " -> "radiografia de torax"
+    """
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
 # ----------------------------
 # Función para parsear la respuesta del asistente médico
 # ----------------------------
@@ -61,4 +79,56 @@ def parse_respuesta_asistente_medico(texto: str) -> dict:
         "recomendaciones": sections["Recomendaciones y Pasos Siguientes"],
         "examenes": sections["Exámenes o Procedimientos Médicos Sugeridos"],
         "conclusion": sections["Conclusión"]
-    }
\ No newline at end of file
+    }
+
+
+# ----------------------------
+# Función para interpretar la respuesta del asistente médico (JSON o markdown)
+# ----------------------------
+def interpretar_respuesta_asistente_medico(respuesta) -> dict:
+    """
+    Retorna el diccionario de secciones de la respuesta del asistente médico (mismas claves
+    que `parse_respuesta_asistente_medico`). Si la respuesta es el JSON de la salida
+    estructurada, se valida con `modelosRespuesta.RecomendacionMedica`; si no, se usa el
+    parser de secciones markdown como respaldo.
+    """
+    if isinstance(respuesta, RecomendacionMedica):
+        return respuesta.model_dump()
+    if isinstance(respuesta, dict):
+        return respuesta
+
+    texto = str(respuesta or "")
+    if texto.lstrip().startswith("{"):
+        recomendacion = validar_respuesta(RecomendacionMedica, texto)
+        if recomendacion is not None:
+            return recomendacion.model_dump()
+    return parse_respuesta_asistente_medico(texto)
+
+
+# ----------------------------
+# Función para mostrar la respuesta del asistente médico como texto
+# ----------------------------
+TITULOS_SECCIONES = {
+    "analisis": "Análisis de Síntomas y Factores del Paciente",
+    "diagnosticos": "Posibles Diagnósticos",
+    "recomendaciones": "Recomendaciones y Pasos Siguientes",
+    "examenes": "Exámenes o Procedimientos Médicos Sugeridos",
+    "conclusion": "Conclusión",
+}
+
+
+def respuesta_asistente_medico_markdown(respuesta: str) -> str:
+    """
+    Retorna la respuesta del asistente médico en el formato de secciones markdown. Si ya está
+    en markdown se retorna sin cambios; si es el JSON de la salida estructurada, se convierte.
+    """
+    if not str(respuesta or "").lstrip().startswith("{"):
+        return respuesta
+    secciones = interpretar_respuesta_asistente_medico(respuesta)
+    bloques = []
+    for clave, titulo in TITULOS_SECCIONES.items():
+        contenido = secciones[clave]
+        if isinstance(contenido, list):
+            contenido = "\n".join(f"{i}. {examen['nombre']}" for i, examen in enumerate(contenido, start=1))
+        bloques.append(f"### {titulo}\n{contenido}")
+    return "\n\n".join(bloques)
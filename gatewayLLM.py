@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+
+"""
+Este módulo es el punto único de salida de las llamadas a la API de OpenAI (chat, streaming,
+moderación y embeddings), en sus versiones síncrona y asíncrona.
+
+Cada llamada pasa por:
+  - un limitador de tasa (token bucket) por modelo, para no exceder el límite del proveedor;
+  - un plazo máximo (deadline) por llamada, que acota también los reintentos;
+  - reintentos con backoff exponencial y jitter ante errores transitorios (429, 5xx,
+    timeouts, errores de conexión), respetando el encabezado `Retry-After`;
+  - un interruptor de circuito por modelo: tras varias llamadas fallidas seguidas, las
+    siguientes fallan de inmediato durante un tiempo, sin esperar al proveedor.
+
+Si la llamada no se puede completar, se lanza `LLMNoDisponible`; en las llamadas de chat se
+puede indicar en cambio un contenido `degradada`, que se retorna como respuesta en modo
+degradado (ver `es_degradada`).
+
+Variables de entorno opcionales:
+  - LLM_LIMITES_TASA: llamadas por segundo por modelo, ej. "gpt-4o-mini=50,gpt-4o=10".
+  - LLM_TASA_DEFECTO: llamadas por segundo de los modelos no indicados.
+  - LLM_DEADLINE_CHAT / LLM_DEADLINE_MODERACION / LLM_DEADLINE_EMBEDDINGS: plazo (s) por llamada.
+  - LLM_REINTENTOS: reintentos máximos por llamada.
+  - LLM_CIRCUITO_FALLOS: llamadas fallidas seguidas que abren el circuito.
+  - LLM_CIRCUITO_APERTURA: segundos que el circuito permanece abierto.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+
+import openai
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+LLM_TASA_DEFECTO = float(os.environ.get("LLM_TASA_DEFECTO", "20"))
+"""Llamadas por segundo permitidas por defecto para un modelo"""
+
+LLM_REINTENTOS = int(os.environ.get("LLM_REINTENTOS", "3"))
+"""Reintentos máximos de una llamada ante errores transitorios"""
+
+LLM_CIRCUITO_FALLOS = int(os.environ.get("LLM_CIRCUITO_FALLOS", "5"))
+"""Llamadas fallidas seguidas que abren el circuito de un modelo"""
+
+LLM_CIRCUITO_APERTURA = float(os.environ.get("LLM_CIRCUITO_APERTURA", "30"))
+"""Segundos que el circuito permanece abierto antes de permitir una llamada de prueba"""
+
+DEADLINES = {
+    "chat": float(os.environ.get("LLM_DEADLINE_CHAT", "45")),
+    "moderacion": float(os.environ.get("LLM_DEADLINE_MODERACION", "10")),
+    "embeddings": float(os.environ.get("LLM_DEADLINE_EMBEDDINGS", "10")),
+}
+"""Plazo máximo (segundos) por tipo de llamada, incluyendo reintentos"""
+
+ESPERA_BASE_REINTENTO = 0.5
+"""Espera base (segundos) del backoff exponencial"""
+
+ESPERA_MAXIMA_REINTENTO = 8.0
+"""Espera máxima (segundos) entre reintentos"""
+
+CODIGOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+"""Códigos HTTP de errores transitorios"""
+
+logger = logging.getLogger(__name__)
+
+
+class LLMNoDisponible(Exception):
+    """La llamada al LLM no se pudo completar (circuito abierto, plazo vencido o errores transitorios)."""
+
+
+def _leer_limites_tasa():
+    """Lee LLM_LIMITES_TASA ("modelo=llamadas_por_segundo,...")."""
+    limites = {}
+    for par in os.environ.get("LLM_LIMITES_TASA", "").split(","):
+        if "=" in par:
+            modelo, tasa = par.split("=", 1)
+            limites[modelo.strip()] = float(tasa)
+    return limites
+
+
+# ----------------------------
+# Limitador de tasa e interruptor de circuito
+# ----------------------------
+class LimitadorTasa:
+    """
+    Token bucket: permite `tasa` llamadas por segundo con ráfagas de hasta `capacidad`.
+    Cada llamada reserva un token; si no hay, se calcula la espera hasta que se repongan.
+    """
+
+    def __init__(self, tasa, capacidad=None):
+        self.tasa = tasa
+        self.capacidad = capacidad or max(tasa, 1.0)
+        self._tokens = self.capacidad
+        self._actualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, espera_maxima):
+        """
+        Reserva un token y retorna los segundos a esperar antes de usarlo, o None si la
+        espera excede `espera_maxima` (en ese caso no se reserva).
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.capacidad, self._tokens + (ahora - self._actualizado) * self.tasa)
+            self._actualizado = ahora
+            espera = max(0.0, (1 - self._tokens) / self.tasa)
+            if espera > espera_maxima:
+                return None
+            self._tokens -= 1
+            return espera
+
+
+class InterruptorCircuito:
+    """
+    Interruptor de circuito: cerrado mientras haya menos de `umbral` fallos seguidos; abierto
+    durante `apertura` segundos al alcanzarlo; luego semiabierto, con una sola llamada de prueba
+    que lo cierra si tiene éxito o lo vuelve a abrir si falla. Si la llamada de prueba termina
+    sin resultado (rechazada por el limitador de tasa o cancelada), se libera con
+    `liberar_prueba` para que otra llamada pueda probar.
+    """
+
+    def __init__(self, umbral, apertura):
+        self.umbral = umbral
+        self.apertura = apertura
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._prueba = None
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self._fallos < self.umbral:
+            return "cerrado"
+        return "abierto" if time.monotonic() < self._abierto_hasta else "semiabierto"
+
+    def permitir(self):
+        """
+        Retorna False si el circuito rechaza la llamada. Si la permite, retorna True o, si es la
+        llamada de prueba del estado semiabierto, su turno (entregarlo a `liberar_prueba`).
+        """
+        with self._lock:
+            if self._fallos < self.umbral:
+                return True
+            if time.monotonic() >= self._abierto_hasta and self._prueba is None:
+                self._prueba = object()
+                return self._prueba
+            return False
+
+    def liberar_prueba(self, turno):
+        """Libera la llamada de prueba `turno` si sigue pendiente (terminó sin éxito ni fallo)."""
+        with self._lock:
+            if turno is not None and self._prueba is turno:
+                self._prueba = None
+
+    def registrar_exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._prueba = None
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba = None
+            if self._fallos >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.apertura
+
+
+class _EstadoModelo:
+    """Limitador, interruptor y contadores de un modelo."""
+
+    def __init__(self, modelo):
+        self.limitador = LimitadorTasa(_limites_tasa.get(modelo, LLM_TASA_DEFECTO))
+        self.interruptor = InterruptorCircuito(LLM_CIRCUITO_FALLOS, LLM_CIRCUITO_APERTURA)
+        self.llamadas = 0
+        self.reintentos = 0
+        self.fallos = 0
+        self.degradadas = 0
+
+
+_limites_tasa = _leer_limites_tasa()
+_estados = {}
+_estados_lock = threading.Lock()
+_contenidos_degradados = set()
+_clientes_sin_reintentos = weakref.WeakKeyDictionary()
+
+
+def _estado(modelo):
+    estado = _estados.get(modelo)
+    if estado is None:
+        with _estados_lock:
+            estado = _estados.setdefault(modelo, _EstadoModelo(modelo))
+    return estado
+
+
+# ----------------------------
+# Funciones auxiliares
+# ----------------------------
+def _es_reintentable(error):
+    """Indica si el error es transitorio (límite de tasa, error del servidor, timeout o conexión)."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in CODIGOS_REINTENTABLES
+
+
+def _espera_reintento(error, intento):
+    """Segundos a esperar antes del reintento: `Retry-After` si viene, si no backoff con jitter."""
+    respuesta = getattr(error, "response", None)
+    encabezados = getattr(respuesta, "headers", None) or {}
+    try:
+        return min(float(encabezados.get("retry-after")), ESPERA_MAXIMA_REINTENTO)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(ESPERA_MAXIMA_REINTENTO, ESPERA_BASE_REINTENTO * 2 ** intento))
+
+
+def _sin_reintentos(client):
+    """
+    Cliente con los reintentos propios del SDK desactivados (los reintentos los hace el gateway).
+    Se reutiliza una copia por cliente; los clientes sin `with_options` se usan tal cual.
+    """
+    if not hasattr(client, "with_options"):
+        return client
+    try:
+        copia = _clientes_sin_reintentos.get(client)
+        if copia is None:
+            copia = _clientes_sin_reintentos[client] = client.with_options(max_retries=0)
+        return copia
+    except TypeError:
+        return client.with_options(max_retries=0)
+
+
+def respuesta_degradada(contenido):
+    """Respuesta de chat en modo degradado, con la misma forma que la del SDK."""
+    _contenidos_degradados.add(contenido)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=contenido), finish_reason="degradada")],
+        usage=None,
+        degradada=True,
+    )
+
+
+def es_degradada(respuesta):
+    """Indica si una respuesta (objeto o contenido de texto) es una respuesta en modo degradado."""
+    if isinstance(respuesta, str):
+        return respuesta in _contenidos_degradados
+    return getattr(respuesta, "degradada", False) is True
+
+
+def _plazo(operacion, deadline):
+    return time.monotonic() + (deadline if deadline is not None else DEADLINES[operacion])
+
+
+def _verificar_circuito(estado, modelo):
+    """Retorna el permiso del circuito (ver `InterruptorCircuito.permitir`) o lanza LLMNoDisponible."""
+    permiso = estado.interruptor.permitir()
+    if not permiso:
+        raise LLMNoDisponible(f"Circuito abierto para '{modelo}'.")
+    return permiso
+
+
+def _reservar_tasa(estado, modelo, limite):
+    """Reserva la tasa y retorna la espera, o lanza LLMNoDisponible si no hay cupo en el plazo."""
+    espera = estado.limitador.reservar(limite - time.monotonic())
+    if espera is None:
+        raise LLMNoDisponible(f"Límite de tasa de '{modelo}': no hay cupo dentro del plazo.")
+    return espera
+
+
+def _tras_error(estado, modelo, error, intento, limite):
+    """
+    Decide si reintentar tras un error. Retorna la espera antes del reintento; si no se
+    reintenta, registra el fallo y lanza LLMNoDisponible (o relanza el error no transitorio).
+    """
+    if not _es_reintentable(error):
+        # Error de la solicitud (ej. 400): no es una falla del proveedor
+        estado.interruptor.registrar_exito()
+        raise error
+    espera = _espera_reintento(error, intento)
+    if intento < LLM_REINTENTOS and time.monotonic() + espera < limite:
+        estado.reintentos += 1
+        logger.warning(f"LLM '{modelo}': error transitorio ({str(error) or type(error).__name__}), reintento en {espera:.2f}s.")
+        return espera
+    estado.fallos += 1
+    estado.interruptor.registrar_fallo()
+    raise LLMNoDisponible(f"LLM '{modelo}' no disponible: {str(error) or type(error).__name__}") from error
+
+
+def _ejecutar(operacion, modelo, llamada, deadline=None):
+    """Ejecuta `llamada(timeout)` con limitador, reintentos, plazo e interruptor."""
+    estado = _estado(modelo)
+    limite = _plazo(operacion, deadline)
+    estado.llamadas += 1
+    intento = 0
+    permiso = _verificar_circuito(estado, modelo)
+    try:
+        while True:
+            time.sleep(_reservar_tasa(estado, modelo, limite))
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                estado.fallos += 1
+                estado.interruptor.registrar_fallo()
+                raise LLMNoDisponible(f"Plazo vencido para '{modelo}'.")
+            try:
+                respuesta = llamada(restante)
+            except Exception as e:
+                time.sleep(_tras_error(estado, modelo, e, intento, limite))
+                intento += 1
+                continue
+            estado.interruptor.registrar_exito()
+            return respuesta
+    finally:
+        # Una llamada de prueba que no registró éxito ni fallo no debe dejar el circuito tomado
+        estado.interruptor.liberar_prueba(permiso)
+
+
+async def _ejecutar_async(operacion, modelo, llamada, deadline=None):
+    """Versión asíncrona de `_ejecutar`: `llamada(timeout)` retorna una corrutina."""
+    estado = _estado(modelo)
+    limite = _plazo(operacion, deadline)
+    estado.llamadas += 1
+    intento = 0
+    permiso = _verificar_circuito(estado, modelo)
+    try:
+        while True:
+            await asyncio.sleep(_reservar_tasa(estado, modelo, limite))
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                estado.fallos += 1
+                estado.interruptor.registrar_fallo()
+                raise LLMNoDisponible(f"Plazo vencido para '{modelo}'.")
+            try:
+                respuesta = await asyncio.wait_for(llamada(restante), restante)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.sleep(_tras_error(estado, modelo, e, intento, limite))
+                intento += 1
+                continue
+            estado.interruptor.registrar_exito()
+            return respuesta
+    finally:
+        # Cancelada (ej. la búsqueda descartada tras un rechazo de moderación): se libera la prueba
+        estado.interruptor.liberar_prueba(permiso)
+
+
+def _degradar(modelo, degradada, error):
+    _estado(modelo).degradadas += 1
+    logger.error(f"{error} Se responde en modo degradado.")
+    return respuesta_degradada(degradada)
+
+
+# ----------------------------
+# Llamadas a la API
+# ----------------------------
+def chat(client, degradada=None, deadline=None, **parametros):
+    """
+    `client.chat.completions.create(**parametros)` a través del gateway. Si se indica
+    `degradada`, ante `LLMNoDisponible` se retorna una respuesta con ese contenido.
+    """
+    modelo = parametros.get("model", "")
+    cliente = _sin_reintentos(client)
+    try:
+        return _ejecutar(
+            "chat", modelo,
+            lambda timeout: cliente.chat.completions.create(timeout=timeout, **parametros),
+            deadline,
+        )
+    except LLMNoDisponible as e:
+        if degradada is None:
+            raise
+        return _degradar(modelo, degradada, e)
+
+
+async def chat_async(client, degradada=None, deadline=None, **parametros):
+    """Versión asíncrona de `chat` (`openai.AsyncOpenAI`)."""
+    modelo = parametros.get("model", "")
+    cliente = _sin_reintentos(client)
+    try:
+        return await _ejecutar_async(
+            "chat", modelo,
+            lambda timeout: cliente.chat.completions.create(timeout=timeout, **parametros),
+            deadline,
+        )
+    except LLMNoDisponible as e:
+        if degradada is None:
+            raise
+        return _degradar(modelo, degradada, e)
+
+
+def chat_stream(client, degradada=None, deadline=None, **parametros):
+    """
+    Versión en streaming de `chat`: generador de los fragmentos de la respuesta. Sólo se
+    reintenta mientras no se haya recibido ningún fragmento; si la llamada no se puede
+    completar y se indicó `degradada`, se entrega ese contenido como único fragmento.
+    """
+    modelo = parametros.get("model", "")
+    cliente = _sin_reintentos(client)
+    try:
+        stream = _ejecutar(
+            "chat", modelo,
+            lambda timeout: cliente.chat.completions.create(timeout=timeout, stream=True, **parametros),
+            deadline,
+        )
+    except LLMNoDisponible as e:
+        if degradada is None:
+            raise
+        contenido = _degradar(modelo, degradada, e).choices[0].message.content
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=contenido))])
+        return
+
+    try:
+        yield from stream
+    except Exception as e:
+        if _es_reintentable(e):
+            _estado(modelo).fallos += 1
+            _estado(modelo).interruptor.registrar_fallo()
+        raise
+
+
+def moderacion(client, deadline=None, **parametros):
+    """`client.moderations.create(**parametros)` a través del gateway."""
+    cliente = _sin_reintentos(client)
+    return _ejecutar(
+        "moderacion", parametros.get("model", ""),
+        lambda timeout: cliente.moderations.create(timeout=timeout, **parametros),
+        deadline,
+    )
+
+
+async def moderacion_async(client, deadline=None, **parametros):
+    """Versión asíncrona de `moderacion`."""
+    cliente = _sin_reintentos(client)
+    return await _ejecutar_async(
+        "moderacion", parametros.get("model", ""),
+        lambda timeout: cliente.moderations.create(timeout=timeout, **parametros),
+        deadline,
+    )
+
+
+def embeddings(client, deadline=None, **parametros):
+    """`client.embeddings.create(**parametros)` a través del gateway."""
+    cliente = _sin_reintentos(client)
+    return _ejecutar(
+        "embeddings", parametros.get("model", ""),
+        lambda timeout: cliente.embeddings.create(timeout=timeout, **parametros),
+        deadline,
+    )
+
+
+async def embeddings_async(client, deadline=None, **parametros):
+    """Versión asíncrona de `embeddings`."""
+    cliente = _sin_reintentos(client)
+    return await _ejecutar_async(
+        "embeddings", parametros.get("model", ""),
+        lambda timeout: cliente.embeddings.create(timeout=timeout, **parametros),
+        deadline,
+    )
+
+
+def estadisticas():
+    """Retorna, por modelo, las llamadas, reintentos, fallos, respuestas degradadas y el estado del circuito."""
+    return {
+        modelo: {
+            "llamadas": estado.llamadas,
+            "reintentos": estado.reintentos,
+            "fallos": estado.fallos,
+            "degradadas": estado.degradadas,
+            "circuito": estado.interruptor.estado,
+            "tasa_por_segundo": estado.limitador.tasa,
+        }
+        for modelo, estado in list(_estados.items())
+    }
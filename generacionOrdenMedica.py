@@ -1,20 +1,96 @@
 from fpdf import FPDF
+import copy
 import os
-import openai
+import threading
 import re  # Para extraer solo números de la respuesta
 import math  # Para el cálculo de líneas en celdas
 from datetime import datetime  # Para generar la fecha en el nombre del archivo
 
+from concurrent.futures import ThreadPoolExecutor
+
+import almacenOrdenes
+import cachePrestaciones
+import conexionOpenAI
+import gatewayLLM
+from funcionesExtras import normalizar_texto
+
+CODIGO_NO_ENCONTRADO = "Código no encontrado"
+
+MAX_CONSULTAS_PRESTACION_CONCURRENTES = int(os.environ.get("MAX_CONSULTAS_PRESTACION_CONCURRENTES", "8"))
+"""Cantidad máxima de consultas simultáneas al LLM para resolver códigos de prestación"""
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "logo.png")
+"""Logo de la orden médica (ruta absoluta, independiente del directorio actual)"""
+
+CAMPOS_PACIENTE = (("nombre", "Nombre"), ("edad", "Edad"), ("peso", "Peso"), ("rut", "RUT"))
+"""Campos del paciente en la orden: (clave en los datos, etiqueta)"""
+
+# Esqueleto fijo del inicio de la orden, construido una vez por proceso
+_plantilla = None
+_plantilla_lock = threading.Lock()
+
 def obtener_codigo_prestacion(examen_nombre):
+    """
+    Función que obtiene el código de prestación médica, primero desde la caché de
+    prestaciones y, si no está, desde la API de OpenAI (guardando el resultado).
+    """
+    cache = cachePrestaciones.obtener_cache()
+    codigo = cache.obtener(examen_nombre)
+    if codigo is not None:
+        return codigo
+
+    codigo = consultar_codigo_prestacion_llm(examen_nombre)
+    if codigo != CODIGO_NO_ENCONTRADO:
+        cache.guardar(examen_nombre, codigo)
+    return codigo
+
+def resolver_codigos_prestacion(examenes):
+    """
+    Resuelve en un solo paso los códigos de prestación de todos los exámenes de una orden.
+    Elimina duplicados (por nombre normalizado), toma de la caché los ya conocidos y consulta
+    los faltantes al LLM en paralelo. Retorna un diccionario {nombre del examen: código}.
+    """
+    nombres = [examen.get('nombre', '') for examen in examenes if isinstance(examen, dict)]
+
+    # Nombres únicos por clave normalizada, conservando el primer nombre visto
+    unicos = {}
+    for nombre in nombres:
+        unicos.setdefault(normalizar_texto(nombre), nombre)
+
+    cache = cachePrestaciones.obtener_cache()
+    codigos_por_clave = {}
+    faltantes = []
+    for clave, nombre in unicos.items():
+        codigo = cache.obtener(nombre)
+        if codigo is not None:
+            codigos_por_clave[clave] = codigo
+        else:
+            faltantes.append((clave, nombre))
+
+    if faltantes:
+        max_workers = min(len(faltantes), MAX_CONSULTAS_PRESTACION_CONCURRENTES)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            resultados = pool.map(consultar_codigo_prestacion_llm, [nombre for _, nombre in faltantes])
+            for (clave, nombre), codigo in zip(faltantes, resultados):
+                if codigo != CODIGO_NO_ENCONTRADO:
+                    cache.guardar(nombre, codigo)
+                codigos_por_clave[clave] = codigo
+
+    return {nombre: codigos_por_clave[normalizar_texto(nombre)] for nombre in nombres}
+
+def consultar_codigo_prestacion_llm(examen_nombre):
     """
     Función que obtiene el código de prestación médica desde la API de OpenAI.
     """
-    client = openai.OpenAI()  # Inicializar el cliente
+    client = conexionOpenAI.obtener_cliente()  # Cliente compartido del proceso
     prompt = (
         f"Dado el siguiente examen médico: '{examen_nombre}', proporciona únicamente el código de prestación de salud en Chile. "
         f"El código es un número y no debe incluir texto adicional."
     )
-    response = client.chat.completions.create(
+    # En modo degradado no hay código (CODIGO_NO_ENCONTRADO) y no se guarda en la caché
+    response = gatewayLLM.chat(
+        client,
+        degradada="",
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "Eres un asistente especializado en el catálogo de prestaciones de salud en Chile."},
@@ -26,41 +102,41 @@ def obtener_codigo_prestacion(examen_nombre):
     if codigo_numerico:
         return codigo_numerico.group(0)
     else:
-        return "Código no encontrado"
+        return CODIGO_NO_ENCONTRADO
 
-def generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico):
+def crear_plantilla():
     """
-    Genera una orden médica en formato PDF utilizando la información del paciente y
-    la respuesta del asistente médico. Se espera que 'respuesta_asistente_medico' sea un
-    diccionario con las siguientes claves:
-      - analisis
-      - diagnosticos
-      - recomendaciones
-      - examenes (lista de diccionarios, cada uno con 'nombre')
-      - conclusion
+    Construye el esqueleto fijo del inicio de la orden médica: página, logo, título, etiquetas
+    de los datos del paciente, separador y encabezado de los síntomas, es decir, todo lo que
+    está en una posición fija. Desde los síntomas, la posición de cada sección depende del
+    largo del contenido anterior, por lo que el resto se diagrama en cada orden.
+    Decodificar el PNG del logo es lo más costoso de la orden, por eso se hace una sola vez.
+    La posición de cada valor del paciente queda en `pdf.campos_paciente` ({clave: (x, y)}).
     """
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
     
     # Agregar logo si existe
-    logo_path = os.path.join("static", "logo.png")
-    if os.path.exists(logo_path):
-        pdf.image(logo_path, x=10, y=10, w=40)
+    if os.path.exists(LOGO_PATH):
+        pdf.image(LOGO_PATH, x=10, y=10, w=40)
     
     pdf.ln(20)
     pdf.set_font("Arial", style='B', size=18)
     pdf.cell(210, 10, "ORDEN MÉDICA", ln=True, align='C')
     pdf.ln(10)
-    
-    # Datos del Paciente
+
+    # Datos del Paciente: sólo las etiquetas; los valores se escriben en cada orden
     pdf.set_font("Arial", style='B', size=12)
     pdf.cell(0, 10, "Datos del Paciente:", ln=True)
     pdf.set_font("Arial", size=12)
-    pdf.cell(0, 8, f"Nombre: {datos_paciente.get('nombre', '')}", ln=True)
-    pdf.cell(0, 8, f"Edad: {datos_paciente.get('edad', '')}", ln=True)
-    pdf.cell(0, 8, f"Peso: {datos_paciente.get('peso', '')}", ln=True)
-    pdf.cell(0, 8, f"RUT: {datos_paciente.get('rut', '')}", ln=True)
+    pdf.campos_paciente = {}
+    for clave, etiqueta in CAMPOS_PACIENTE:
+        etiqueta = f"{etiqueta}: "
+        ancho = pdf.get_string_width(etiqueta)
+        pdf.cell(ancho, 8, etiqueta)
+        pdf.campos_paciente[clave] = (pdf.get_x(), pdf.get_y())
+        pdf.ln(8)
     pdf.ln(5)
     
     # Separador
@@ -68,10 +144,54 @@ def generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas
     pdf.cell(0, 1, "", ln=True, fill=True)
     pdf.ln(5)
     
-    # Síntomas reportados
+    # Encabezado de los síntomas reportados
     pdf.set_font("Arial", style='B', size=12)
     pdf.cell(0, 10, "Síntomas reportados:", ln=True)
     pdf.set_font("Arial", size=12)
+    return pdf
+
+def obtener_plantilla():
+    """Retorna el esqueleto de la orden del proceso, construyéndolo en el primer uso (no modificar: se copia)."""
+    global _plantilla
+    if _plantilla is None:
+        with _plantilla_lock:
+            if _plantilla is None:
+                _plantilla = crear_plantilla()
+    return _plantilla
+
+def usar_plantilla(plantilla):
+    """Usa como esqueleto del proceso uno ya construido (por ejemplo, recibido del proceso principal)."""
+    global _plantilla
+    with _plantilla_lock:
+        _plantilla = plantilla
+
+def construir_orden_medica_pdf(datos_paciente, sintomas, respuestas_adicionales, respuesta_asistente_medico, codigos=None):
+    """
+    Construye la orden médica (`FPDF`) utilizando la información del paciente y
+    la respuesta del asistente médico. Se espera que 'respuesta_asistente_medico' sea un
+    diccionario con las siguientes claves:
+      - analisis
+      - diagnosticos
+      - recomendaciones
+      - examenes (lista de diccionarios, cada uno con 'nombre')
+      - conclusion
+    `codigos` ({examen: código}) permite entregar los códigos de prestación ya resueltos.
+    """
+    # Resolver todos los códigos de prestación antes de la diagramación del PDF
+    examenes = respuesta_asistente_medico.get('examenes', [])
+    if codigos is None:
+        codigos = resolver_codigos_prestacion(examenes) if isinstance(examenes, list) else {}
+
+    # Copia del esqueleto (logo decodificado, título y etiquetas fijas): se escriben los datos
+    # del paciente en sus posiciones y se diagrama el resto desde los síntomas
+    pdf = copy.deepcopy(obtener_plantilla())
+    x_sintomas, y_sintomas = pdf.get_x(), pdf.get_y()
+    for clave, (x, y) in pdf.campos_paciente.items():
+        pdf.set_xy(x, y)
+        pdf.cell(0, 8, f"{datos_paciente.get(clave, '')}")
+    pdf.set_xy(x_sintomas, y_sintomas)
+    
+    # Síntomas reportados
     sintomas_texto = "\n".join(sintomas) if isinstance(sintomas, list) else sintomas
     pdf.multi_cell(0, 8, sintomas_texto)
     pdf.ln(5)
@@ -139,10 +259,9 @@ def generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas
     pdf.ln(5)
     pdf.cell(0, 10, "Exámenes o Procedimientos Médicos Sugeridos:", ln=True)
     pdf.ln(2)
-    examenes = respuesta_asistente_medico.get('examenes', [])
     if isinstance(examenes, list):
         for examen in examenes:
-            codigo = obtener_codigo_prestacion(examen.get('nombre', ''))
+            codigo = codigos[examen.get('nombre', '')]
             pdf.multi_cell(0, 8, f"{examen.get('nombre', '')} (Código: {codigo})", border=1)
     else:
         pdf.multi_cell(0, 8, examenes)
@@ -167,7 +286,7 @@ def generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas
     pdf.set_font("Arial", size=12)
     if isinstance(examenes, list):
         for examen in examenes:
-            codigo = obtener_codigo_prestacion(examen.get('nombre', ''))
+            codigo = codigos[examen.get('nombre', '')]
             pdf.multi_cell(0, 8, f"{examen.get('nombre', '')} (Código: {codigo})", border=1)
     else:
         pdf.multi_cell(0, 8, examenes)
@@ -176,23 +295,63 @@ def generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas
     # Firma médica
     pdf.cell(0, 10, "____________________", ln=True, align='C')
     pdf.cell(0, 10, "Firma del Médico", ln=True, align='C')
-    
-    # Generar el nombre del archivo:
-    # - Se extrae el rut y el nombre (eliminando espacios) de datos_paciente
-    # - Se añade la constante OM
-    # - Se agrega la fecha en formato: yyyymmddhhMMssmmm (año, mes, día, hora, minuto, segundo, milisegundos)
+    return pdf
+
+def nombre_archivo_orden(datos_paciente, fecha=None):
+    """
+    Nombre del archivo de la orden médica:
+    - Se extrae el rut y el nombre (eliminando espacios) de datos_paciente
+    - Se añade la constante OM
+    - Se agrega la fecha en formato: yyyymmddhhMMssmmm (año, mes, día, hora, minuto, segundo, milisegundos)
+    """
     rut = datos_paciente.get('rut', 'SINRUT')
     nombre = datos_paciente.get('nombre', 'SINNOMBRE').replace(" ", "")
-    now = datetime.now()
-    fecha_str = now.strftime("%Y%m%d%H%M%S") + f"{now.microsecond//1000:03d}"
-    nombre_archivo = f"{rut}_{nombre}_OM_{fecha_str}.pdf"
-    
+    fecha = fecha or datetime.now()
+    fecha_str = fecha.strftime("%Y%m%d%H%M%S") + f"{fecha.microsecond//1000:03d}"
+    return f"{rut}_{nombre}_OM_{fecha_str}.pdf"
+
+def contenido_pdf(pdf):
+    """Bytes del documento (fpdf 1.7 retorna el documento como str latin-1)."""
+    contenido = pdf.output(dest='S')
+    return contenido.encode('latin-1') if isinstance(contenido, str) else bytes(contenido)
+
+def preparar_orden(datos_paciente, sintomas, respuestas_adicionales, respuesta_asistente_medico):
+    """
+    Resuelve los códigos de prestación (llamadas al LLM) y retorna la orden lista para
+    diagramar: un diccionario serializable con los argumentos de `construir_orden_medica_pdf`.
+    """
+    examenes = respuesta_asistente_medico.get('examenes', [])
+    return {
+        'datos_paciente': datos_paciente,
+        'sintomas': sintomas,
+        'respuestas_adicionales': respuestas_adicionales,
+        'respuesta_asistente_medico': respuesta_asistente_medico,
+        'codigos': resolver_codigos_prestacion(examenes) if isinstance(examenes, list) else {},
+    }
+
+def renderizar_orden(orden):
+    """Diagrama la orden preparada (`preparar_orden`) y retorna los bytes del PDF (sólo CPU)."""
+    return contenido_pdf(construir_orden_medica_pdf(**orden))
+
+def generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico):
+    """
+    Genera la orden médica y la guarda en el directorio actual (modo consola).
+    Retorna el nombre del archivo.
+    """
+    pdf = construir_orden_medica_pdf(datos_paciente, sintomas, respuestas_adicionales, respuesta_asistente_medico)
+    nombre_archivo = nombre_archivo_orden(datos_paciente)
     pdf.output(nombre_archivo)
     print(f"Documento guardado como '{nombre_archivo}'")
     return nombre_archivo
 
-def generar_orden_medica_web(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico):
-    return generar_orden_medica_pdf(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico)
+def generar_orden_medica_web(openai_client, datos_paciente, sintomas, respuestas_adicionales, base_conocimiento, respuesta_asistente_medico, orden_id):
+    """
+    Genera la orden médica y la guarda en `almacenOrdenes` con el id `orden_id` (modo web),
+    sin escribir en el directorio actual. Retorna el id de la orden.
+    """
+    orden = preparar_orden(datos_paciente, sintomas, respuestas_adicionales, respuesta_asistente_medico)
+    almacenOrdenes.guardar(orden_id, renderizar_orden(orden))
+    return orden_id
 
 if __name__ == "__main__":
     generar_orden_medica_pdf(
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene la tabla estructurada de síntomas por enfermedad (`data/claves.csv`),
+usada para puntuar léxicamente los documentos de la base de conocimiento.
+
+Cada enfermedad tiene seis síntomas ordenados por importancia (`sintoma_1` .. `sintoma_6`);
+el puntaje de un documento frente a una consulta es la suma de los pesos (por posición de la
+columna) de los síntomas de su enfermedad presentes en la consulta, normalizada a [0, 1].
+
+Los síntomas de la tabla y los textos de la consulta se normalizan igual (sin tildes ni
+palabras vacías), de modo que 'dolor de garganta' coincide con 'dolor_garganta'. En la consulta
+se descarta lo negado: en cada frase, lo que sigue a una negación ('no tengo fiebre', 'sin tos')
+no cuenta como síntoma presente.
+
+Además se mantiene un índice invertido (palabra normalizada -> enfermedades) para buscar
+léxicamente en toda la tabla sin embeddings. Si el mejor resultado es concluyente (puntaje
+alto y con margen sobre el segundo), la búsqueda vectorial se puede omitir.
+
+Variables de entorno opcionales:
+  - CLAVES_CSV: ruta del CSV de enfermedades y síntomas.
+  - RAG_LEXICO_UMBRAL: puntaje léxico mínimo para considerar concluyente una búsqueda.
+  - RAG_LEXICO_MARGEN: diferencia mínima de puntaje entre el primer y el segundo resultado.
+"""
+
+import csv
+import logging
+import os
+import re
+import threading
+
+from funcionesExtras import normalizar_texto
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+CLAVES_CSV_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "claves.csv")
+"""Ruta por defecto del CSV de enfermedades y síntomas"""
+
+PESOS_COLUMNAS = {
+    "sintoma_1": 6,
+    "sintoma_2": 5,
+    "sintoma_3": 4,
+    "sintoma_4": 3,
+    "sintoma_5": 2,
+    "sintoma_6": 1,
+}
+"""Peso de cada columna de síntoma (la primera es el síntoma principal)"""
+
+PESO_PARCIAL = 0.5
+"""Factor del peso cuando sólo parte del síntoma aparece (ej. 'fiebre' para 'fiebre_alta')"""
+
+PESO_RESPUESTAS = 0.5
+"""Factor del peso cuando el síntoma aparece en las respuestas y no en los síntomas"""
+
+RAG_LEXICO_UMBRAL = float(os.environ.get("RAG_LEXICO_UMBRAL", "0.6"))
+"""Puntaje léxico mínimo del mejor resultado para omitir la búsqueda vectorial"""
+
+RAG_LEXICO_MARGEN = float(os.environ.get("RAG_LEXICO_MARGEN", "0.2"))
+"""Diferencia mínima de puntaje entre el primer y segundo resultado para omitir la búsqueda vectorial"""
+
+PALABRAS_VACIAS = {"a", "al", "con", "de", "del", "el", "en", "la", "las", "los", "para", "por", "sin", "y"}
+"""Palabras que se descartan al normalizar los síntomas y la consulta"""
+
+PALABRAS_NEGACION = {"no", "ni", "nunca", "jamas", "tampoco", "sin", "ningun", "ninguno", "ninguna", "nada"}
+"""Palabras que niegan lo que les sigue dentro de la misma frase"""
+
+SEPARADORES_FRASE = re.compile(r"[.,;:!?()\n]|\b(?:pero|aunque|sino)\b", re.IGNORECASE)
+"""Separadores de frase: una negación sólo alcanza hasta el siguiente separador"""
+
+logger = logging.getLogger(__name__)
+
+_tabla = None
+_indice = None
+_textos = {}
+_tabla_lock = threading.Lock()
+
+
+def normalizar_sintoma(texto):
+    """Normaliza un síntoma sin palabras vacías: 'Dolor_de_Cabeza' -> 'dolor cabeza'."""
+    palabras = normalizar_texto(str(texto).replace("_", " ")).split()
+    return " ".join(palabra for palabra in palabras if palabra not in PALABRAS_VACIAS)
+
+
+def texto_afirmado(texto):
+    """
+    Normaliza un texto libre de la consulta descartando lo negado: en cada frase se conservan
+    sólo las palabras anteriores a la primera negación. Las frases se separan con ' | '.
+    Ejemplo: 'Tengo tos, pero no fiebre' -> 'tengo tos'.
+    """
+    frases = []
+    for frase in SEPARADORES_FRASE.split(str(texto).replace("_", " ")):
+        afirmadas = []
+        for palabra in normalizar_texto(frase or "").split():
+            if palabra in PALABRAS_NEGACION:
+                break
+            afirmadas.append(palabra)
+        frase = normalizar_sintoma(" ".join(afirmadas))
+        if frase:
+            frases.append(frase)
+    return " | ".join(frases)
+
+
+def archivo_enfermedad(nombre):
+    """Nombre del archivo .txt de la enfermedad, igual que en `data/PreparacionBaseDatos.py`."""
+    return f"{str(nombre).replace('/', '-')}.txt"
+
+
+def cargar_tabla(ruta_csv):
+    """
+    Carga el CSV de enfermedades. Retorna {archivo de la enfermedad: [(síntoma, peso), ...]},
+    con los síntomas normalizados.
+    """
+    tabla = {}
+    with open(ruta_csv, newline="", encoding="utf-8-sig") as archivo:
+        for fila in csv.DictReader(archivo):
+            sintomas = [
+                (normalizar_sintoma(fila[columna]), peso)
+                for columna, peso in PESOS_COLUMNAS.items()
+                if fila.get(columna)
+            ]
+            tabla[archivo_enfermedad(fila["nombre"])] = sintomas
+    return tabla
+
+
+def construir_indice_invertido(tabla):
+    """Retorna el índice invertido {palabra: {archivo de la enfermedad, ...}} de la tabla."""
+    indice = {}
+    for filename, sintomas in tabla.items():
+        for sintoma, _ in sintomas:
+            for palabra in sintoma.split():
+                indice.setdefault(palabra, set()).add(filename)
+    return indice
+
+
+def _cargar():
+    global _tabla, _indice, _textos
+    ruta_csv = os.environ.get("CLAVES_CSV", CLAVES_CSV_DEFAULT)
+    try:
+        tabla = cargar_tabla(ruta_csv)
+    except (OSError, KeyError) as e:
+        logger.error(f"No se pudo cargar la tabla de síntomas '{ruta_csv}': {e}")
+        tabla = {}
+
+    # Textos de las enfermedades (los mismos .txt cargados en la base de conocimiento)
+    textos = {}
+    directorio = os.path.dirname(ruta_csv)
+    for filename in tabla:
+        try:
+            with open(os.path.join(directorio, filename), encoding="utf-8") as archivo:
+                textos[filename] = archivo.read()
+        except OSError:
+            logger.debug(f"Sin texto para '{filename}' en '{directorio}'.")
+
+    _indice = construir_indice_invertido(tabla)
+    _textos = textos
+    _tabla = tabla
+
+
+def obtener_tabla():
+    """Retorna la tabla de síntomas del proceso, cargándola en el primer uso ({} si no existe)."""
+    if _tabla is None:
+        with _tabla_lock:
+            if _tabla is None:
+                _cargar()
+    return _tabla
+
+
+def texto_consulta(sintomas, respuestas_adicionales):
+    """
+    Retorna los textos normalizados de la consulta, sin lo negado: (síntomas, respuestas),
+    cada uno rodeado de espacios para buscar frases completas.
+    """
+    texto_sintomas = " | ".join(texto_afirmado(s) for s in sintomas if s)
+    texto_respuestas = " | ".join(
+        texto_afirmado(r.get("respuesta") or "")
+        for r in respuestas_adicionales or []
+        if isinstance(r, dict)
+    )
+    return f" {texto_sintomas} ", f" {texto_respuestas} "
+
+
+def _puntaje_sintoma(sintoma, texto):
+    """1 si el síntoma aparece completo en el texto, PESO_PARCIAL por la fracción de sus palabras."""
+    if f" {sintoma} " in texto:
+        return 1.0
+    palabras = sintoma.split()
+    presentes = sum(1 for palabra in palabras if f" {palabra} " in texto)
+    return PESO_PARCIAL * presentes / len(palabras) if palabras else 0.0
+
+
+def puntaje_lexico(filename, sintomas, respuestas_adicionales=None, consulta=None):
+    """
+    Puntaje léxico en [0, 1] del documento `filename` frente a los síntomas y respuestas.
+    `consulta` permite reutilizar el resultado de `texto_consulta` entre documentos.
+    """
+    sintomas_enfermedad = obtener_tabla().get(filename)
+    if not sintomas_enfermedad:
+        return 0.0
+    texto_sintomas, texto_respuestas = consulta or texto_consulta(sintomas, respuestas_adicionales)
+
+    puntaje = 0.0
+    for sintoma, peso in sintomas_enfermedad:
+        coincidencia = _puntaje_sintoma(sintoma, texto_sintomas)
+        if coincidencia < 1.0:
+            coincidencia = max(
+                coincidencia, PESO_RESPUESTAS * _puntaje_sintoma(sintoma, texto_respuestas)
+            )
+        puntaje += peso * coincidencia
+    return puntaje / sum(peso for _, peso in sintomas_enfermedad)
+
+
+def buscar_lexico(sintomas, respuestas_adicionales=None, top_k=3):
+    """
+    Busca en toda la tabla las enfermedades cuyos síntomas aparecen en la consulta, usando el
+    índice invertido para obtener los candidatos. Retorna hasta `top_k` documentos (dict con
+    'filename', 'text_chunk_index', 'content' y 'puntaje_lexico'), de mayor a menor puntaje.
+    Sólo se incluyen enfermedades con texto disponible y puntaje mayor a cero.
+    """
+    obtener_tabla()
+    consulta = texto_consulta(sintomas, respuestas_adicionales)
+    candidatos = set()
+    for palabra in " ".join(consulta).split():
+        candidatos |= _indice.get(palabra, set())
+
+    puntuados = []
+    for filename in candidatos:
+        if filename not in _textos:
+            continue
+        puntaje = puntaje_lexico(filename, sintomas, consulta=consulta)
+        if puntaje > 0:
+            puntuados.append((puntaje, filename))
+    puntuados.sort(key=lambda item: (-item[0], item[1]))
+
+    return [
+        {
+            "filename": filename,
+            "text_chunk_index": 0,
+            "content": _textos[filename],
+            "puntaje_lexico": puntaje,
+        }
+        for puntaje, filename in puntuados[:top_k]
+    ]
+
+
+def es_concluyente(documentos):
+    """
+    Indica si el resultado léxico basta por sí solo: el mejor documento supera
+    RAG_LEXICO_UMBRAL y aventaja al segundo en al menos RAG_LEXICO_MARGEN.
+    """
+    if not documentos:
+        return False
+    primero = documentos[0]["puntaje_lexico"]
+    segundo = documentos[1]["puntaje_lexico"] if len(documentos) > 1 else 0.0
+    return primero >= RAG_LEXICO_UMBRAL and primero - segundo >= RAG_LEXICO_MARGEN
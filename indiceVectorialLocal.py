@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene un índice vectorial local (en memoria) para la base de conocimiento,
+alternativo a la búsqueda KNN en RediSearch.
+
+Los embeddings de los fragmentos se almacenan normalizados en una matriz NumPy float32
+(archivo `.npy`, que se abre con memory-map) y sus metadatos en un archivo `.json`.
+Una búsqueda top-k por similitud coseno es un único producto matriz-vector, sin red.
+Es adecuado para bases pequeñas como la actual (un documento por enfermedad en `data/*.txt`);
+para corpus grandes se mantiene el backend Redis (ver `RAG_BACKEND` en `consultaBaseConocimiento`).
+
+Variables de entorno opcionales:
+  - RAG_INDICE_LOCAL: ruta base de los archivos del índice (sin extensión).
+
+Uso por consola para construir el índice desde los documentos de `data/`:
+    python indiceVectorialLocal.py [directorio_documentos]
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+RAG_INDICE_LOCAL_DEFAULT = os.path.join("data", "indice_local")
+"""Ruta base por defecto del índice local (se agregan las extensiones .npy y .json)"""
+
+MODELO_EMBEDDING = "text-embedding-ada-002"
+"""Modelo de embeddings, el mismo usado para las consultas"""
+
+TAMANO_FRAGMENTO = 1000
+"""Tamaño de los fragmentos de texto, igual que en la carga a Redis"""
+
+logger = logging.getLogger(__name__)
+
+
+class IndiceVectorialLocal:
+    """
+    Índice vectorial en memoria.
+
+    - matriz: arreglo (n_fragmentos, dimension) float32 con los embeddings normalizados.
+    - documentos: lista de diccionarios con 'filename', 'text_chunk_index' y 'content'.
+    """
+
+    def __init__(self, matriz, documentos):
+        if len(matriz) != len(documentos):
+            raise ValueError(
+                f"El índice tiene {len(matriz)} vectores y {len(documentos)} documentos."
+            )
+        self.matriz = matriz
+        self.documentos = documentos
+
+    @classmethod
+    def desde_embeddings(cls, embeddings, documentos):
+        """Crea el índice normalizando los embeddings entregados."""
+        matriz = np.asarray(embeddings, dtype=np.float32)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return cls(matriz / normas, list(documentos))
+
+    @classmethod
+    def cargar(cls, ruta_base, mmap=True):
+        """Carga el índice desde `<ruta_base>.npy` y `<ruta_base>.json`."""
+        matriz = np.load(ruta_base + ".npy", mmap_mode="r" if mmap else None)
+        with open(ruta_base + ".json", encoding="utf-8") as archivo:
+            documentos = json.load(archivo)
+        return cls(matriz, documentos)
+
+    def guardar(self, ruta_base):
+        """Guarda la matriz en `<ruta_base>.npy` y los metadatos en `<ruta_base>.json`."""
+        directorio = os.path.dirname(ruta_base)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        np.save(ruta_base + ".npy", np.ascontiguousarray(self.matriz, dtype=np.float32))
+        with open(ruta_base + ".json", "w", encoding="utf-8") as archivo:
+            json.dump(self.documentos, archivo, ensure_ascii=False, indent=2)
+
+    def __len__(self):
+        return len(self.documentos)
+
+    def buscar(self, embedding, top_k=1):
+        """
+        Retorna los `top_k` documentos más similares al embedding, del más al menos cercano.
+        Cada documento incluye 'vector_score' como distancia coseno (1 - similitud),
+        igual que el puntaje de RediSearch.
+        """
+        if not len(self.documentos):
+            return []
+        vector = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        if norma:
+            vector = vector / norma
+
+        similitudes = self.matriz @ vector
+        top_k = min(top_k, len(similitudes))
+        candidatos = np.argpartition(-similitudes, top_k - 1)[:top_k]
+        candidatos = candidatos[np.argsort(-similitudes[candidatos])]
+        return [
+            dict(self.documentos[i], vector_score=float(1.0 - similitudes[i]))
+            for i in candidatos
+        ]
+
+
+def fragmentar_documentos(directorio):
+    """
+    Lee los archivos .txt del directorio y los divide en fragmentos, con el mismo
+    divisor usado al cargar la base en Redis. Retorna la lista de documentos.
+    """
+    from langchain_text_splitters import CharacterTextSplitter
+
+    text_splitter = CharacterTextSplitter(chunk_size=TAMANO_FRAGMENTO, chunk_overlap=0)
+    documentos = []
+    for filename in sorted(os.listdir(directorio)):
+        if not filename.endswith(".txt"):
+            continue
+        with open(os.path.join(directorio, filename), encoding="utf-8") as archivo:
+            texto = archivo.read()
+        for indice, fragmento in enumerate(text_splitter.split_text(texto)):
+            documentos.append(
+                {"filename": filename, "text_chunk_index": indice, "content": fragmento}
+            )
+    return documentos
+
+
+def construir_indice(client, directorio):
+    """Construye el índice local calculando los embeddings de los documentos del directorio."""
+    documentos = fragmentar_documentos(directorio)
+    if not documentos:
+        return IndiceVectorialLocal.desde_embeddings(np.empty((0, 0)), [])
+    response = client.embeddings.create(
+        input=[documento["content"] for documento in documentos],
+        model=MODELO_EMBEDDING,
+    )
+    embeddings = [dato.embedding for dato in sorted(response.data, key=lambda d: d.index)]
+    return IndiceVectorialLocal.desde_embeddings(embeddings, documentos)
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def ruta_indice():
+    """Ruta base del índice local configurada en el entorno."""
+    return os.environ.get("RAG_INDICE_LOCAL", RAG_INDICE_LOCAL_DEFAULT)
+
+
+def obtener_indice_local():
+    """
+    Retorna el índice local del proceso, cargándolo (con memory-map) en el primer uso.
+    Lanza `FileNotFoundError` si el índice aún no se ha construido.
+    """
+    global _indice
+    if _indice is None:
+        with _indice_lock:
+            if _indice is None:
+                _indice = IndiceVectorialLocal.cargar(ruta_indice())
+                logger.info(f"Índice vectorial local cargado: {len(_indice)} fragmentos.")
+    return _indice
+
+
+if __name__ == "__main__":
+    from dotenv import find_dotenv, load_dotenv
+    from openai import OpenAI
+
+    load_dotenv(find_dotenv(usecwd=True))
+    directorio = sys.argv[1] if len(sys.argv) > 1 else "data"
+    indice = construir_indice(OpenAI(), directorio)
+    indice.guardar(ruta_indice())
+    print(f"Índice local con {len(indice)} fragmentos guardado en '{ruta_indice()}'.")
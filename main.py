@@ -3,33 +3,47 @@
 """Archivo principal que soporta ejecución por consola y vía web (Flask)."""
 
 import argparse
+import io
 import logging
 import os
 import json
 import re  # Para la función de parseo
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-import openai
 from dotenv import find_dotenv, load_dotenv
 
 # Importar Flask y dependencias
 from flask import (
     Flask,
+    Response,
     redirect,
     render_template,
     request,
+    send_file,
     send_from_directory,
     session,
+    stream_with_context,
     url_for,
 )
 from rich import print, traceback
 
 # Importar módulos del proyecto
+import almacenOrdenes
 import asistenteMedico
+import bucleEventos
+import cacheEmbeddings
+import cacheSemantica
+import colaOrdenes
+import conexionOpenAI
 import consultaBaseConocimiento
 import datosBasicosYSintomas
+import flujoConsulta
+import gatewayLLM
 import generacionOrdenMedica
 import moderador
+import resultadosConsulta
+import servicioRenderPdf
+import sesionServidor
 import supervisorMedico
 import funcionesExtras
 
@@ -51,6 +65,12 @@ HOST_DEFAULT = "localhost"
 DEBUG_DEFAULT = False
 """Modo de depuración por defecto"""
 
+ORDEN_TIMEOUT_DESCARGA = 60
+"""Segundos que `/download` espera a que termine la generación de la orden médica"""
+
+WORKERS_DEFAULT = 1
+"""Cantidad de procesos worker por defecto para el servidor asíncrono"""
+
 # ----------------------------
 # Configuración de Logging
 # ----------------------------
@@ -74,11 +94,8 @@ else:
     )
     exit(1)
 
-# Configurar la API key para la librería de OpenAI
-openai.api_key = openai_api_key
-
-# Definir el objeto openai_client (para evitar posibles conflictos de nombres)
-openai_client = openai
+# Cliente de OpenAI compartido por todas las etapas (pool de conexiones keep-alive)
+openai_client = conexionOpenAI.obtener_cliente()
 
 # ----------------------------
 # Flujo CLI (Modo Consola)
@@ -149,25 +166,10 @@ def main():
             respuesta_asistente_medico,
         )
 
-        # Si la respuesta incluye delimitadores Markdown, eliminarlos.
-        if respuesta_supervisor_json.startswith("```"):
-            primer_salto = respuesta_supervisor_json.find("\n")
-            ultimos_backticks = respuesta_supervisor_json.rfind("```")
-            if primer_salto != -1 and ultimos_backticks != -1:
-                respuesta_supervisor_json = respuesta_supervisor_json[
-                    primer_salto:ultimos_backticks
-                ].strip()
-
-        # Parsear la respuesta JSON para obtener el nivel de certeza
-        try:
-            if isinstance(respuesta_supervisor_json, str):
-                data = json.loads(respuesta_supervisor_json)
-            else:
-                data = respuesta_supervisor_json
-            nivel_de_certeza = data.get("nivel_de_certeza", 0)
-        except json.JSONDecodeError as e:
-            print("Error al parsear la respuesta JSON:", e)
-            nivel_de_certeza = 0
+        # Obtener el nivel de certeza (salida estructurada o JSON en texto libre)
+        _, nivel_de_certeza = supervisorMedico.interpretar_respuesta_supervisor(
+            respuesta_supervisor_json
+        )
 
         print("El nivel de certeza es:", nivel_de_certeza)
 
@@ -175,7 +177,7 @@ def main():
     if usoGeneracionOrdenMedica and nivel_de_certeza >= 70:
         # Se parsea la respuesta si es un string
         if isinstance(respuesta_asistente_medico, str):
-            respuesta_asistente_medico = funcionesExtras.parse_respuesta_asistente_medico(respuesta_asistente_medico)
+            respuesta_asistente_medico = funcionesExtras.interpretar_respuesta_asistente_medico(respuesta_asistente_medico)
         generacionOrdenMedica.generar_orden_medica_pdf(
             openai_client,
             datos_paciente,
@@ -196,11 +198,42 @@ def main():
 app = Flask(__name__)
 # Clave secreta en entorno, para firmar cookies de sesión
 app.secret_key = os.environ.get("FLASK_SECRET_KEY")
-# Configuramos la duración máxima de la sesión
+# Configuramos la duración máxima de la sesión (y de sus datos en el servidor)
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes=DURACION_SESION)
+# Los datos de la sesión se guardan en el servidor (Redis o memoria); la cookie sólo lleva el id
+sesionServidor.instalar(app)
+# Modo asíncrono: se activa al servir la aplicación con `servidorAsgi`
+app.config["MODO_ASYNC"] = False
+# Mostrar el resultado en streaming (SSE) en lugar de esperar la respuesta completa
+app.config["RESULTADO_STREAMING"] = os.environ.get("RESULTADO_STREAMING", "1") == "1"
+# Depuración: generar nuevas preguntas en cada visita a /preguntas (sin usar la caché)
+app.config["PREGUNTAS_REGENERAR"] = os.environ.get("PREGUNTAS_REGENERAR", "0") == "1"
+# Con RAG_BACKEND=local, el índice vectorial se carga al iniciar y no en la primera consulta
+consultaBaseConocimiento.precargar_backend()
+# El esqueleto de la orden médica (logo decodificado) se construye al iniciar y no en la primera orden
+generacionOrdenMedica.obtener_plantilla()
 
 load_dotenv(override=True)
 
+def nivel_de_certeza_supervisor(supervisor_response):
+    """
+    Extrae el nivel de certeza de la respuesta del supervisor (`supervisorMedico.interpretar_respuesta_supervisor`).
+    Retorna la tupla (respuesta sin delimitadores, nivel_de_certeza).
+    """
+    supervisor_response, nivel_de_certeza = supervisorMedico.interpretar_respuesta_supervisor(
+        supervisor_response
+    )
+    app.logger.debug(
+        "Supervisor Medico - El nivel de certeza es: " + str(nivel_de_certeza)
+    )
+    return supervisor_response, nivel_de_certeza
+
+
+def evento_sse(evento, datos):
+    """Formatea un evento Server-Sent Events con datos en JSON."""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
 @app.route("/", methods=["GET", "POST"])
 def registro():
     if request.method == "POST":
@@ -249,6 +282,7 @@ def sintomas():
         sintomas_str = request.form.get("sintomas")
         sintomas_lista = datosBasicosYSintomas.parse_sintomas_web(sintomas_str)
         session["sintomas"] = sintomas_lista
+        session.pop("preguntas", None)  # Los síntomas cambiaron: se obtienen nuevas preguntas
         return redirect(url_for("preguntas"))
 
     # GET
@@ -267,16 +301,15 @@ def preguntas():
     app.logger.debug(f"Datos en sesión: {datos}")
     app.logger.debug(f"Síntomas en sesión: {sintomas}")
 
-    # Forzar la generación de nuevas preguntas para depuración:
-    if "preguntas" in session:
-        del session["preguntas"]
-
-    if "preguntas" not in session:
+    # Las preguntas se generan una vez por sesión; en depuración se pueden forzar nuevas
+    # preguntas en cada GET con PREGUNTAS_REGENERAR=1 (el POST siempre usa las mostradas)
+    regenerar = app.config["PREGUNTAS_REGENERAR"] and request.method == "GET"
+    if regenerar or "preguntas" not in session:
         app.logger.debug(
-            "No se encontraron preguntas en sesión. Generando nuevas preguntas..."
+            "No se encontraron preguntas en sesión. Obteniendo preguntas..."
         )
-        preguntas_generadas = datosBasicosYSintomas.realizar_preguntas_relevantes_web(
-            datos, sintomas, openai_client
+        preguntas_generadas = datosBasicosYSintomas.obtener_preguntas_relevantes_web(
+            datos, sintomas, openai_client, regenerar=regenerar
         )
         session["preguntas"] = preguntas_generadas
         app.logger.debug(f"Preguntas generadas: {preguntas_generadas}")
@@ -289,38 +322,41 @@ def preguntas():
             respuesta = request.form.get(f"pregunta_{i}")
             respuestas.append({"pregunta": pregunta, "respuesta": respuesta})
         session["respuestas"] = respuestas
+        if app.config["RESULTADO_STREAMING"]:
+            return redirect(url_for("resultado_stream"))
         return redirect(url_for("resultado"))
 
     # GET
     return render_template("preguntas.html", preguntas=preguntas_generadas)
 
 
-@app.route("/resultado")
-def resultado():
-    if (
-        "datos" not in session
-        or "sintomas" not in session
-        or "respuestas" not in session
-    ):
-        app.logger.debug("Falta información en la sesión. Redirigiendo a registro.")
-        return redirect(url_for("registro"))
-
-    # Recuperar datos de la sesión
-    datos = session.get("datos")
-    sintomas = session.get("sintomas")
-    respuestas = session.get("respuestas")
-
-    # Paso 1: Moderación (ejemplo con moderador_pasada_web)
-    moderacion_ok, categorias = moderador.moderacion_pasada_web(
-        openai_client, datos, sintomas, respuestas
-    )
+def calcular_resultado(datos, sintomas, respuestas, consulta_id):
+    """
+    Ejecuta la consulta completa y retorna (resultado, degradado): el diccionario que muestra
+    `resultado.html` e indica si alguna respuesta fue en modo degradado (LLM no disponible).
+    """
+    # Pasos 1 a 4: Moderación, búsqueda en base de conocimiento, recomendación médica y
+    # supervisor médico. El RAG se ejecuta en paralelo con la moderación y se descarta
+    # si la consulta es rechazada.
+    app.logger.debug("Flujo de consulta Iniciando")
+    if app.config["MODO_ASYNC"]:
+        # La corrutina se ejecuta en el event loop de larga vida del proceso (un cliente
+        # AsyncOpenAI y un pool redis.asyncio compartidos), no en un loop por solicitud
+        flujo = bucleEventos.ejecutar(
+            flujoConsulta.ejecutar_consulta_async(None, datos, sintomas, respuestas)
+        )
+    else:
+        flujo = flujoConsulta.ejecutar_consulta_web(openai_client, datos, sintomas, respuestas)
+    moderacion_ok = flujo["moderacion_ok"]
+    categorias = flujo["categorias"]
 
     # Variables iniciales
     base_conocimiento = ""
     respuesta_asistente_medico = ""
     supervisor_response = ""
     nivel_de_certeza = 0
-    orden_filepath = ""
+    orden_job_id = ""
+    degradado = False
 
     if not moderacion_ok:
         # Si la moderación falla, se puede notificar al usuario y detener el flujo
@@ -329,67 +365,32 @@ def resultado():
             + ", ".join(categorias)
         )
         respuesta_asistente_medico = "Consulta rechazada por moderación."
+        # Un rechazo por moderación no disponible es degradado: no se guarda
+        degradado = moderador.moderacion_no_disponible(categorias)
     else:
-        # Paso 2: Búsqueda en base de conocimiento
-        base_conocimiento = consultaBaseConocimiento.busqueda_base_conocimiento(
-            openai_client, sintomas, respuestas
-        )
-
-        # Paso 3: Recomendación médica web
-        app.logger.debug("Asistente Medico Iniciando")
-        respuesta_asistente_medico = asistenteMedico.realizar_recomendacion_medica_web(
-            openai_client, datos, sintomas, respuestas, base_conocimiento
+        base_conocimiento = flujo["base_conocimiento"]
+        respuesta_asistente_medico = flujo["respuesta_asistente_medico"]
+        supervisor_response = flujo["supervisor_response"]
+        degradado = gatewayLLM.es_degradada(respuesta_asistente_medico) or gatewayLLM.es_degradada(
+            supervisor_response
         )
 
-        # Paso 4: Llamada al Supervisor Médico para validar la recomendación
-        app.logger.debug("Analisis de Supervisor Medico")
-        supervisor_response = supervisorMedico.revision_recomendacion_medica(
-            openai_client,
-            datos,
-            sintomas,
-            respuestas,
-            base_conocimiento,
-            respuesta_asistente_medico,
-        )
-
-        # Eliminar delimitadores Markdown, si existen
-
-        if supervisor_response.startswith("```"):
-            primer_salto = supervisor_response.find("\n")
-            ultimos_backticks = supervisor_response.rfind("```")
-            if primer_salto != -1 and ultimos_backticks != -1:
-                supervisor_response = supervisor_response[
-                    primer_salto:ultimos_backticks
-                ].strip()
-
-        # Parsear la respuesta JSON para extraer el nivel de certeza
-        try:
-            if isinstance(supervisor_response, str):
-                data = json.loads(supervisor_response)
-            else:
-                data = supervisor_response
-            nivel_de_certeza = data.get("nivel_de_certeza", 0)
-
-        except json.JSONDecodeError as e:
-            app.logger.error("Error al parsear la respuesta JSON: " + str(e))
-            nivel_de_certeza = 0
-
-        app.logger.debug(
-            "Supervisor Medico - El nivel de certeza es: " + str(nivel_de_certeza)
-        )
+        supervisor_response, nivel_de_certeza = nivel_de_certeza_supervisor(supervisor_response)
 
         # Paso 5: Generación de la orden médica solo si el nivel de certeza es mayor a 80
         if nivel_de_certeza >= 70:
             app.logger.debug("Generación Orden Medica - Iniciando:")
             if isinstance(respuesta_asistente_medico, str):
-                respuesta_asistente_medico = funcionesExtras.parse_respuesta_asistente_medico(respuesta_asistente_medico)
-            orden_filepath = generacionOrdenMedica.generar_orden_medica_web(
+                respuesta_asistente_medico = funcionesExtras.interpretar_respuesta_asistente_medico(respuesta_asistente_medico)
+            # La orden se genera en segundo plano; `/download` espera su término
+            orden_job_id = colaOrdenes.encolar_orden(
                 openai_client,
                 datos,
                 sintomas,
                 respuestas,
                 base_conocimiento,
                 respuesta_asistente_medico,
+                trabajo_id=consulta_id,
             )
         else:
             # Se puede notificar al paciente que, con la información entregada, no se genera orden médica.
@@ -399,29 +400,331 @@ def resultado():
             )
             app.logger.debug("respuesta_asistente_medico=" + respuesta_asistente_medico)
 
-    session["orden_filepath"] = orden_filepath
+    resultado = {
+        "moderacion_ok": moderacion_ok,
+        "categorias": categorias,
+        "respuesta_asistente_medico": respuesta_asistente_medico,
+        "supervisor_response": supervisor_response,
+        "nivel_de_certeza": nivel_de_certeza,
+        "orden_job_id": orden_job_id,
+        # Para volver a generar la orden si el almacenamiento la eliminó (`reencolar_orden`)
+        "base_conocimiento": base_conocimiento if orden_job_id else "",
+    }
+    return resultado, degradado
+
+
+def orden_disponible(resultado):
+    """
+    Indica si la orden médica de un resultado guardado se puede descargar: no tiene orden,
+    su trabajo sigue en curso o su PDF está en `almacenOrdenes` (que lo elimina por edad o
+    tamaño antes de que expire el resultado).
+    """
+    orden_job_id = resultado["orden_job_id"]
+    if not orden_job_id or colaOrdenes.estado_orden(orden_job_id) == colaOrdenes.ESTADO_PENDIENTE:
+        return True
+    return almacenOrdenes.obtener(orden_job_id) is not None
+
+
+def reencolar_orden(resultado, datos, sintomas, respuestas):
+    """Vuelve a encolar la orden médica de un resultado guardado cuyo PDF ya no existe."""
+    app.logger.debug(f"La orden {resultado['orden_job_id']} ya no existe; se vuelve a generar.")
+    colaOrdenes.encolar_orden(
+        openai_client,
+        datos,
+        sintomas,
+        respuestas,
+        resultado["base_conocimiento"],
+        resultado["respuesta_asistente_medico"],
+        trabajo_id=resultado["orden_job_id"],
+    )
+
+
+def obtener_resultado(datos, sintomas, respuestas):
+    """
+    Retorna el resultado de la consulta: el guardado si ya se ejecutó (volviendo a encolar su
+    orden médica si ya no existe), o el de una nueva ejecución, que se guarda. Los envíos
+    simultáneos de la misma consulta esperan a la primera. Lanza `TimeoutError` si la
+    consulta en curso no termina a tiempo.
+    """
+    consulta_id = resultadosConsulta.id_consulta(datos, sintomas, respuestas)
+    resultado = resultadosConsulta.obtener(consulta_id)
+    if resultado is not None and orden_disponible(resultado):
+        app.logger.debug(f"Resultado de la consulta {consulta_id} reutilizado.")
+        return resultado
+    with resultadosConsulta.bloqueo(consulta_id):
+        # Otra solicitud pudo terminar la consulta (o reencolar su orden) mientras se esperaba el bloqueo
+        resultado = resultadosConsulta.obtener(consulta_id)
+        if resultado is None:
+            resultado, degradado = calcular_resultado(datos, sintomas, respuestas, consulta_id)
+            if not degradado:
+                resultadosConsulta.guardar(consulta_id, resultado)
+        elif not orden_disponible(resultado):
+            reencolar_orden(resultado, datos, sintomas, respuestas)
+    return resultado
+
+
+@app.route("/resultado")
+def resultado():
+    if (
+        "datos" not in session
+        or "sintomas" not in session
+        or "respuestas" not in session
+    ):
+        app.logger.debug("Falta información en la sesión. Redirigiendo a registro.")
+        return redirect(url_for("registro"))
+
+    # Recuperar datos de la sesión
+    datos = session.get("datos")
+    sintomas = session.get("sintomas")
+    respuestas = session.get("respuestas")
+
+    try:
+        resultado_consulta = obtener_resultado(datos, sintomas, respuestas)
+    except TimeoutError:
+        return (
+            "La consulta aún se está procesando, intente nuevamente en unos segundos.",
+            503,
+            {"Retry-After": "5"},
+        )
+    if moderador.moderacion_no_disponible(resultado_consulta["categorias"]):
+        # La moderación falla cerrada: no se muestra como rechazo por el contenido
+        return moderador.MODERACION_NO_DISPONIBLE, 503, {"Retry-After": "30"}
+
+    session["orden_job_id"] = resultado_consulta["orden_job_id"]
 
     return render_template(
         "resultado.html",
         datos=datos,
         sintomas=sintomas,
         respuestas=respuestas,
-        respuesta_asistente_medico=respuesta_asistente_medico,
-        orden_filepath=orden_filepath,
-        nivel_de_certeza=nivel_de_certeza,
-        supervisor_response=supervisor_response,
+        respuesta_asistente_medico=resultado_consulta["respuesta_asistente_medico"],
+        orden_job_id=resultado_consulta["orden_job_id"],
+        nivel_de_certeza=resultado_consulta["nivel_de_certeza"],
+        supervisor_response=resultado_consulta["supervisor_response"],
+    )
+
+
+@app.route("/resultado_stream")
+def resultado_stream():
+    """Página de resultado que recibe la recomendación por eventos (SSE) desde `/resultado/eventos`."""
+    if (
+        "datos" not in session
+        or "sintomas" not in session
+        or "respuestas" not in session
+    ):
+        app.logger.debug("Falta información en la sesión. Redirigiendo a registro.")
+        return redirect(url_for("registro"))
+
+    # Identificador de la consulta, que es también el del trabajo de la orden médica que se
+    # encola durante el streaming. Se guarda antes porque la sesión se guarda al iniciar la respuesta.
+    session["orden_job_id"] = resultadosConsulta.id_consulta(
+        session.get("datos"), session.get("sintomas"), session.get("respuestas")
+    )
+
+    return render_template(
+        "resultado_stream.html",
+        datos=session.get("datos"),
+        sintomas=session.get("sintomas"),
+        respuestas=session.get("respuestas"),
+    )
+
+
+def evento_moderacion(moderacion_ok, categorias):
+    """Datos del evento SSE "moderacion"; `no_disponible` distingue la moderación caída de un rechazo."""
+    return {
+        "moderacion_ok": moderacion_ok,
+        "categorias": categorias,
+        "no_disponible": moderador.moderacion_no_disponible(categorias),
+    }
+
+
+def eventos_resultado_guardado(resultado_consulta):
+    """Eventos SSE de una consulta ya terminada, en el mismo orden que la consulta en streaming."""
+    yield evento_sse("inicio", {})
+    yield evento_sse(
+        "moderacion",
+        evento_moderacion(resultado_consulta["moderacion_ok"], resultado_consulta["categorias"]),
+    )
+    if not resultado_consulta["moderacion_ok"]:
+        yield evento_sse("fin", {"nivel_de_certeza": 0})
+        return
+    nivel_de_certeza = resultado_consulta["nivel_de_certeza"]
+    yield evento_sse("supervisor", {"nivel_de_certeza": nivel_de_certeza})
+    yield evento_sse("recomendacion", resultado_consulta["respuesta_asistente_medico"])
+    if resultado_consulta["orden_job_id"]:
+        yield evento_sse("orden", {"url": url_for("download")})
+    yield evento_sse("fin", {"nivel_de_certeza": nivel_de_certeza})
+
+
+@app.route("/resultado/eventos")
+def resultado_eventos():
+    """
+    Transmite el resultado de la consulta como Server-Sent Events: primero la moderación,
+    luego la recomendación fragmento a fragmento, el veredicto del supervisor y, al final,
+    el enlace a la orden médica. Si la consulta ya terminó, se envía su resultado guardado.
+    """
+    if (
+        "datos" not in session
+        or "sintomas" not in session
+        or "respuestas" not in session
+        or "orden_job_id" not in session
+    ):
+        return "Falta información en la sesión.", 400
+
+    datos = session.get("datos")
+    sintomas = session.get("sintomas")
+    respuestas = session.get("respuestas")
+    orden_job_id = session.get("orden_job_id")
+    consulta_id = resultadosConsulta.id_consulta(datos, sintomas, respuestas)
+
+    def generar_eventos_consulta():
+        yield evento_sse("inicio", {})
+
+        base_conocimiento = ""
+        respuesta_asistente_medico = ""
+        supervisor_response = ""
+        nivel_de_certeza = 0
+        degradado = False
+        resultado_consulta = {
+            "moderacion_ok": False,
+            "categorias": [],
+            "respuesta_asistente_medico": "",
+            "supervisor_response": "",
+            "nivel_de_certeza": 0,
+            "orden_job_id": "",
+            "base_conocimiento": "",
+        }
+        for evento, contenido in flujoConsulta.ejecutar_consulta_stream(
+            openai_client, datos, sintomas, respuestas
+        ):
+            if evento == "moderacion":
+                resultado_consulta.update(contenido)
+                yield evento_sse(
+                    "moderacion", evento_moderacion(contenido["moderacion_ok"], contenido["categorias"])
+                )
+                if not contenido["moderacion_ok"]:
+                    # Un rechazo por moderación no disponible es degradado: no se guarda
+                    if not moderador.moderacion_no_disponible(contenido["categorias"]):
+                        resultadosConsulta.guardar(consulta_id, resultado_consulta)
+                    yield evento_sse("fin", {"nivel_de_certeza": 0})
+                    return
+            elif evento == "base_conocimiento":
+                base_conocimiento = contenido
+            elif evento == "token":
+                yield evento_sse("token", {"texto": contenido})
+            elif evento == "recomendacion":
+                respuesta_asistente_medico = contenido
+            elif evento == "supervisor":
+                degradado = degradado or gatewayLLM.es_degradada(contenido)
+                supervisor_response, nivel_de_certeza = nivel_de_certeza_supervisor(contenido)
+                yield evento_sse("supervisor", {"nivel_de_certeza": nivel_de_certeza})
+
+        degradado = degradado or gatewayLLM.es_degradada(respuesta_asistente_medico)
+        # Mismo diccionario que en `/resultado`, a partir del texto completo
+        respuesta_asistente_medico = funcionesExtras.interpretar_respuesta_asistente_medico(
+            respuesta_asistente_medico
+        )
+        yield evento_sse("recomendacion", respuesta_asistente_medico)
+
+        if nivel_de_certeza >= 70:
+            colaOrdenes.encolar_orden(
+                openai_client,
+                datos,
+                sintomas,
+                respuestas,
+                base_conocimiento,
+                respuesta_asistente_medico,
+                trabajo_id=orden_job_id,
+            )
+            resultado_consulta.update(orden_job_id=orden_job_id, base_conocimiento=base_conocimiento)
+            yield evento_sse("orden", {"url": url_for("download")})
+
+        if not degradado:
+            resultado_consulta.update(
+                respuesta_asistente_medico=respuesta_asistente_medico,
+                supervisor_response=supervisor_response,
+                nivel_de_certeza=nivel_de_certeza,
+            )
+            resultadosConsulta.guardar(consulta_id, resultado_consulta)
+
+        yield evento_sse("fin", {"nivel_de_certeza": nivel_de_certeza})
+
+    def generar_eventos():
+        resultado_consulta = resultadosConsulta.obtener(consulta_id)
+        if resultado_consulta is None or not orden_disponible(resultado_consulta):
+            try:
+                with resultadosConsulta.bloqueo(consulta_id):
+                    # Otra solicitud pudo terminar la consulta mientras se esperaba el bloqueo
+                    resultado_consulta = resultadosConsulta.obtener(consulta_id)
+                    if resultado_consulta is None:
+                        yield from generar_eventos_consulta()
+                        return
+                    if not orden_disponible(resultado_consulta):
+                        reencolar_orden(resultado_consulta, datos, sintomas, respuestas)
+            except TimeoutError:
+                # Sin evento "fin": la página informa la pérdida de conexión y el paciente reintenta
+                app.logger.debug(f"La consulta {consulta_id} sigue en curso en otra solicitud.")
+                return
+        yield from eventos_resultado_guardado(resultado_consulta)
+
+    return Response(
+        stream_with_context(generar_eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 @app.route("/download")
 def download():
-    orden_filepath = session.get("orden_filepath")
-    if orden_filepath and os.path.exists(orden_filepath):
-        directory, filename = os.path.split(orden_filepath)
-        return send_from_directory(directory, filename, as_attachment=True)
-    else:
+    orden_job_id = session.get("orden_job_id")
+    if not orden_job_id:
+        return "No hay archivo disponible para descargar.", 404
+
+    # Esperar a que termine la generación de la orden médica en segundo plano. Si el trabajo
+    # no es de este proceso (otro worker o un reinicio), se busca directamente en el almacenamiento.
+    try:
+        colaOrdenes.esperar_orden(orden_job_id, timeout=ORDEN_TIMEOUT_DESCARGA)
+    except TimeoutError:
+        return (
+            "La orden médica aún se está generando, intente nuevamente en unos segundos.",
+            503,
+            {"Retry-After": "5"},
+        )
+
+    orden = almacenOrdenes.obtener(orden_job_id)
+    if orden is None:
         return "No hay archivo disponible para descargar.", 404
 
+    nombre_archivo = generacionOrdenMedica.nombre_archivo_orden(
+        session.get("datos") or {}, datetime.fromtimestamp(orden.creada)
+    )
+    # En modo disco se envía el archivo por su ruta absoluta; en memoria o Redis, los bytes
+    return send_file(
+        orden.ruta or io.BytesIO(orden.contenido),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=nombre_archivo,
+    )
+
+
+@app.route("/orden/estado")
+def orden_estado():
+    """Estado de la generación de la orden médica de la sesión, para consultar periódicamente."""
+    estado = colaOrdenes.estado_orden(session.get("orden_job_id"))
+    return {"estado": estado or "sin_orden"}
+
+
+@app.route("/metricas")
+def metricas():
+    """Métricas de las cachés del flujo (aciertos, fallos y tasa de aciertos) y del gateway LLM."""
+    return {
+        "cache_semantica": cacheSemantica.estadisticas(),
+        "cache_embeddings": cacheEmbeddings.estadisticas(),
+        "cache_preguntas": datosBasicosYSintomas.estadisticas_cache_preguntas(),
+        "cache_moderacion": moderador.estadisticas_cache_moderacion(),
+        "gateway_llm": gatewayLLM.estadisticas(),
+    }
+
 
 @app.route('/favicon.ico')
 def favicon():
@@ -432,7 +735,7 @@ def favicon():
     )
 
 
-def Lee_Parametros() -> tuple[bool, int, str]:
+def Lee_Parametros() -> tuple[bool, int, str, bool, bool, int]:
     parser = argparse.ArgumentParser(
         description="Atención PrimarIA - App Asistente Médico",
         add_help=True,
@@ -463,17 +766,38 @@ def Lee_Parametros() -> tuple[bool, int, str]:
         required=False,
         help=f"Activar el modo de depuración de Flask, default: {DEBUG_DEFAULT}.",
     )
+    parser.add_argument(
+        "--async",
+        dest="modo_async",
+        action="store_true",
+        default=False,
+        help="Ejecutar el servidor en modo asíncrono (ASGI con uvicorn), default: False.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS_DEFAULT,
+        required=False,
+        help=f"Cantidad de procesos worker del servidor asíncrono, default: {WORKERS_DEFAULT}.",
+    )
     args = parser.parse_args()
 
-    return args.runserver, args.port, args.host, args.debug
+    return args.runserver, args.port, args.host, args.debug, args.modo_async, args.workers
 
 
 # ----------------------------
 # Selección del Modo de Ejecución
 # ----------------------------
 if __name__ == "__main__":
-    run_server, flask_server_port, flask_host, is_debug_mode = Lee_Parametros()
-    if run_server:
+    run_server, flask_server_port, flask_host, is_debug_mode, modo_async, workers = Lee_Parametros()
+    if run_server and modo_async:
+        import servidorAsgi
+
+        servidorAsgi.ejecutar(flask_host, flask_server_port, workers, is_debug_mode)
+    elif run_server:
+        # Con el recargador de depuración, sólo el proceso que atiende crea el pool de diagramación
+        if not is_debug_mode or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            servicioRenderPdf.iniciar()
         app.run(host=flask_host, port=flask_server_port, debug=is_debug_mode, load_dotenv=True)
     else:
         main()
@@ -484,3 +808,6 @@ if __name__ == "__main__":
 # Ejecutar como servidor web:
 # python main.py --runserver --port 8000 --host localhost
 # http://localhost:8000/
+
+# Ejecutar como servidor web asíncrono (ASGI), con 4 procesos worker:
+# python main.py --runserver --async --workers 4 --port 8000 --host localhost
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene los modelos (pydantic) de las respuestas estructuradas de los LLM.
+
+Con salida estructurada, las llamadas piden al modelo un JSON restringido por el esquema del
+modelo pydantic (`response_format` de tipo `json_schema` en modo estricto) y la respuesta se
+valida directamente contra ese modelo, sin expresiones regulares ni limpieza de texto.
+
+Variables de entorno opcionales:
+  - SALIDA_ESTRUCTURADA: usar salida estructurada con esquema JSON (1) o texto libre (0).
+"""
+
+import json
+import logging
+import os
+
+from pydantic import BaseModel, Field, ValidationError
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+SALIDA_ESTRUCTURADA = os.environ.get("SALIDA_ESTRUCTURADA", "1") == "1"
+"""Indica si las llamadas piden salida estructurada con esquema JSON"""
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluacionCoherencia(BaseModel):
+    """Evaluación de coherencia médica de la información del paciente."""
+
+    coherencia: float = Field(ge=0, le=100, description="Porcentaje de coherencia médica, entre 0 y 100.")
+    razones: list[str] = Field(description="Razones breves que justifican el porcentaje de coherencia.")
+    confianza: float = Field(ge=0, le=1, description="Confianza en la evaluación, entre 0 y 1.")
+
+
+class PreguntasSeguimiento(BaseModel):
+    """Preguntas de seguimiento para complementar los síntomas del paciente."""
+
+    preguntas: list[str] = Field(description="Hasta 5 preguntas claras y específicas para el paciente.")
+
+
+class Examen(BaseModel):
+    """Examen o procedimiento médico sugerido."""
+
+    nombre: str = Field(description="Nombre del examen o procedimiento.")
+
+
+class RecomendacionMedica(BaseModel):
+    """Recomendación del asistente médico, con las mismas secciones que el formato markdown."""
+
+    analisis: str = Field(description="Análisis de los síntomas y factores del paciente.")
+    diagnosticos: str = Field(description="Posibles diagnósticos.")
+    recomendaciones: str = Field(description="Recomendaciones y pasos siguientes, con medicamentos si corresponde.")
+    examenes: list[Examen] = Field(description="Exámenes o procedimientos médicos sugeridos para confirmar el diagnóstico.")
+    conclusion: str = Field(description="Conclusión.")
+
+
+class EvaluacionSupervisor(BaseModel):
+    """Evaluación del supervisor médico sobre la recomendación del asistente."""
+
+    nivel_de_certeza: int = Field(ge=0, le=100, description="Nivel de certeza del diagnóstico, entre 0 y 100.")
+    sintesis_antecedentes: str = Field(description="Síntesis de los antecedentes del paciente.")
+    diagnostico_o_recomendacion: str = Field(description="Diagnóstico, o recomendación de acudir al médico.")
+    recomendaciones_adicionales: str = Field(description="Recomendaciones adicionales, vacío si no aplica.")
+
+
+def _esquema_estricto(esquema):
+    """
+    Adapta un esquema JSON de pydantic al modo estricto de OpenAI: todos los campos
+    requeridos y sin propiedades adicionales en cada objeto.
+    """
+    if isinstance(esquema, dict):
+        if esquema.get("type") == "object" and "properties" in esquema:
+            esquema["additionalProperties"] = False
+            esquema["required"] = list(esquema["properties"])
+        for valor in esquema.values():
+            _esquema_estricto(valor)
+    elif isinstance(esquema, list):
+        for valor in esquema:
+            _esquema_estricto(valor)
+    return esquema
+
+
+def formato_respuesta(modelo):
+    """Parámetro `response_format` que restringe la respuesta al esquema del modelo."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": modelo.__name__,
+            "schema": _esquema_estricto(modelo.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+def validar_respuesta(modelo, contenido):
+    """Valida el JSON de la respuesta contra el modelo. Retorna la instancia, o None si no es válida."""
+    try:
+        return modelo.model_validate_json(contenido or "")
+    except ValidationError as e:
+        logger.warning(f"Respuesta no válida para {modelo.__name__}: {e.error_count()} errores.")
+        return None
+
+
+def extraer_json(texto):
+    """
+    Retorna el JSON de una respuesta en texto libre: el contenido de un bloque de código
+    markdown (```json ... ```) si existe, o el texto completo sin espacios en los extremos.
+    """
+    texto = (texto or "").strip()
+    if texto.startswith("```"):
+        primer_salto = texto.find("\n")
+        ultimos_backticks = texto.rfind("```")
+        if primer_salto != -1 and ultimos_backticks > primer_salto:
+            texto = texto[primer_salto:ultimos_backticks].strip()
+    return texto
+
+
+def cargar_json(texto):
+    """Carga el JSON de una respuesta en texto libre (ver `extraer_json`). Retorna None si no es válido."""
+    try:
+        return json.loads(extraer_json(texto))
+    except json.JSONDecodeError:
+        return None
@@ -6,14 +6,31 @@ Este módulo contiene los diferentes moderadores que son utilizados en el flujo.
 Funciones disponibles:
 - moderador_generico: Se activa revisión con moderador genérico de Open AI.
 - moderador_intencion: Moderador que controla que las preguntas estén en el ámbito medico. (REVISAR)
+
+La coherencia médica se pide con salida estructurada (`modelosRespuesta.EvaluacionCoherencia`:
+coherencia, razones y confianza) validada con pydantic. Los resultados de bajo riesgo (sin
+categorías del moderador genérico y coherencia aprobada) se guardan en una caché en memoria
+por hash del texto evaluado, para no repetir las llamadas ante la misma entrada.
+
+Si el LLM no está disponible, la moderación falla cerrada: la consulta se rechaza con
+MODERACION_NO_DISPONIBLE (ver `moderacion_no_disponible`) en lugar de aprobarse sin evaluar.
+
+Variables de entorno opcionales:
+  - MODERACION_CACHE: usar la caché de moderación (1) o no (0).
+  - MODERACION_CACHE_TTL: segundos de vida de cada resultado en la caché.
 """
 
+import hashlib
 import os
 
 from dotenv import find_dotenv, load_dotenv
-from openai import OpenAI
 from rich import traceback
 
+import conexionOpenAI
+import gatewayLLM
+from cacheMemoria import CacheLRU
+from modelosRespuesta import EvaluacionCoherencia, SALIDA_ESTRUCTURADA, formato_respuesta, validar_respuesta
+
 # Activa traceback para mejorar la depuración de excepciones
 traceback.install()
 
@@ -21,17 +38,51 @@ traceback.install()
 if load_dotenv(find_dotenv(usecwd=True)):
     print("Archivo '.env' cargado exitosamente.")
 
-# Configuración de las keys para APIs
-openai_api_key = os.environ.get("OPENAI_API_KEY")
+# Cliente de OpenAI compartido del proceso (lee OPENAI_API_KEY del entorno)
+client = conexionOpenAI.obtener_cliente()
 
-client = OpenAI(api_key=openai_api_key)
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+UMBRAL_COHERENCIA = 70
+"""Porcentaje mínimo de coherencia médica para aprobar la consulta"""
 
+MODERACION_NO_DISPONIBLE = "Moderación no disponible: no es posible evaluar la consulta en este momento, intente nuevamente más tarde."
+"""Categoría de rechazo cuando el moderador genérico o la coherencia médica no están disponibles"""
 
-def evaluar_coherencia_medica(datos_paciente_json, sintomas, respuestas_adicionales_json):
-    """
-    Evalúa la coherencia médica de la información del paciente.
-    Retorna un porcentaje de coherencia basado en la lógica de un experto médico.
-    """
+MODERACION_CACHE = os.environ.get("MODERACION_CACHE", "1") == "1"
+"""Indica si se reutilizan los resultados de moderación de bajo riesgo"""
+
+MODERACION_CACHE_TTL = int(os.environ.get("MODERACION_CACHE_TTL", "3600"))
+"""Segundos que se reutiliza un resultado de moderación"""
+
+MODERACION_CACHE_MAX_ITEMS = 2048
+"""Cantidad máxima de resultados en la caché de moderación"""
+
+_cache_moderacion = CacheLRU(max_items=MODERACION_CACHE_MAX_ITEMS, ttl=MODERACION_CACHE_TTL)
+
+
+def _clave_cache(tipo, texto):
+    """Clave de la caché de moderación: tipo de moderador y hash del texto evaluado."""
+    return f"{tipo}:{hashlib.sha256(texto.encode('utf-8')).hexdigest()}"
+
+
+def _obtener_cache(clave):
+    return _cache_moderacion.obtener(clave) if MODERACION_CACHE else None
+
+
+def _guardar_cache(clave, valor):
+    if MODERACION_CACHE:
+        _cache_moderacion.guardar(clave, valor)
+
+
+def estadisticas_cache_moderacion():
+    """Retorna las métricas de la caché de moderación."""
+    return _cache_moderacion.estadisticas()
+
+
+def construir_mensaje_coherencia(datos_paciente_json, sintomas, respuestas_adicionales_json):
+    """Construye el mensaje con la información del paciente a evaluar por coherencia médica."""
     mensaje_evaluacion = (
         f"Evaluar la coherencia médica de la siguiente información del paciente en atención primaria: \n"
         f"- Edad: {datos_paciente_json.get('edad', 'No especificado')} años\n"
@@ -45,28 +96,92 @@ def evaluar_coherencia_medica(datos_paciente_json, sintomas, respuestas_adiciona
         for r in respuestas_adicionales_json:
             mensaje_evaluacion += f"  - {r.get('pregunta', 'Sin pregunta')}: {r.get('respuesta', 'Sin respuesta')}\n"
     
-    mensaje_evaluacion += "\nDevuelve solo un número entre 0 y 100 indicando el porcentaje de coherencia médica."
-    
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Eres un médico experto en atención primaria evaluando información médica."},
-            {"role": "user", "content": mensaje_evaluacion}
-        ]
+    if SALIDA_ESTRUCTURADA:
+        mensaje_evaluacion += (
+            "\nIndica el porcentaje de coherencia médica (0 a 100), las razones principales "
+            "y tu confianza en la evaluación (0 a 1)."
+        )
+    else:
+        mensaje_evaluacion += "\nDevuelve solo un número entre 0 y 100 indicando el porcentaje de coherencia médica."
+    return [
+        {"role": "system", "content": "Eres un médico experto en atención primaria evaluando información médica."},
+        {"role": "user", "content": mensaje_evaluacion}
+    ]
+
+def solicitud_coherencia(datos_paciente_json, sintomas, respuestas_adicionales_json):
+    """Parámetros de la llamada de coherencia médica (con esquema JSON si hay salida estructurada)."""
+    solicitud = {
+        "model": "gpt-4o-mini",
+        "messages": construir_mensaje_coherencia(datos_paciente_json, sintomas, respuestas_adicionales_json),
+    }
+    if SALIDA_ESTRUCTURADA:
+        solicitud["response_format"] = formato_respuesta(EvaluacionCoherencia)
+    return solicitud
+
+def interpretar_evaluacion(response):
+    """
+    Extrae la evaluación de coherencia (`EvaluacionCoherencia`) desde la respuesta del modelo.
+    Si la respuesta no es válida, se asume que no es coherente (coherencia 0).
+    """
+    contenido = response.choices[0].message.content
+    if SALIDA_ESTRUCTURADA:
+        evaluacion = validar_respuesta(EvaluacionCoherencia, contenido)
+    else:
+        try:
+            evaluacion = EvaluacionCoherencia(coherencia=float(contenido.strip()), razones=[], confianza=1)
+        except ValueError:
+            evaluacion = None
+    if evaluacion is None:
+        evaluacion = EvaluacionCoherencia(coherencia=0, razones=["Respuesta no válida"], confianza=0)
+
+    print(
+        f"Porcentaje de coherencia médica determinado: {evaluacion.coherencia}% "
+        f"(confianza {evaluacion.confianza}): {'; '.join(evaluacion.razones)}"
     )
-    
-    try:
-        coherencia = float(response.choices[0].message.content.strip())
-    except ValueError:
-        coherencia = 0  # En caso de error, asumimos que no es coherente
-    
-    print(f"Porcentaje de coherencia médica determinado: {coherencia}%")
-    return coherencia
+    return evaluacion
 
-def analisis_moderador_generico(client, datos_paciente_json, sintomas, respuestas_adicionales_json):
+def interpretar_coherencia(response):
+    """Extrae el porcentaje de coherencia desde la respuesta del modelo."""
+    return interpretar_evaluacion(response).coherencia
+
+def evaluar_coherencia_medica(datos_paciente_json, sintomas, respuestas_adicionales_json):
     """
-    Realiza la moderación genérica de OpenAI.
+    Evalúa la coherencia médica de la información del paciente.
+    Retorna un porcentaje de coherencia basado en la lógica de un experto médico, o None
+    si el LLM no está disponible.
     """
+    solicitud = solicitud_coherencia(datos_paciente_json, sintomas, respuestas_adicionales_json)
+    clave = _clave_cache("coherencia", solicitud["messages"][-1]["content"])
+    coherencia = _obtener_cache(clave)
+    if coherencia is None:
+        try:
+            response = gatewayLLM.chat(client, **solicitud)
+        except gatewayLLM.LLMNoDisponible as e:
+            print(f"Evaluación de coherencia médica no disponible: {e}")
+            return None
+        coherencia = interpretar_coherencia(response)
+        if coherencia >= UMBRAL_COHERENCIA:
+            _guardar_cache(clave, coherencia)
+    return coherencia
+
+async def evaluar_coherencia_medica_async(client_async, datos_paciente_json, sintomas, respuestas_adicionales_json):
+    """Versión asíncrona de `evaluar_coherencia_medica`, para usar con `openai.AsyncOpenAI`."""
+    solicitud = solicitud_coherencia(datos_paciente_json, sintomas, respuestas_adicionales_json)
+    clave = _clave_cache("coherencia", solicitud["messages"][-1]["content"])
+    coherencia = _obtener_cache(clave)
+    if coherencia is None:
+        try:
+            response = await gatewayLLM.chat_async(client_async, **solicitud)
+        except gatewayLLM.LLMNoDisponible as e:
+            print(f"Evaluación de coherencia médica no disponible: {e}")
+            return None
+        coherencia = interpretar_coherencia(response)
+        if coherencia >= UMBRAL_COHERENCIA:
+            _guardar_cache(clave, coherencia)
+    return coherencia
+
+def construir_mensaje_moderacion(datos_paciente_json, sintomas, respuestas_adicionales_json):
+    """Construye el texto que se envía al moderador genérico."""
     message = (
         f"Datos del paciente:\n"
         f"- Nombre: {datos_paciente_json.get('nombre', 'Desconocido')}\n"
@@ -84,16 +199,50 @@ def analisis_moderador_generico(client, datos_paciente_json, sintomas, respuesta
             ]
         )
         message += "Respuestas adicionales: " + respuestas_str
-    
-    response = client.moderations.create(
-        model="omni-moderation-latest",
-        input=message,
-    )
-    
+    return message
+
+def categorias_detectadas(response):
+    """Retorna las categorías marcadas por el moderador genérico."""
     result = response.results[0]
-    true_categories = [category for category, value in result.categories.dict().items() if value]
-    
-    return true_categories
+    return [category for category, value in result.categories.dict().items() if value]
+
+def analisis_moderador_generico(client, datos_paciente_json, sintomas, respuestas_adicionales_json):
+    """
+    Realiza la moderación genérica de OpenAI. Retorna las categorías detectadas, o
+    [MODERACION_NO_DISPONIBLE] si el moderador no está disponible.
+    """
+    mensaje = construir_mensaje_moderacion(datos_paciente_json, sintomas, respuestas_adicionales_json)
+    clave = _clave_cache("generica", mensaje)
+    if _obtener_cache(clave) is not None:
+        return []
+    try:
+        response = gatewayLLM.moderacion(client, model="omni-moderation-latest", input=mensaje)
+    except gatewayLLM.LLMNoDisponible as e:
+        # Falla cerrada: la consulta no se aprueba sin moderar
+        print(f"Moderador genérico no disponible: {e}")
+        return [MODERACION_NO_DISPONIBLE]
+    categorias = categorias_detectadas(response)
+    if not categorias:
+        _guardar_cache(clave, True)
+    return categorias
+
+async def analisis_moderador_generico_async(client_async, datos_paciente_json, sintomas, respuestas_adicionales_json):
+    """Versión asíncrona de `analisis_moderador_generico`, para usar con `openai.AsyncOpenAI`."""
+    mensaje = construir_mensaje_moderacion(datos_paciente_json, sintomas, respuestas_adicionales_json)
+    clave = _clave_cache("generica", mensaje)
+    if _obtener_cache(clave) is not None:
+        return []
+    try:
+        response = await gatewayLLM.moderacion_async(
+            client_async, model="omni-moderation-latest", input=mensaje
+        )
+    except gatewayLLM.LLMNoDisponible as e:
+        print(f"Moderador genérico no disponible: {e}")
+        return [MODERACION_NO_DISPONIBLE]
+    categorias = categorias_detectadas(response)
+    if not categorias:
+        _guardar_cache(clave, True)
+    return categorias
 
 def moderacion_pasada_web(client, datos_paciente_json, sintomas, respuestas_adicionales_json):
     """
@@ -102,15 +251,34 @@ def moderacion_pasada_web(client, datos_paciente_json, sintomas, respuestas_adic
     """
     true_categories = analisis_moderador_generico(client, datos_paciente_json, sintomas, respuestas_adicionales_json)
     
+    return decision_moderacion(
+        true_categories,
+        lambda: evaluar_coherencia_medica(datos_paciente_json, sintomas, respuestas_adicionales_json)
+    )
+
+def decision_moderacion(true_categories, obtener_coherencia):
+    """
+    Combina el resultado del moderador genérico con la coherencia médica.
+    `obtener_coherencia` es una función que sólo se invoca si el moderador genérico no
+    detectó categorías, para que el flujo secuencial y el paralelo decidan igual; si retorna
+    None (coherencia no disponible), la consulta se rechaza con MODERACION_NO_DISPONIBLE.
+    Devuelve una tupla (paso_moderacion, true_categories).
+    """
     if true_categories:
         return False, true_categories
     
-    coherencia = evaluar_coherencia_medica(datos_paciente_json, sintomas, respuestas_adicionales_json)
-    if coherencia >= 70:
+    coherencia = obtener_coherencia()
+    if coherencia is None:
+        return False, [MODERACION_NO_DISPONIBLE]
+    if coherencia >= UMBRAL_COHERENCIA:
         return True, []  # Se considera coherente
     else:
         return False, ["Incoherencia Médica: Soy un especialista médico y no puedo orientarte sin información consistente."]
 
+def moderacion_no_disponible(true_categories):
+    """Indica si la consulta se rechazó porque la moderación no estaba disponible (no por su contenido)."""
+    return MODERACION_NO_DISPONIBLE in (true_categories or [])
+
 # Datos de prueba para validación
 if __name__ == "__main__":
     datos_paciente_json = {"nombre": "Juan Perez", "edad": 35, "sexo": "Masculino", "peso": 70}
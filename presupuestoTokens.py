@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Este módulo lleva la cuenta de tokens de los prompts del asistente y del supervisor médico,
+y los ajusta a un presupuesto por etapa.
+
+Cada prompt se arma con secciones (síntomas, respuestas adicionales, base de conocimiento,
+recomendación del asistente...). Si el prompt excede el presupuesto de su etapa, se compactan
+(si la sección tiene una función de compactación) o recortan primero las secciones de menor
+valor, en el orden de prioridad indicado, hasta que quepa.
+Los tokens de cada sección se registran en el log en cada consulta.
+
+Los tokens se cuentan con el tokenizador local de `tiktoken` (codificación del modelo); si no
+está instalado o la codificación no se puede cargar, se estima con ~4 caracteres por token.
+
+Variables de entorno opcionales:
+  - PRESUPUESTO_PROMPT_ASISTENTE: tokens máximos del prompt del asistente médico.
+  - PRESUPUESTO_PROMPT_SUPERVISOR: tokens máximos del prompt del supervisor médico.
+"""
+
+import logging
+import os
+import threading
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+CODIFICACION = "o200k_base"
+"""Codificación de tiktoken de gpt-4o y gpt-4o-mini"""
+
+CARACTERES_POR_TOKEN = 4
+"""Caracteres por token de la estimación usada cuando no hay tokenizador"""
+
+PRESUPUESTO_PROMPT_ASISTENTE = int(os.environ.get("PRESUPUESTO_PROMPT_ASISTENTE", "1500"))
+"""Tokens máximos del prompt del asistente médico"""
+
+PRESUPUESTO_PROMPT_SUPERVISOR = int(os.environ.get("PRESUPUESTO_PROMPT_SUPERVISOR", "2000"))
+"""Tokens máximos del prompt del supervisor médico"""
+
+MINIMO_TOKENS_SECCION = 40
+"""Tokens que se conservan como mínimo de una sección recortada"""
+
+MARCA_RECORTE = " […]"
+"""Texto agregado al final de una sección recortada"""
+
+logger = logging.getLogger(__name__)
+
+_codificador = None
+_codificador_cargado = False
+_codificador_lock = threading.Lock()
+
+
+def _obtener_codificador():
+    """Retorna el codificador de tiktoken, o None si no está disponible (se intenta una vez)."""
+    global _codificador, _codificador_cargado
+    if not _codificador_cargado:
+        with _codificador_lock:
+            if not _codificador_cargado:
+                try:
+                    import tiktoken
+
+                    _codificador = tiktoken.get_encoding(CODIFICACION)
+                except Exception as e:
+                    # Sin tiktoken o sin la codificación en caché (la primera carga la descarga)
+                    logger.warning(f"Tokenizador no disponible, se estiman los tokens: {e}")
+                    _codificador = None
+                _codificador_cargado = True
+    return _codificador
+
+
+def contar_tokens(texto):
+    """Cantidad de tokens del texto."""
+    if not texto:
+        return 0
+    codificador = _obtener_codificador()
+    if codificador is None:
+        return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+def recortar_tokens(texto, max_tokens):
+    """Recorta el texto a `max_tokens` tokens como máximo, agregando MARCA_RECORTE si se recortó."""
+    if max_tokens <= 0:
+        return ""
+    if contar_tokens(texto) <= max_tokens:
+        return texto
+    # Se reserva espacio para la marca de recorte
+    max_tokens = max(max_tokens - contar_tokens(MARCA_RECORTE), 0)
+    codificador = _obtener_codificador()
+    if codificador is None:
+        recortado = texto[: max_tokens * CARACTERES_POR_TOKEN]
+    else:
+        recortado = codificador.decode(codificador.encode(texto, disallowed_special=())[:max_tokens])
+    return recortado.rstrip() + MARCA_RECORTE
+
+
+def ajustar_secciones(etapa, plantilla, secciones, prioridad_recorte, presupuesto, compactadores=None):
+    """
+    Ajusta las secciones del prompt al presupuesto de tokens de la etapa.
+
+    - plantilla: texto fijo del prompt (sin las secciones), contado como costo fijo.
+    - secciones: {nombre: texto} de las secciones variables.
+    - prioridad_recorte: nombres de las secciones que se pueden recortar, de menor a mayor valor.
+    - presupuesto: tokens máximos del prompt completo.
+    - compactadores: {nombre: función(texto) -> texto} que resumen una sección antes de recortarla.
+
+    Retorna un nuevo diccionario de secciones. Registra en el log los tokens de cada sección.
+    """
+    tokens_fijos = contar_tokens(plantilla)
+    tokens = {nombre: contar_tokens(texto) for nombre, texto in secciones.items()}
+    total_original = tokens_fijos + sum(tokens.values())
+
+    ajustadas = dict(secciones)
+    recortadas = []
+    exceso = total_original - presupuesto
+    for nombre in prioridad_recorte:
+        if exceso > 0 and nombre in (compactadores or {}):
+            ajustadas[nombre] = compactadores[nombre](ajustadas[nombre])
+            nuevos = contar_tokens(ajustadas[nombre])
+            exceso -= tokens[nombre] - nuevos
+            tokens[nombre] = nuevos
+            recortadas.append(f"{nombre} (compactada)")
+        if exceso <= 0:
+            break
+        disponibles = tokens.get(nombre, 0) - MINIMO_TOKENS_SECCION
+        if disponibles <= 0:
+            continue
+        maximo = tokens[nombre] - min(exceso, disponibles)
+        ajustadas[nombre] = recortar_tokens(ajustadas[nombre], maximo)
+        nuevos = contar_tokens(ajustadas[nombre])
+        exceso -= tokens[nombre] - nuevos
+        tokens[nombre] = nuevos
+        recortadas.append(nombre)
+
+    total = tokens_fijos + sum(tokens.values())
+    detalle = ", ".join(f"{nombre}={cantidad}" for nombre, cantidad in tokens.items())
+    logger.info(
+        f"Tokens prompt {etapa}: {total}/{presupuesto} (original {total_original}; "
+        f"fijos={tokens_fijos}, {detalle})"
+        + (f"; recortadas: {', '.join(recortadas)}" if recortadas else "")
+    )
+    if exceso > 0:
+        logger.warning(f"El prompt {etapa} excede el presupuesto en {exceso} tokens tras recortar.")
+    return ajustadas
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Este módulo guarda el resultado de cada consulta terminada, para que recargar `/resultado`
+(o reabrir `/resultado/eventos`) lo muestre sin volver a ejecutar la moderación, la búsqueda,
+el asistente, el supervisor ni la generación de la orden médica.
+
+El resultado se identifica con un id determinista de la consulta (hash de los datos del
+paciente, los síntomas y las respuestas), se guarda en Redis (o en memoria del proceso si
+Redis no está disponible) con expiración y en la forma compacta de `sesionServidor`.
+Las solicitudes simultáneas de la misma consulta (doble envío, recargas) se serializan con
+un bloqueo por consulta: la primera la ejecuta y las demás muestran su resultado.
+
+Variables de entorno opcionales:
+  - RESULTADOS_TTL: segundos que se guarda el resultado de una consulta.
+  - RESULTADOS_ESPERA_BLOQUEO: segundos máximos de espera por una consulta en curso.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from redis.exceptions import LockError, RedisError
+
+import conexionRedis
+from cacheMemoria import CacheMemoria
+from sesionServidor import deserializar, serializar
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+RESULTADOS_TTL = int(os.environ.get("RESULTADOS_TTL", "3600"))
+"""Segundos que se guarda el resultado de una consulta"""
+
+RESULTADOS_ESPERA_BLOQUEO = float(os.environ.get("RESULTADOS_ESPERA_BLOQUEO", "120"))
+"""Segundos máximos de espera por una consulta en curso (también expiración del bloqueo en Redis)"""
+
+RESULTADOS_MEMORIA_MAX = 2048
+"""Cantidad máxima de resultados en memoria por proceso (respaldo sin Redis)"""
+
+VERSION_RESULTADO = 2
+"""Versión de la forma del resultado; cambiarla invalida los resultados guardados"""
+
+PREFIJO_REDIS = "resultado:"
+PREFIJO_BLOQUEO = "resultado_bloqueo:"
+
+logger = logging.getLogger(__name__)
+
+_memoria = CacheMemoria(max_items=RESULTADOS_MEMORIA_MAX, ttl=RESULTADOS_TTL)
+
+# Bloqueos del proceso por consulta: {id: [lock, usuarios]}
+_bloqueos = {}
+_bloqueos_lock = threading.Lock()
+
+
+def id_consulta(datos, sintomas, respuestas):
+    """Id determinista de la consulta: misma entrada, mismo id."""
+    contenido = json.dumps(
+        [VERSION_RESULTADO, datos, sintomas, respuestas],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:32]
+
+
+def obtener(consulta_id):
+    """Retorna el resultado guardado de la consulta (dict), o None si no existe o expiró."""
+    contenido = None
+    redis_client = conexionRedis.obtener_cliente()
+    if redis_client is not None:
+        try:
+            contenido = redis_client.get(PREFIJO_REDIS + consulta_id)
+            conexionRedis.registrar_exito()
+        except RedisError as e:
+            conexionRedis.registrar_fallo(e)
+    if contenido is None:
+        contenido = _memoria.obtener(consulta_id)
+    return deserializar(contenido) if contenido is not None else None
+
+
+def guardar(consulta_id, resultado):
+    """Guarda el resultado de la consulta con expiración RESULTADOS_TTL."""
+    contenido = serializar(resultado)
+    redis_client = conexionRedis.obtener_cliente()
+    if redis_client is not None:
+        try:
+            redis_client.set(PREFIJO_REDIS + consulta_id, contenido, ex=RESULTADOS_TTL)
+            conexionRedis.registrar_exito()
+            return
+        except RedisError as e:
+            conexionRedis.registrar_fallo(e)
+    _memoria.guardar(consulta_id, contenido)
+
+
+def _tomar_bloqueo_local(consulta_id, espera):
+    with _bloqueos_lock:
+        entrada = _bloqueos.setdefault(consulta_id, [threading.Lock(), 0])
+        entrada[1] += 1
+    if entrada[0].acquire(timeout=espera):
+        return True
+    _soltar_bloqueo_local(consulta_id, liberar=False)
+    return False
+
+
+def _soltar_bloqueo_local(consulta_id, liberar=True):
+    with _bloqueos_lock:
+        entrada = _bloqueos[consulta_id]
+        if liberar:
+            entrada[0].release()
+        entrada[1] -= 1
+        if entrada[1] == 0:
+            del _bloqueos[consulta_id]
+
+
+@contextmanager
+def bloqueo(consulta_id, espera=RESULTADOS_ESPERA_BLOQUEO):
+    """
+    Bloqueo exclusivo de la consulta, entre hilos del proceso y (con Redis) entre procesos.
+    Lanza `TimeoutError` si no se obtiene dentro de `espera` segundos. Si Redis no está
+    disponible, sólo se bloquea dentro del proceso.
+    """
+    if not _tomar_bloqueo_local(consulta_id, espera):
+        raise TimeoutError(f"La consulta {consulta_id} sigue en curso.")
+    try:
+        bloqueo_redis = None
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                bloqueo_redis = redis_client.lock(
+                    PREFIJO_BLOQUEO + consulta_id, timeout=espera, blocking_timeout=espera
+                )
+                obtenido = bloqueo_redis.acquire()
+                conexionRedis.registrar_exito()
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+                bloqueo_redis = None
+            else:
+                if not obtenido:
+                    raise TimeoutError(f"La consulta {consulta_id} sigue en curso.")
+        try:
+            yield
+        finally:
+            if bloqueo_redis is not None:
+                try:
+                    bloqueo_redis.release()
+                except (LockError, RedisError) as e:
+                    # El bloqueo expiró o Redis cayó: igual expira por sí solo
+                    logger.warning(f"No se pudo liberar el bloqueo de la consulta {consulta_id}: {e}")
+    finally:
+        _soltar_bloqueo_local(consulta_id)
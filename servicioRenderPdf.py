@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""
+Este módulo diagrama, opcionalmente, las órdenes médicas en PDF en un pool de procesos, para
+aprovechar varios núcleos: la diagramación es CPU pura y, en hilos, queda serializada por el GIL.
+
+Por defecto el pool está desactivado y la orden se diagrama en el hilo de la cola: con el
+esqueleto cacheado una orden cuesta unos 4 ms y enviarla a otro proceso (pickle de la orden y
+del PDF por el pipe) cuesta más que diagramarla. En un núcleo, `benchmarks/renderOrdenPdf.py`
+midió 151 órdenes/s con 2 hilos frente a 48,6 órdenes/s con 2 procesos. El pool conviene
+sólo con varios núcleos libres y un volumen de órdenes que sature un núcleo; activarlo con
+RENDER_PROCESOS después de medir en el equipo de destino.
+
+La cola de órdenes (`colaOrdenes`) resuelve primero los códigos de prestación en sus hilos
+(llamadas al LLM, E/S) y entrega aquí la orden ya preparada (`generacionOrdenMedica.preparar_orden`),
+que sólo contiene datos serializables. Con el almacenamiento en disco, cada proceso escribe el
+PDF en un archivo temporal de su directorio y retorna únicamente su ruta: los bytes no viajan
+de vuelta por el pipe del pool y el archivo se renombra a su lugar sin copiarse. Con los
+almacenamientos en memoria o Redis no se escribe ningún archivo: el PDF se diagrama en memoria
+y sus bytes vuelven por el pipe.
+
+Los procesos se crean al iniciar el servidor (`iniciar`, desde `main.py --runserver` y desde
+el ciclo de vida de `servidorAsgi`) y reciben el esqueleto del PDF ya construido, de modo que
+la primera orden no paga el arranque. Si el pool se rompe (un proceso terminó de forma
+abrupta), se recrea y la orden en curso se diagrama en el propio hilo.
+
+Los procesos se inician por defecto con forkserver (o spawn donde no existe): el servidor web
+ya tiene hilos (solicitudes, cola de órdenes, event loop) y hacer fork de un proceso con hilos
+puede dejar bloqueos tomados en el hijo. Con forkserver, un proceso servidor limpio importa
+una sola vez los módulos de diagramación y de él se crean los procesos del pool. Los procesos
+no importan el módulo principal (`main.py`): su arranque (configuración, aplicación Flask,
+precarga de la base de conocimiento) no se repite en cada uno.
+
+Variables de entorno opcionales:
+  - RENDER_PROCESOS: procesos del pool (por defecto 0: se diagrama en los hilos de la cola).
+  - RENDER_CONTEXTO: método de inicio de los procesos: forkserver (por defecto donde existe),
+    spawn o fork. Usar fork sólo si el pool se crea antes de iniciar cualquier hilo.
+"""
+
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import types
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import generacionOrdenMedica
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+RENDER_PROCESOS = int(os.environ.get("RENDER_PROCESOS", "0"))
+"""Procesos que diagraman órdenes en paralelo (0, por defecto, desactiva el pool)"""
+
+RENDER_CONTEXTO = os.environ.get(
+    "RENDER_CONTEXTO", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+).lower()
+"""Método de inicio de los procesos del pool"""
+
+EXTENSION_TEMPORAL = ".tmp"
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ----------------------------
+# Procesos del pool
+# ----------------------------
+def _inicializar_proceso(plantilla):
+    """Calienta el proceso con el esqueleto del PDF construido en el proceso principal."""
+    generacionOrdenMedica.usar_plantilla(plantilla)
+
+
+def _preparado():
+    return os.getpid()
+
+
+def _renderizar(orden, directorio):
+    """
+    Diagrama la orden en memoria. Sin `directorio` retorna los bytes del PDF; si no, los
+    escribe en un temporal de `directorio` y retorna su ruta.
+    """
+    contenido = generacionOrdenMedica.renderizar_orden(orden)
+    if directorio is None:
+        return contenido
+    descriptor, ruta = tempfile.mkstemp(dir=directorio, suffix=EXTENSION_TEMPORAL)
+    try:
+        with os.fdopen(descriptor, "wb") as archivo:
+            archivo.write(contenido)
+    except BaseException:
+        os.unlink(ruta)
+        raise
+    return ruta
+
+
+# ----------------------------
+# Pool
+# ----------------------------
+def activo():
+    """Indica si las órdenes se diagraman en el pool de procesos."""
+    return RENDER_PROCESOS > 0
+
+
+@contextmanager
+def _sin_modulo_principal():
+    """
+    Oculta el módulo principal mientras se inician los procesos: con spawn y forkserver,
+    multiprocessing haría que cada proceso importe de nuevo el script de entrada.
+    """
+    principal = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = principal
+
+
+def _crear_pool():
+    contexto = multiprocessing.get_context(RENDER_CONTEXTO)
+    if RENDER_CONTEXTO == "forkserver":
+        # El servidor importa una vez sólo los módulos de diagramación; los procesos los heredan.
+        # No se precarga __main__: reimportar main.py ejecutaría el arranque de la aplicación
+        contexto.set_forkserver_preload([__name__, generacionOrdenMedica.__name__])
+    # El esqueleto viaja construido: los procesos no vuelven a decodificar el logo
+    pool = ProcessPoolExecutor(
+        max_workers=RENDER_PROCESOS,
+        mp_context=contexto,
+        initializer=_inicializar_proceso,
+        initargs=(generacionOrdenMedica.obtener_plantilla(),),
+    )
+    # Una tarea por proceso para que todos arranquen (y se calienten) ahora; los procesos se
+    # inician al encolarlas
+    with _sin_modulo_principal():
+        futuros = [pool.submit(_preparado) for _ in range(RENDER_PROCESOS)]
+    pids = {futuro.result() for futuro in futuros}
+    logger.info(f"Pool de diagramación de PDF: {RENDER_PROCESOS} procesos ({RENDER_CONTEXTO}), {len(pids)} listos.")
+    return pool
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _crear_pool()
+    return _pool
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iniciar():
+    """
+    Crea y calienta el pool; llamar al iniciar el servidor (o cada worker), antes de atender
+    solicitudes. Si no se llama, el pool se crea con la primera orden.
+    """
+    if activo():
+        _obtener_pool()
+
+
+def renderizar(orden, directorio=None):
+    """
+    Diagrama la orden preparada en el pool. Retorna la ruta del PDF escrito en `directorio`
+    (el llamador se hace cargo del archivo) o, sin `directorio`, los bytes del PDF.
+    Sin pool, o si éste se rompe, diagrama en el hilo actual.
+    """
+    if not activo():
+        return _renderizar(orden, directorio)
+    pool = _obtener_pool()
+    try:
+        return pool.submit(_renderizar, orden, directorio).result()
+    except BrokenProcessPool as e:
+        logger.error(f"Pool de diagramación de PDF roto, se recreará: {e}")
+        _descartar_pool(pool)
+        return _renderizar(orden, directorio)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""
+Este módulo expone la aplicación Flask como aplicación ASGI, para el modo de servidor asíncrono.
+
+En este modo, `/resultado` ejecuta el flujo de consulta con `flujoConsulta.ejecutar_consulta_async`
+en el event loop de larga vida del worker (`bucleEventos`): las llamadas a OpenAI y Redis de
+todas las consultas en curso se ejecutan como corrutinas en ese único loop, compartiendo un
+cliente `AsyncOpenAI` y un pool `redis.asyncio`, que se cierran al apagar el worker.
+
+Flask sigue siendo una aplicación WSGI: cada solicitud ocupa un hilo del pool propio
+(ASYNC_MAX_SOLICITUDES) mientras espera el resultado de su corrutina. Ese hilo sólo espera;
+las conexiones hacia OpenAI y Redis son las del loop, acotadas por sus pools, y no crecen con
+la cantidad de solicitudes en curso.
+
+Ejecución (equivalente a `python main.py --runserver --async --workers 4`):
+    uvicorn servidorAsgi:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import bucleEventos
+import main
+import servicioRenderPdf
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+ASYNC_MAX_SOLICITUDES = int(os.environ.get("ASYNC_MAX_SOLICITUDES", "512"))
+"""Cantidad máxima de solicitudes atendidas en paralelo por cada worker"""
+
+_executor = ThreadPoolExecutor(
+    max_workers=ASYNC_MAX_SOLICITUDES, thread_name_prefix="asgi"
+)
+
+# Función original (síncrona) que ejecuta la aplicación WSGI para una solicitud
+_run_wsgi_app = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+
+
+class _InstanciaWsgi(WsgiToAsgiInstance):
+    """
+    Instancia por solicitud que ejecuta Flask en el pool propio de hilos, en lugar del
+    hilo único que `asgiref` usa por defecto, para atender solicitudes en paralelo.
+    """
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=_executor)(
+            self, body
+        )
+
+
+class AplicacionAsgi(WsgiToAsgi):
+    """Adaptador ASGI de la aplicación Flask."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            # Flask no maneja eventos de ciclo de vida: al iniciar se crean el pool de
+            # diagramación y el event loop del flujo; al apagar se cierran sus clientes
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    servicioRenderPdf.iniciar()
+                    bucleEventos.obtener_loop()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await asyncio.to_thread(bucleEventos.detener)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        await _InstanciaWsgi(self.wsgi_application, self.duplicate_header_limit)(
+            scope, receive, send
+        )
+
+
+main.app.config["MODO_ASYNC"] = True
+app = AplicacionAsgi(main.app)
+
+
+def ejecutar(host, port, workers=1, debug=False):
+    """Inicia el servidor ASGI (uvicorn) con la cantidad de workers indicada."""
+    import uvicorn
+
+    uvicorn.run(
+        "servidorAsgi:app",
+        host=host,
+        port=port,
+        workers=workers,
+        log_level="debug" if debug else "info",
+    )
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""
+Este módulo contiene la sesión de Flask almacenada en el servidor.
+
+La cookie de sesión sólo lleva un identificador opaco y aleatorio; los datos de la consulta
+(datos del paciente, síntomas, preguntas, respuestas y resultados intermedios) se guardan en
+Redis, compartidos entre workers, o en memoria del proceso para un solo nodo. Así cada
+solicitud no serializa, firma ni transmite el estado completo, y éste no queda limitado por
+el tamaño máximo de una cookie.
+
+Los datos se guardan como JSON compacto, comprimido con zlib cuando supera
+SESION_COMPRIMIR_DESDE bytes, y expiran tras `PERMANENT_SESSION_LIFETIME` sin actividad.
+Si Redis no está disponible, la sesión se guarda en memoria del proceso mientras dure la caída.
+
+Variables de entorno opcionales:
+  - SESION_BACKEND: 'redis' (por defecto), 'memoria' o 'cookie' (sesión firmada de Flask).
+  - SESION_MEMORIA_MAX: cantidad máxima de sesiones en memoria por proceso.
+"""
+
+import json
+import logging
+import os
+import re
+import secrets
+import zlib
+
+from flask.sessions import SessionInterface, SessionMixin
+from redis.exceptions import RedisError
+from werkzeug.datastructures import CallbackDict
+
+import conexionRedis
+from cacheMemoria import CacheMemoria
+
+# ----------------------------
+# Constantes y configuración
+# ----------------------------
+SESION_BACKEND = os.environ.get("SESION_BACKEND", "redis").lower()
+"""Almacenamiento de la sesión: 'redis', 'memoria' o 'cookie'"""
+
+BACKENDS = ("redis", "memoria", "cookie")
+
+SESION_MEMORIA_MAX = int(os.environ.get("SESION_MEMORIA_MAX", "10000"))
+"""Cantidad máxima de sesiones en memoria por proceso"""
+
+SESION_COMPRIMIR_DESDE = 1024
+"""Bytes de JSON a partir de los cuales los datos de la sesión se comprimen"""
+
+PREFIJO_REDIS = "sesion:"
+"""Prefijo de las claves de sesión en Redis"""
+
+FORMATO_JSON = b"j"
+FORMATO_ZLIB = b"z"
+
+PATRON_ID = re.compile(r"^[A-Za-z0-9_-]{43}$")
+"""Formato de los identificadores de sesión (32 bytes aleatorios en base64 url)"""
+
+logger = logging.getLogger(__name__)
+
+
+def nuevo_id():
+    """Identificador de sesión aleatorio (no predecible)."""
+    return secrets.token_urlsafe(32)
+
+
+def serializar(datos):
+    """Serializa los datos de la sesión como JSON compacto, comprimido si es grande."""
+    contenido = json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(contenido) >= SESION_COMPRIMIR_DESDE:
+        return FORMATO_ZLIB + zlib.compress(contenido)
+    return FORMATO_JSON + contenido
+
+
+def deserializar(contenido):
+    """Inverso de `serializar`. Retorna None si el contenido no es válido."""
+    try:
+        formato, cuerpo = contenido[:1], contenido[1:]
+        if formato == FORMATO_ZLIB:
+            cuerpo = zlib.decompress(cuerpo)
+        elif formato != FORMATO_JSON:
+            return None
+        return json.loads(cuerpo)
+    except (zlib.error, ValueError, TypeError) as e:
+        logger.warning(f"Sesión no válida en el almacenamiento: {e}")
+        return None
+
+
+# ----------------------------
+# Almacenamiento de sesiones
+# ----------------------------
+class AlmacenSesionesMemoria:
+    """Sesiones en memoria del proceso (un solo nodo), descartando las menos usadas al llenarse."""
+
+    def __init__(self, max_items=SESION_MEMORIA_MAX):
+        self._cache = CacheMemoria(max_items=max_items)
+
+    def obtener(self, sid):
+        return self._cache.obtener(sid)
+
+    def guardar(self, sid, contenido, ttl):
+        self._cache.guardar(sid, contenido, ttl=ttl)
+
+    def renovar(self, sid, ttl):
+        contenido = self._cache.obtener(sid)
+        if contenido is not None:
+            self._cache.guardar(sid, contenido, ttl=ttl)
+
+    def eliminar(self, sid):
+        self._cache.eliminar(sid)
+
+
+class AlmacenSesionesRedis:
+    """
+    Sesiones en Redis (`<PREFIJO_REDIS><id>` con expiración), compartidas entre workers.
+    Mientras Redis no está disponible se usa un almacenamiento en memoria de respaldo.
+    """
+
+    def __init__(self):
+        self._respaldo = AlmacenSesionesMemoria()
+
+    def obtener(self, sid):
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                contenido = redis_client.get(PREFIJO_REDIS + sid)
+                conexionRedis.registrar_exito()
+                if contenido is not None:
+                    return contenido
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+        return self._respaldo.obtener(sid)
+
+    def guardar(self, sid, contenido, ttl):
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                redis_client.set(PREFIJO_REDIS + sid, contenido, ex=ttl)
+                conexionRedis.registrar_exito()
+                return
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+        self._respaldo.guardar(sid, contenido, ttl)
+
+    def renovar(self, sid, ttl):
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                if redis_client.expire(PREFIJO_REDIS + sid, ttl):
+                    conexionRedis.registrar_exito()
+                    return
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+        self._respaldo.renovar(sid, ttl)
+
+    def eliminar(self, sid):
+        redis_client = conexionRedis.obtener_cliente()
+        if redis_client is not None:
+            try:
+                redis_client.delete(PREFIJO_REDIS + sid)
+                conexionRedis.registrar_exito()
+            except RedisError as e:
+                conexionRedis.registrar_fallo(e)
+        self._respaldo.eliminar(sid)
+
+
+# ----------------------------
+# Interfaz de sesión de Flask
+# ----------------------------
+class SesionServidor(CallbackDict, SessionMixin):
+    """Sesión de Flask cuyos datos viven en el servidor; `sid` es el identificador de la cookie."""
+
+    def __init__(self, datos=None, sid=None, nueva=False):
+        def al_modificar(sesion):
+            sesion.modified = True
+
+        super().__init__(datos, al_modificar)
+        self.sid = sid or nuevo_id()
+        self.new = nueva
+        self.modified = False
+
+
+class InterfazSesionServidor(SessionInterface):
+    """`SessionInterface` que guarda los datos en `almacen` y sólo el identificador en la cookie."""
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and PATRON_ID.match(sid):
+            contenido = self.almacen.obtener(sid)
+            datos = deserializar(contenido) if contenido is not None else None
+            if datos is not None:
+                return SesionServidor(datos, sid)
+        # Sin cookie, con un identificador inválido o expirado: nueva sesión con nuevo id
+        return SesionServidor(nueva=True)
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified:
+                self.almacen.eliminar(session.sid)
+                response.delete_cookie(
+                    nombre, domain=dominio, path=ruta, secure=secure, samesite=samesite, httponly=httponly
+                )
+            return
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        if session.modified:
+            contenido = serializar(dict(session))
+            logger.debug(f"Sesión guardada: {len(contenido)} bytes.")
+            self.almacen.guardar(session.sid, contenido, ttl)
+        elif session.accessed or self.should_set_cookie(app, session):
+            # Toda solicitud que lee la sesión renueva su expiración (también las no permanentes,
+            # cuya cookie no se reenvía): los datos expiran tras la última actividad, no la última escritura
+            self.almacen.renovar(session.sid, ttl)
+
+        if session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(
+                nombre,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=dominio,
+                path=ruta,
+                secure=secure,
+                samesite=samesite,
+            )
+
+
+def crear_almacen(backend=SESION_BACKEND):
+    """Retorna el almacenamiento de sesiones del backend ('redis' o 'memoria')."""
+    if backend == "redis":
+        return AlmacenSesionesRedis()
+    if backend == "memoria":
+        return AlmacenSesionesMemoria()
+    raise ValueError(f"Backend de sesión desconocido: '{backend}'. Opciones: {', '.join(BACKENDS)}.")
+
+
+def instalar(app, backend=SESION_BACKEND):
+    """Configura la sesión de `app` en el servidor; con 'cookie' se mantiene la sesión de Flask."""
+    if backend == "cookie":
+        return
+    app.session_interface = InterfazSesionServidor(crear_almacen(backend))
+    logger.info(f"Sesiones almacenadas en el servidor ({backend}).")
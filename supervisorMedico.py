@@ -5,6 +5,19 @@
 # Librerías a importar
 import logging
 import json  # Si los datos provienen de un JSON
+import re
+
+import gatewayLLM
+import presupuestoTokens
+from modelosRespuesta import (
+    EvaluacionSupervisor,
+    RecomendacionMedica,
+    SALIDA_ESTRUCTURADA,
+    cargar_json,
+    extraer_json,
+    formato_respuesta,
+    validar_respuesta,
+)
 
 # Configuración del logging para depuración
 logging.basicConfig(level=logging.INFO)
@@ -42,10 +55,49 @@ En caso contrario, debes recomendar acudir a un médico para una evaluación pre
 Nota: La información proporcionada es solo de orientación y no sustituye una consulta médica presencial.
 """
 
-def revision_recomendacion_medica(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento, respuesta_asistente_medico_json):
-    """Evalúa la recomendación médica utilizando los datos y respuestas proporcionadas previamente y genera la respuesta final"""
-    print("################ EVALUACION SUPERVISOR MEDICO################\n")
-    
+RESPUESTA_DEGRADADA = json.dumps(
+    {
+        "nivel_de_certeza": 0,
+        "sintesis_antecedentes": "",
+        "diagnostico_o_recomendacion": "La revisión médica no está disponible en este momento. Acuda a un centro asistencial para una evaluación presencial.",
+        "recomendaciones_adicionales": "",
+    },
+    ensure_ascii=False,
+)
+"""Revisión entregada cuando el LLM no está disponible: certeza 0, sin orden médica"""
+
+SECCIONES_OMITIBLES_RECOMENDACION = ("Análisis de Síntomas y Factores del Paciente",)
+"""Secciones de la recomendación que repiten datos del paciente y se omiten al compactarla"""
+
+
+def compactar_recomendacion(recomendacion):
+    """
+    Omite de la recomendación del asistente las secciones que sólo repiten los datos del
+    paciente (ya incluidos en el prompt), conservando diagnósticos, exámenes y conclusión.
+    Acepta tanto el formato markdown como el JSON de la salida estructurada.
+    """
+    if recomendacion.lstrip().startswith("{"):
+        estructurada = validar_respuesta(RecomendacionMedica, recomendacion)
+        if estructurada is not None:
+            return estructurada.model_dump_json(exclude={"analisis"})
+
+    bloques = re.split(r"(?m)^(?=#{2,}\s)", recomendacion)
+    conservados = [
+        bloque for bloque in bloques
+        if not any(
+            bloque.lstrip("# ").lower().startswith(seccion.lower())
+            for seccion in SECCIONES_OMITIBLES_RECOMENDACION
+        )
+    ]
+    return "".join(conservados).strip()
+
+
+def construir_prompt_supervisor(datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento, respuesta_asistente_medico_json):
+    """
+    Construye el prompt del supervisor médico con los antecedentes de la consulta, ajustado al
+    presupuesto de tokens del supervisor. La base de conocimiento ya fue usada por el asistente,
+    por lo que se recorta primero; luego las respuestas y, por último, la recomendación.
+    """
     # Convertir los datos a diccionarios (si ya vienen en memoria, se asume que es un dict)
     datos_paciente = datos_paciente_json
     respuestas_adicionales = respuestas_adicionales_json
@@ -68,15 +120,64 @@ def revision_recomendacion_medica(client, datos_paciente_json, sintomas, respues
     base_conocimiento_texto = str(base_conocimiento) if base_conocimiento is not None else ''
 
     # Crear el prompt utilizando los datos del paciente, respuestas adicionales y base de conocimiento
-    prompt = prompt_supervisor_medico.format(
-        nombre=datos_paciente.get('nombre', 'Desconocido'),
-        edad=datos_paciente.get('edad', 'No especificado'),
-        sexo=datos_paciente.get('sexo', 'No especificado'),
-        peso=datos_paciente.get('peso', 'No especificado'),
-        sintomas=', '.join(sintomas),
-        respuestas=respuestas_texto,
-        base_conocimiento=base_conocimiento_texto,
-        recomendacion_ia=respuesta_asistente_medico if respuesta_asistente_medico else "No se genero una Recomendacion."
+    paciente = {
+        "nombre": datos_paciente.get('nombre', 'Desconocido'),
+        "edad": datos_paciente.get('edad', 'No especificado'),
+        "sexo": datos_paciente.get('sexo', 'No especificado'),
+        "peso": datos_paciente.get('peso', 'No especificado'),
+    }
+    secciones = presupuestoTokens.ajustar_secciones(
+        "supervisor",
+        prompt_supervisor_medico.format(
+            **paciente, sintomas="", respuestas="", base_conocimiento="", recomendacion_ia=""
+        ),
+        {
+            "sintomas": ', '.join(sintomas),
+            "respuestas": respuestas_texto,
+            "base_conocimiento": base_conocimiento_texto,
+            "recomendacion_ia": str(respuesta_asistente_medico) if respuesta_asistente_medico else "No se genero una Recomendacion.",
+        },
+        ("base_conocimiento", "respuestas", "recomendacion_ia"),
+        presupuestoTokens.PRESUPUESTO_PROMPT_SUPERVISOR,
+        compactadores={"recomendacion_ia": compactar_recomendacion},
+    )
+    return prompt_supervisor_medico.format(**paciente, **secciones)
+
+def parametros_salida():
+    """
+    Parámetros adicionales de la llamada: con salida estructurada, la respuesta se restringe
+    al esquema de `modelosRespuesta.EvaluacionSupervisor`.
+    """
+    if SALIDA_ESTRUCTURADA:
+        return {"response_format": formato_respuesta(EvaluacionSupervisor)}
+    return {}
+
+
+def interpretar_respuesta_supervisor(respuesta):
+    """
+    Extrae el nivel de certeza de la respuesta del supervisor. Con salida estructurada se valida
+    con `modelosRespuesta.EvaluacionSupervisor`; como respaldo (texto libre o respuestas
+    anteriores en caché) se lee el JSON, quitando los delimitadores markdown si existen.
+    Retorna la tupla (respuesta sin delimitadores, nivel_de_certeza); el nivel es 0 si no se pudo leer.
+    """
+    if SALIDA_ESTRUCTURADA and respuesta.lstrip().startswith("{"):
+        evaluacion = validar_respuesta(EvaluacionSupervisor, respuesta)
+        if evaluacion is not None:
+            return respuesta, evaluacion.nivel_de_certeza
+
+    datos = cargar_json(respuesta)
+    if not isinstance(datos, dict):
+        logging.error("No se pudo leer el JSON de la respuesta del supervisor médico.")
+        return respuesta, 0
+    return extraer_json(respuesta), datos.get("nivel_de_certeza", 0)
+
+
+def revision_recomendacion_medica(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento, respuesta_asistente_medico_json):
+    """Evalúa la recomendación médica utilizando los datos y respuestas proporcionadas previamente y genera la respuesta final"""
+    print("################ EVALUACION SUPERVISOR MEDICO################\n")
+    
+    prompt = construir_prompt_supervisor(
+        datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento, respuesta_asistente_medico_json
     )
 
     print("Prompt generado:")
@@ -85,7 +186,9 @@ def revision_recomendacion_medica(client, datos_paciente_json, sintomas, respues
     # Preparar los mensajes para enviar al modelo
     messages = [{"role": "system", "content": prompt}]
 
-    response = client.chat.completions.create(
+    response = gatewayLLM.chat(
+        client,
+        degradada=RESPUESTA_DEGRADADA,
         model="gpt-4o-mini",
         messages=messages,
         temperature=0,
@@ -93,7 +196,8 @@ def revision_recomendacion_medica(client, datos_paciente_json, sintomas, respues
         top_p=0.95,
         frequency_penalty=0,
         presence_penalty=0,
-        stop=None
+        stop=None,
+        **parametros_salida()
     )
 
     reply = response.choices[0].message.content
@@ -104,4 +208,29 @@ def revision_recomendacion_medica(client, datos_paciente_json, sintomas, respues
     except Exception:
         answer = 'Lo siento, no pude entender tu pregunta. ¿Podrías reformularla por favor?'
     
-    return answer
\ No newline at end of file
+    return answer
+
+async def revision_recomendacion_medica_async(client, datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento, respuesta_asistente_medico_json):
+    """Versión asíncrona de `revision_recomendacion_medica`, para usar con `openai.AsyncOpenAI`."""
+    prompt = construir_prompt_supervisor(
+        datos_paciente_json, sintomas, respuestas_adicionales_json, base_conocimiento, respuesta_asistente_medico_json
+    )
+    logging.debug("Prompt supervisor médico generado (async).")
+
+    messages = [{"role": "system", "content": prompt}]
+
+    response = await gatewayLLM.chat_async(
+        client,
+        degradada=RESPUESTA_DEGRADADA,
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0,
+        max_tokens=1000,
+        top_p=0.95,
+        frequency_penalty=0,
+        presence_penalty=0,
+        stop=None,
+        **parametros_salida()
+    )
+
+    return response.choices[0].message.content
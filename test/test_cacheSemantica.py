@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""
+Pruebas de la anonimización del nombre del paciente en `cacheSemantica`: el nombre se
+reemplaza sólo como palabra completa, de modo que al personalizar la respuesta para otro
+paciente no se alteren palabras que lo contienen.
+
+Ejecutar desde la raíz del repositorio:
+    python -m unittest discover -s test
+"""
+
+import os
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "clave-simulada")
+
+import cacheSemantica  # noqa: E402
+
+
+class PruebaAnonimizacion(unittest.TestCase):
+    def test_nombre_dentro_de_otra_palabra(self):
+        texto = "Ana: según la anamnesis, la Anamnesis previa y la Anatomía, Ana debe controlarse."
+        anonimo = cacheSemantica._anonimizar(texto, "Ana")
+        self.assertIn("Anamnesis", anonimo)
+        self.assertIn("Anatomía", anonimo)
+        self.assertEqual(
+            cacheSemantica._personalizar(anonimo, "Rosa"),
+            "Rosa: según la anamnesis, la Anamnesis previa y la Anatomía, Rosa debe controlarse.",
+        )
+
+    def test_nombre_completo_con_caracteres_especiales(self):
+        texto = "Paciente José Pérez (José Pérez.)"
+        anonimo = cacheSemantica._anonimizar(texto, " José Pérez ")
+        self.assertEqual(anonimo, f"Paciente {cacheSemantica.MARCADOR_NOMBRE} ({cacheSemantica.MARCADOR_NOMBRE}.)")
+
+    def test_nombre_vacio_o_corto_no_se_reemplaza(self):
+        texto = "El paciente refiere dolor lumbar."
+        self.assertEqual(cacheSemantica._anonimizar(texto, ""), texto)
+        self.assertEqual(cacheSemantica._anonimizar(texto, "   "), texto)
+        self.assertEqual(cacheSemantica._anonimizar(texto, "El"), texto)
+        self.assertEqual(cacheSemantica._anonimizar(texto, None), texto)
+
+
+if __name__ == "__main__":
+    unittest.main()
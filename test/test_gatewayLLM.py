@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Pruebas del interruptor de circuito de `gatewayLLM`: la llamada de prueba del estado
+semiabierto que termina sin éxito ni fallo (cancelada o rechazada por el limitador de tasa)
+no debe dejar el circuito tomado.
+
+Ejecutar desde la raíz del repositorio:
+    python -m unittest discover -s test
+"""
+
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "clave-simulada")
+
+import gatewayLLM  # noqa: E402
+
+
+def _circuito_semiabierto(modelo):
+    """Deja el circuito de `modelo` semiabierto: un fallo con umbral 1 y apertura 0."""
+    estado = gatewayLLM._estado(modelo)
+    estado.interruptor = gatewayLLM.InterruptorCircuito(umbral=1, apertura=0)
+    estado.interruptor.registrar_fallo()
+    return estado
+
+
+async def _respuesta_inmediata(timeout):
+    return "ok"
+
+
+class PruebaInterruptorCircuito(unittest.TestCase):
+    def test_prueba_cancelada_libera_el_circuito(self):
+        modelo = "modelo-prueba-cancelada"
+        estado = _circuito_semiabierto(modelo)
+
+        async def llamada_colgada(timeout):
+            await asyncio.sleep(60)
+
+        async def escenario():
+            tarea = asyncio.create_task(gatewayLLM._ejecutar_async("chat", modelo, llamada_colgada))
+            await asyncio.sleep(0.05)
+            tarea.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await tarea
+            # La siguiente llamada puede probar el circuito y, con éxito, lo cierra
+            return await gatewayLLM._ejecutar_async("chat", modelo, _respuesta_inmediata)
+
+        self.assertEqual(asyncio.run(escenario()), "ok")
+        self.assertEqual(estado.interruptor.estado, "cerrado")
+
+    def test_prueba_rechazada_por_tasa_libera_el_circuito(self):
+        modelo = "modelo-prueba-sin-cupo"
+        estado = _circuito_semiabierto(modelo)
+        limitador = estado.limitador
+        # Sin tokens y con una tasa que no repone ninguno dentro del plazo
+        estado.limitador = gatewayLLM.LimitadorTasa(tasa=0.001, capacidad=1)
+        estado.limitador.reservar(0)
+
+        with self.assertRaisesRegex(gatewayLLM.LLMNoDisponible, "Límite de tasa"):
+            gatewayLLM._ejecutar("chat", modelo, lambda timeout: "ok", deadline=1)
+
+        estado.limitador = limitador
+        self.assertEqual(gatewayLLM._ejecutar("chat", modelo, lambda timeout: "ok"), "ok")
+        self.assertEqual(estado.interruptor.estado, "cerrado")
+
+    def test_prueba_pendiente_rechaza_otras_llamadas(self):
+        interruptor = gatewayLLM.InterruptorCircuito(umbral=1, apertura=0)
+        interruptor.registrar_fallo()
+        turno = interruptor.permitir()
+        self.assertTrue(turno)
+        self.assertFalse(interruptor.permitir())
+        # Liberar un turno ajeno no suelta la prueba en curso
+        interruptor.liberar_prueba(object())
+        self.assertFalse(interruptor.permitir())
+        interruptor.liberar_prueba(turno)
+        self.assertTrue(interruptor.permitir())
+
+
+if __name__ == "__main__":
+    unittest.main()